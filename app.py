@@ -1,20 +1,41 @@
 import os
 import time
-import threading
-from ucvl.zero3.mqtt import MQTTClient
-import wiringpi
+import argparse
 from datetime import datetime
-from ucvl.zero3.modbus_rtu import RTU
+from ucvl.zero3.mqtt import MQTTClient
+from ucvl.zero3.gateway import Gateway
 from ucvl.zero3.json_file import JSONHandler
 from ucvl.zero3.device_type_factory import DeviceTypeFactory  # 导入 DeviceTypeFactory
+from ucvl.zero3.tag_store import TagStore
+from ucvl.zero3.scheduler import Scheduler
+from ucvl.zero3.metrics import MetricsServer
+from ucvl.zero3.gpio import GPIOController, SimulatedGPIO
+from ucvl.zero3.history import TagHistory
 
 #全局变量------------------------------------------------------------------------------------
-#要取的设备类的类型ID
-device_type_id = 1  # 本程序我们选择 ID 为 1 的设备类型，流量平衡调节阀
+#面板按键与指示灯对应的设备类型ID，其余设备类型只做轮询与发布
+device_type_id = 1  # ID 为 1 的设备类型，流量平衡调节阀
 #设备类JSON路径与设备Json路径定义
 DEVICE_TYPES_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "DeviceTypes.json")  # 设备类型的配置文件
 DEVICE_INFOS_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "DeviceInfos.json")  # 阀门对象的配置文件
+HISTORY_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "history.db")  # 标签历史（断线补发）
+GATEWAY_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "Gateway.json")  # 串口配置
+
+# 没有 Gateway.json 时使用的串口配置：只有一条总线。
+# 多串口时在 Gateway.json 中按同样格式列出各总线，并在 DeviceInfos.json 的设备中用 "Port" 指定总线名称
+DEFAULT_GATEWAY_CONFIG = {
+    "Ports": {"ttyS5": {"Port": "/dev/ttyS5", "Baudrate": 9600, "Timeout": 1, "Parity": "N", "StopBits": 1, "ByteSize": 8}},
+    "DefaultPort": "ttyS5",
+}
+
+# MQTT 服务器配置，Gateway.json 中的 "MQTT" 字段（同名键）可覆盖
+DEFAULT_MQTT_CONFIG = {"broker_ip": "192.168.1.15", "port": 1883, "username": "admin", "password": "AJB@123456"}
+
 
+# 本地指标导出端口（只监听 127.0.0.1），访问 http://127.0.0.1:9108/metrics
+METRICS_PORT = 9108
+# 指标快照通过 MQTT 上报的周期（秒）
+METRICS_PUBLISH_INTERVAL = 60
 
 # GPIO 引脚配置
 PIN_I_UP = 13
@@ -23,16 +44,23 @@ PIN_Q_REMOTE = 5
 PIN_Q_CONN_UP = 7
 
 
-instances = []  # 用于保存所有实例化的设备对象
+# 以下对象都在启动阶段中创建：导入本模块不读文件、不打开串口、不连接 MQTT
+device_infos_handler = None  # DeviceInfos.json 的读写对象，在 load_config 中创建
+device_types = None  # 设备类型 DeviceTypes 的集合（按 ID 索引），在 load_config 中读取
+instances = None  # 保存所有实例化的设备对象的 TagStore，按设备 ID / 标签 ID 建立索引
+scheduler = None  # 周期任务调度器：自动保存、MQTT 发布共用一个线程；每条串口总线有自己的轮询线程
+mqtt_client = None
+gateway = None  # 按配置为每个串口创建 RTU 客户端和轮询引擎
+gpio = None  # GPIO 子系统，按参数选择 wiringPi 或模拟后端
+auto_save_job = None  # 自动保存任务，退出前再执行一次
 
-previous_b = 0  # 用于记录上一次的 instance.Tags[2000]["实时值"] 值
+startup_timings = []  # 各启动阶段的耗时 [(阶段名称, 秒)]
 
-device_types = JSONHandler(DEVICE_TYPES_FILE_PATH).data["DeviceTypes"]  # 拿到设备类DeviceTypes 的集合
-
-# 初始化MQTT对象
-mqtt_client = MQTTClient(broker_ip="192.168.1.15",port=1883,username="admin",password="AJB@123456",instances=instances)
-# 初始化 RTU 资源
-rtu_resource = RTU(port='/dev/ttyS5', baudrate=9600, timeout=1, parity='N', stopbits=1, bytesize=8)
+# DeviceTypes.json 中没有配置 "Modbus" 字段时使用的默认映射，0~10000 对应 0~100%
+# 可配置的转换字段（DataType、Offset、ByteOrder、WordOrder、Min、Max、Deadband）见 TagConversion；
+# 读映射还可配置 "PollInterval"（秒）按标签设定轮询周期，如故障诊断类标签设为 10 秒，未配置时使用总线的 PollInterval
+DEFAULT_READ_REGISTER_MAP = {1000: {"Address": 0, "Scale": 0.01}}   # 阀门开度在 0 号寄存器
+DEFAULT_WRITE_REGISTER_MAP = {2000: {"Address": 80, "Scale": 0.01, "Min": 0, "Max": 100}}  # 阀门给定开度写入 80 号寄存器
 
 
 
@@ -42,173 +70,212 @@ rtu_resource = RTU(port='/dev/ttyS5', baudrate=9600, timeout=1, parity='N', stop
 def create_device_instance(device_info, device_class):
 
     instance = device_class(device_info.get("ID"))
-    instance.ID=device_info.get("ID")
     # 遍历设备信息中的标签，并为实例设置相应的值
     for tag in device_info["Tags"]:
 
         tag_id = tag["ID"]  # 获取标签的 ID
 
-        if tag_id in instance.Tags:  # 检查标签是否存在于实例的 Tags 字典中
+        if tag_id in instance.TagIndex:  # 检查标签是否属于该设备类型
 
-            tag_data = instance.Tags[tag_id]  # 获取标签的数据
             # 设置标签值，优先使用实时值，若实时值为 0，则使用起始值 
             initial_value = tag["实时值"] if tag["实时值"] != 0 else tag["起始值"] 
-            tag_data["实时值"]=initial_value
+            instance.set_tag_value(tag_id, initial_value)
 
     return instance
 
 
-# RTU 通信函数
-def rtu_communication():
+def adjust_setpoint(delta):
     """
-    RTU 通信函数，负责读取和写入设备的实时值。
+    就地模式下按键调整给定开度，范围 0~100
+    :param delta: 调整量，增加按键为 +1，减少按键为 -1
     """
-    global previous_b, instances, rtu_resource
-    while True:
-        try:
-            # 读取操作
-            result = rtu_resource.read_holding_registers(DataAddress=0, DataCount=1, SlaveAddress=1)
-            if result:
-                a = (result[0] / 10000.0) * 100
-                for instance in instances:
-                    instance.Tags[1000]["实时值"] = a
-            else:
-                print("读取失败")
-        except Exception as e:
-            print(f"读取错误：{e}")
-
-        time.sleep(0.5)
-
-        for instance in instances:
-            # 只有在 instance.Tags[2000]["实时值"] 值发生变化时才进行写入操作
-            if instance.Tags[2000]["实时值"] != previous_b:
-                try:
-                    converted_b = int((instance.Tags[2000]["实时值"] / 100.0) * 10000)
-                    for attempt in range(3):
-                        success = rtu_resource.write_holding_registers(SlaveAddress=1, Data=[converted_b], DataAddress=80, DataCount=1)
-                        if success:
-                            previous_b = instance.Tags[2000]["实时值"]  # 更新 previous_b
-                            break
-                        else:
-                            print(f"写入失败，尝试 {attempt + 1}/3")
-                            time.sleep(1)
-                except Exception as e:
-                    print(f"写入错误：{e}")
-
-        time.sleep(0.5)
-
-def gpio_input_monitor():
-    """
-    GPIO 输入监控函数，负责检测输入引脚的状态并对设备实例进行相应操作。
-    """
-    global instances
-    wiringpi.wiringPiSetup()  # 初始化 wiringPi 库
-
-    # 配置引脚模式
-    wiringpi.pinMode(PIN_I_UP, wiringpi.INPUT)
-    wiringpi.pullUpDnControl(PIN_I_UP, wiringpi.PUD_DOWN)  # 启用下拉电阻
-
-    wiringpi.pinMode(PIN_I_DOWN, wiringpi.INPUT)
-    wiringpi.pullUpDnControl(PIN_I_DOWN, wiringpi.PUD_DOWN)  # 启用下拉电阻
-
-    wiringpi.pinMode(PIN_Q_REMOTE, wiringpi.OUTPUT)  # 设置引脚为输出
-    wiringpi.pinMode(PIN_Q_CONN_UP, wiringpi.OUTPUT)  # 设置引脚为输出
-
-    last_state_up = wiringpi.digitalRead(PIN_I_UP)
-    last_state_down = wiringpi.digitalRead(PIN_I_DOWN)
+    for instance in instances.get_devices_by_type(device_type_id):
+        if instance.get_tag_value(3000) == 0:
+            # 原子地读-改-写，不会覆盖同时到达的 MQTT 给定值
+            instance.update_tag_value(2000, lambda value: min(max(value + delta, 0), 100))
 
-    try:
-        while True:
-            for instance in instances:
-                if instance.Tags[3000]["实时值"] == 0:
-                    current_state_up = wiringpi.digitalRead(PIN_I_UP)
-                    current_state_down = wiringpi.digitalRead(PIN_I_DOWN)
 
-                    # 检测上升沿并直接操作 instance.Tags[2000]["实时值"] 的值
-                    if current_state_up == 1 and last_state_up == 0:
-                        instance.Tags[2000]["实时值"] = min(instance.Tags[2000]["实时值"] + 1, 100)
+def setup_gpio():
+    """
+    配置 GPIO：增/减按键由上升沿中断驱动并消抖；远程指示与连接指示输出订阅第一台设备
+    （输出引脚只有一组）的标签变化，只在值变化时写入。
+    """
+    gpio.add_input(PIN_I_UP, lambda pin, level: adjust_setpoint(1))
+    gpio.add_input(PIN_I_DOWN, lambda pin, level: adjust_setpoint(-1))
+
+    first = next(iter(instances.get_devices_by_type(device_type_id)), None)
+    if first is not None:
+        gpio.bind_output(PIN_Q_REMOTE, first, 3000, lambda value: value == 1)
+        gpio.bind_output(PIN_Q_CONN_UP, first, 7000, lambda value: not value & 1)  # 第0位为1时输出0
+    gpio.start()
 
-                    if current_state_down == 1 and last_state_down == 0:
-                        instance.Tags[2000]["实时值"] = max(instance.Tags[2000]["实时值"] - 1, 0)
 
-                    last_state_up, last_state_down = current_state_up, current_state_down
+def run_phase(name, func, *args):
+    """
+    执行一个启动阶段并记录耗时
+    :return: 阶段函数的返回值
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    startup_timings.append((name, elapsed))
+    print(f"启动阶段 {name} 耗时 {elapsed * 1000:.1f} ms")
+    return result
 
-            # 检测 instance 的实时值并在引脚上输出
-            for instance in instances:
-               
-                    wiringpi.digitalWrite(PIN_Q_REMOTE, 1 if instance.Tags[3000]["实时值"] == 1 else 0)
 
-               
-                    er_value = instance.Tags[7000]["实时值"]
-                    wiringpi.digitalWrite(PIN_Q_CONN_UP, 0 if er_value & 1 else 1)  # 检查第0位是否为1
+def load_config():
+    """
+    配置阶段：读取设备类型、设备信息（快照 + 日志回放）与网关配置，不创建任何连接
+    :return: {"gateway": 网关配置, "mqtt": MQTT 服务器配置}
+    """
+    global device_types, device_infos_handler
+    device_types = JSONHandler(DEVICE_TYPES_FILE_PATH).device_types_by_id
+    # 标签变化追加写入 DeviceInfos.json.wal，每秒同步一次，断电不会损坏 DeviceInfos.json
+    device_infos_handler = JSONHandler(DEVICE_INFOS_FILE_PATH, flush_interval=1, wal=True)
+    gateway_config = JSONHandler(GATEWAY_FILE_PATH).data if os.path.exists(GATEWAY_FILE_PATH) else DEFAULT_GATEWAY_CONFIG
+    return {"gateway": gateway_config, "mqtt": dict(DEFAULT_MQTT_CONFIG, **gateway_config.get("MQTT", {}))}
 
-            time.sleep(0.2)
-    finally:
-        print("清理 GPIO 状态")
 
-# 主函数
-def main():
+def build(config, use_asyncio=False, simulate_gpio=False):
+    """
+    构建阶段：创建调度器、MQTT 客户端（此时不连接、不启动下行消息线程）、串口总线、GPIO 与设备实例，
+    不启动任何线程；历史数据库在启动阶段才打开
+    :param config: load_config 的返回值
+    :param use_asyncio: 是否使用 asyncio 运行时代替调度线程
+    :param simulate_gpio: 是否使用模拟 GPIO 后端
+    """
+    global instances, scheduler, mqtt_client, gateway, gpio
+    instances = TagStore()
+    if use_asyncio:
+        # 事件循环替代调度线程，MQTT 发布与自动保存任务一并交给它；只有该模式才导入 asyncio 运行时
+        from ucvl.zero3.async_runtime import AsyncGatewayRuntime
+        scheduler = AsyncGatewayRuntime()
+    else:
+        scheduler = Scheduler()
+    mqtt_client = MQTTClient(instances=instances, scheduler=scheduler, auto_connect=False, **config["mqtt"])
+    gateway = Gateway(config["gateway"])
+    gpio = GPIOController(SimulatedGPIO() if simulate_gpio else None)
+    create_devices()
+
+
+def create_devices():
     """
-    主函数，负责创建设备类和设备实例。
+    创建设备类和设备实例，并登记轮询、自动保存、发布与订阅
     """
-    global instances,mqtt_client,device_type_id
-         # 创建 MQTT 客户端对象
+    global auto_save_job
+    # 创建实例对象：DeviceInfos 中的每台设备按自己的设备类型生成类，并分配到所在的串口总线
+    for device_info in device_infos_handler.data["DeviceInfos"]:
+        try:
+            generated_class = DeviceTypeFactory.get_device_class(device_info["DevTypeID"], device_types, device_infos_handler)
+        except ValueError as e:
+            print(f"跳过设备 {device_info.get('ID')}：{e}")
+            continue
+        instance = create_device_instance(device_info, generated_class)
+        instances.add_device(instance)
+        # 阀门类型未配置 "Modbus" 字段时沿用默认映射；未配置从站地址时为 1 号从站
+        if device_info["DevTypeID"] == device_type_id:
+            gateway.add_device(instance, device_info, DEFAULT_READ_REGISTER_MAP, DEFAULT_WRITE_REGISTER_MAP)
+        else:
+            gateway.add_device(instance, device_info)
 
+    # 所有实例共用一个自动保存任务，只保存有变化的设备，追加写日志的代价很小，每秒执行一次
+    auto_save_job = DeviceTypeFactory.schedule_auto_save(scheduler, instances, device_infos_handler, interval=1)
 
-    device_infos_handler=JSONHandler(DEVICE_INFOS_FILE_PATH)
-    device_type_id = 1  # 假设我们选择 ID 为 1 的设备类型
+    # 每个设备类型只启动一个发布器，每 5 秒发布该类型全部设备的信息
+    for type_id in instances.device_type_ids():
+        mqtt_client.start_publish_loop(device_type_id=type_id, interval=5)
+    mqtt_client.start_metrics_publish(interval=METRICS_PUBLISH_INTERVAL)
 
+    #订阅实例化的设备，连接（及每次重连）成功后由 on_connect 完成订阅，不需要等待连接
+    for items in instances:
+        mqtt_client.subscribe_device_type(device_type_id=items.DevTypeID,device_id=items.ID)
 
-    #根据Json文件创建设备类，需要的参数是：哪种类型，
-    generated_class = DeviceTypeFactory.get_device_class(device_type_id, device_types,device_infos_handler)
 
+def start():
+    """
+    启动阶段：先打开标签历史库，再启动本地控制（串口轮询、GPIO），然后在后台连接 MQTT，最后开放指标导出
+    """
+    # 记录标签历史，断线期间的数据在重连后补发，保留 7 天；在轮询开始之前订阅，不漏掉第一批变化
+    mqtt_client.attach_history(TagHistory(HISTORY_FILE_PATH, retention=7 * 24 * 3600))
+    # 每条串口总线一个轮询线程，各总线并行
+    gateway.start()
+    setup_gpio()
+    mqtt_client.connect()
+    MetricsServer(port=METRICS_PORT).start()
 
-    # 创建实例对象，基于 DeviceInfos 中的设备信息
-    for device_info in device_infos_handler.data["DeviceInfos"]:
-        if device_info["DevTypeID"] == device_type_id:
-            instance = create_device_instance(device_info, generated_class)
-            instances.append(instance)
 
-           
+def save_on_exit():
+    """退出前执行一次自动保存并统一落盘，最后一个保存周期内的变化不会丢失"""
+    auto_save_job.func(*auto_save_job.args, **auto_save_job.kwargs)
+    device_infos_handler.flush()
 
-    #等待连接成功
-    while not mqtt_client.client.is_connected():
-        print("等待连接成功...")
-        # 在主程序中显式订阅设备类型 1 的主题
-        #订阅实例化的设备
-        for items in instances:
-            mqtt_client.start_publish_loop(device_type_id=1,device_id=items.ID, interval=5)  # 每 5 秒发布设备类型为 1 的设备信息
-            mqtt_client.subscribe_device_type(device_type_id=1,device_id=items.ID)
 
-        time.sleep(5)  # 每5秒检查一次连接状态
-   
- # 启动线程
-def start_threads():
-    rtu_thread = threading.Thread(target=rtu_communication)
-    gpio_thread = threading.Thread(target=gpio_input_monitor)
-  
+def print_status():
+    """打印设备状态与执行超时的周期任务"""
+    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"Hello, 【优创未来】, version V0.2.13! 当前时间是 {current_time}")
 
-    rtu_thread.daemon = True
-    gpio_thread.daemon = True
+    for instance in instances.get_devices_by_type(device_type_id):
+        print(f"阀门开度：{instance.Tags[1000]['实时值']}")
+        print(f"阀门给定开度：{instance.Tags[2000]['实时值']}")
+        print(f"阀门就地远程状态：{instance.Tags[3000]['实时值']}")
 
+    # 打印执行超时的周期任务，便于发现周期设置过短
+    job_stats = dict(scheduler.job_stats())
+    for bus in gateway.buses.values():
+        job_stats.update(bus.scheduler.job_stats())
+    for name, stats in job_stats.items():
+        if stats["overruns"]:
+            print(f"任务 {name} 超时 {stats['overruns']} 次，最长耗时 {stats['max_duration']:.3f} 秒")
 
-    rtu_thread.start()
-    gpio_thread.start()
 
+def run_asyncio():
+    """
+    asyncio 运行模式：周期任务、MQTT 收发都在一个事件循环中，每条串口总线仍在自己的线程中轮询，
+    GPIO 输入由中断触发、在消抖确认线程中回调。收到 SIGINT/SIGTERM 时停止总线、统一落盘并断开 MQTT。
+    """
+    scheduler.add_job(print_status, 10, name="print_status", delay=0)
+    scheduler.attach_mqtt(mqtt_client.client)
+    scheduler.add_shutdown_callback(save_on_exit)
+    scheduler.add_shutdown_callback(lambda: mqtt_client.history.close())
+    scheduler.add_shutdown_callback(gateway.stop)  # 清理函数逆序执行：先停总线再落盘
+
+    scheduler.run()
+
+
+def run_threads():
+    """多线程运行模式：调度线程执行周期任务，主线程每 10 秒打印状态，Ctrl+C 退出时停止总线并落盘"""
+    scheduler.start()
+    try:
+        while True:
+            print_status()
+            time.sleep(10)
+    except KeyboardInterrupt:
+        gateway.stop()
+        scheduler.shutdown()
+        save_on_exit()
+        mqtt_client.history.close()
+
+
+def main(argv=None):
+    """
+    入口：配置 -> 构建 -> 启动 三个阶段依次执行并打印各阶段耗时，然后进入运行循环
+    """
+    parser = argparse.ArgumentParser(description="流量平衡阀智能计算核心")
+    parser.add_argument("--asyncio", action="store_true", help="使用 asyncio 运行时代替多线程模式")
+    parser.add_argument("--simulate-gpio", action="store_true", help="使用模拟 GPIO 后端，不访问硬件")
+    args = parser.parse_args(argv)
+
+    config = run_phase("配置", load_config)
+    run_phase("构建", build, config, args.asyncio, args.simulate_gpio)
+    run_phase("启动", start)
+    print(f"启动完成，共耗时 {sum(elapsed for _, elapsed in startup_timings) * 1000:.1f} ms")
+
+    if args.asyncio:
+        run_asyncio()
+    else:
+        run_threads()
 
 
 if __name__ == "__main__":
     main()
-    start_threads()
-
-    # 无限循环打印状态信息
-    while True:
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"Hello, 【优创未来】, version V0.2.13! 当前时间是 {current_time}")
-        
-        for instance in instances:
-            print(f"阀门开度：{instance.Tags[1000]['实时值']}")
-            print(f"阀门给定开度：{instance.Tags[2000]['实时值']}")
-            print(f"阀门就地远程状态：{instance.Tags[3000]['实时值']}")
-        time.sleep(10)
-
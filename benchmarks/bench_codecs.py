@@ -0,0 +1,63 @@
+"""
+MQTT 消息编码性能对比：JSON / MessagePack / struct 定长二进制。
+用法：python benchmarks/bench_codecs.py [--devices 100] [--rounds 200]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ucvl.zero3.payload_codec import CODECS
+
+# 与流量平衡调节阀一致的标签类型
+TAG_TYPES = {1000: "float", 2000: "float", 3000: "int", 4000: "int", 5000: "float", 6000: "float", 7000: "int", 8000: "int"}
+
+
+def build_payload(device_count):
+    """生成 device_count 台设备的上行消息"""
+    devs = []
+    for dev_id in range(1, device_count + 1):
+        tags = []
+        for tag_id, tag_type in TAG_TYPES.items():
+            value = round(random.uniform(0, 100), 2) if tag_type == "float" else random.randint(0, 255)
+            tags.append({'ID': tag_id, 'V': value})
+        devs.append({'DevID': dev_id, 'Tags': tags})
+    return {'DeviceTypeID': 1, 'TS': int(time.time()), 'Devs': devs}
+
+
+def bench_codec(codec, payload, rounds):
+    """返回 (编码字节数, 平均编码耗时 us, 平均解码耗时 us)"""
+    data = codec.encode(payload, TAG_TYPES)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        codec.encode(payload, TAG_TYPES)
+    encode_us = (time.perf_counter() - start) / rounds * 1e6
+    start = time.perf_counter()
+    for _ in range(rounds):
+        codec.decode(data)
+    decode_us = (time.perf_counter() - start) / rounds * 1e6
+    return len(data), encode_us, decode_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT 消息编码性能对比")
+    parser.add_argument("--devices", type=int, default=100, help="每条消息的设备数")
+    parser.add_argument("--rounds", type=int, default=200, help="每种编码的重复次数")
+    args = parser.parse_args()
+
+    payload = build_payload(args.devices)
+    print(f"{'编码':<10}{'字节数':>10}{'编码(us)':>12}{'解码(us)':>12}")
+    for name, codec in CODECS.items():
+        try:
+            size, encode_us, decode_us = bench_codec(codec, payload, args.rounds)
+        except ImportError as e:
+            print(f"{name:<10}跳过：{e}")
+            continue
+        print(f"{name:<10}{size:>10}{encode_us:>12.1f}{decode_us:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+网关热点路径基准测试：对模拟从站和进程内 MQTT 服务器测量
+- 轮询一轮的耗时随设备数的变化（poll_cycle）
+- MQTT 发布吞吐（publish）
+- 下行命令到从站寄存器的延迟（command_latency）
+- 标签持久化代价：整体快照 / 追加日志 / SQLite 历史（persistence）
+结果写成 JSON，便于与基线对比发现性能回退。
+用法：python benchmarks/bench_gateway.py [--transport tcp|pty] [--devices 1,8,32] [--output results.json]
+                                          [--compare baseline.json --tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from harness import (BENCH_DEVICE_TYPE_ID, SETPOINT_ADDRESS, SETPOINT_SCALE, MiniBroker, ModbusSimulator,
+                     make_devices)
+from ucvl.zero3.device_type_factory import DeviceTypeFactory
+from ucvl.zero3.gateway import SerialBus
+from ucvl.zero3.history import TagHistory
+from ucvl.zero3.mqtt import DeviceTypePublisher, MQTTClient
+from ucvl.zero3.rtu_poller import register_map_from_tag_meta
+
+BENCHMARKS = ("poll_cycle", "publish", "command_latency", "persistence")
+
+
+def percentile(values, fraction):
+    """取已排序列表的分位数"""
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def result(name, value, unit, params, lower_is_better=True, **extra):
+    """
+    一条基准结果
+    :param lower_is_better: 数值越小越好（耗时）还是越大越好（吞吐），与基线对比时使用
+    """
+    entry = {"name": name, "params": params, "value": round(value, 4), "unit": unit, "lower_is_better": lower_is_better}
+    entry.update({key: round(value, 4) for key, value in extra.items()})
+    return entry
+
+
+def add_devices(bus, instances):
+    """按设备类型的 "Modbus" 字段把设备加入总线，从站地址等于设备 ID"""
+    for instance in instances:
+        bus.poller.add_device(instance, instance.ID, register_map_from_tag_meta(instance.TagMeta, "R"),
+                              register_map_from_tag_meta(instance.TagMeta, "W"))
+
+
+def connect_mqtt(broker, instances):
+    """创建连接到 MiniBroker 的 MQTTClient 并等待连接成功"""
+    client = MQTTClient("127.0.0.1", broker.port, "bench", "bench", instances=instances)
+    deadline = time.monotonic() + 5
+    while not client.client.is_connected():
+        if time.monotonic() > deadline:
+            raise ConnectionError("无法连接进程内 MQTT 服务器")
+        time.sleep(0.01)
+    return client
+
+
+def bench_poll_cycle(args, workdir):
+    """轮询一轮的耗时（每台设备一个读块）"""
+    results = []
+    simulator = ModbusSimulator(max(args.devices), args.transport).start()
+    try:
+        rtu = simulator.connect_rtu()
+        for address in simulator.slaves:
+            simulator.set_registers(address, 0, [address * 100, 0])
+        for count in args.devices:
+            instances, _ = make_devices(workdir, count)
+            bus = SerialBus(f"bench{count}", None, rtu=rtu)
+            add_devices(bus, instances)
+            bus.poller.poll_cycle()  # 预热
+            durations = []
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                succeeded = bus.poller.poll_cycle()
+                durations.append((time.perf_counter() - start) * 1000)
+                if succeeded != count:
+                    print(f"poll_cycle：{count} 台设备中只有 {succeeded} 台读取成功")
+            params = {"devices": count, "transport": args.transport}
+            results.append(result("poll_cycle_ms", statistics.mean(durations), "ms", params,
+                                  p95=percentile(durations, 0.95), per_device=statistics.mean(durations) / count))
+        rtu.client.close()
+    finally:
+        simulator.stop()
+    return results
+
+
+def bench_publish(args, workdir):
+    """全量发布吞吐：每轮格式化、编码并发布该类型全部设备"""
+    count = max(args.devices)
+    instances, _ = make_devices(workdir, count)
+    broker = MiniBroker().start()
+    client = connect_mqtt(broker, instances)
+    try:
+        publisher = DeviceTypePublisher(client, BENCH_DEVICE_TYPE_ID)
+        publisher.publish()  # 预热
+        expected = broker.received + args.rounds
+        start = time.perf_counter()
+        for round_index in range(args.rounds):
+            for instance in instances:
+                instance.set_tag_value(1000, round_index % 100)
+            publisher.publish()
+        delivered = broker.wait_for(expected)
+        elapsed = time.perf_counter() - start
+        if not delivered:
+            print(f"publish：服务器只收到 {broker.received} / {expected} 条消息")
+        params = {"devices": count, "codec": client.codec.name}
+        tags = sum(len(instance.TagMeta) for instance in instances) * args.rounds
+        return [result("publish_messages_per_s", args.rounds / elapsed, "msg/s", params, lower_is_better=False),
+                result("publish_tags_per_s", tags / elapsed, "tag/s", params, lower_is_better=False),
+                result("publish_bytes_per_message", publisher.bytes_sent / publisher.messages, "B", params)]
+    finally:
+        client.client.loop_stop()
+        client.client.disconnect()
+        broker.stop()
+
+
+def bench_command_latency(args, workdir):
+    """下行给定开度命令从 MQTT 服务器发出到写入从站寄存器的延迟"""
+    count = max(args.devices)
+    instances, _ = make_devices(workdir, count)
+    simulator = ModbusSimulator(count, args.transport).start()
+    broker = MiniBroker().start()
+    bus = SerialBus("bench", None, rtu=simulator.connect_rtu())
+    add_devices(bus, instances)
+    client = connect_mqtt(broker, instances)
+    latencies = []
+    try:
+        for instance in instances:
+            client.subscribe_device_type(BENCH_DEVICE_TYPE_ID, instance.ID)
+        time.sleep(0.2)  # 等待订阅生效
+        bus.start()
+        for sample in range(args.rounds):
+            device_id = random.randint(1, count)
+            value = round(random.uniform(0, 100), 2)
+            if value == instances.get_device(device_id).get_tag_value(2000):
+                value = round(100 - value, 2)
+            register = round(value / SETPOINT_SCALE)
+            payload = json.dumps({"Devs": [{"DevID": device_id, "Tags": [{"ID": 2000, "V": value}]}]})
+            start = time.perf_counter()
+            broker.publish(f"AJB1/unified/{BENCH_DEVICE_TYPE_ID}/{device_id}", payload)
+            deadline = start + 5
+            while simulator.get_registers(device_id, SETPOINT_ADDRESS)[0] != register:
+                if time.perf_counter() > deadline:
+                    print(f"command_latency：第 {sample} 个命令 5 秒内未写入从站")
+                    break
+                time.sleep(0.0002)
+            else:
+                latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        bus.stop()
+        client.client.loop_stop()
+        client.client.disconnect()
+        broker.stop()
+        bus.rtu.client.close()
+        simulator.stop()
+    if not latencies:
+        return []
+    params = {"devices": count, "transport": args.transport}
+    return [result("command_latency_ms", statistics.median(latencies), "ms", params,
+                   p95=percentile(latencies, 0.95), max=max(latencies))]
+
+
+def bench_persistence(args, workdir):
+    """每轮有 10% 的设备标签变化时，一轮保存落盘的耗时与写入字节数"""
+    count = max(args.devices)
+    changed = max(1, count // 10)
+    results = []
+    for mode in ("snapshot", "wal"):
+        instances, handler = make_devices(workdir, count, wal=mode == "wal")
+        devices = list(instances)
+        durations = []
+        bytes_before = handler.total_bytes_written
+        for round_index in range(args.rounds):
+            for instance in random.sample(devices, changed):
+                instance.set_tag_value(1000, round_index + random.random())
+            start = time.perf_counter()
+            DeviceTypeFactory.auto_save_all(devices, handler)
+            handler.flush()
+            durations.append((time.perf_counter() - start) * 1000)
+        params = {"devices": count, "changed": changed, "mode": mode}
+        results.append(result("persist_round_ms", statistics.mean(durations), "ms", params,
+                              p95=percentile(durations, 0.95),
+                              bytes_per_round=(handler.total_bytes_written - bytes_before) / args.rounds))
+        if handler.wal is not None:
+            handler.wal.close()
+
+    history = TagHistory(os.path.join(workdir, "history.db"))
+    samples = changed * 4
+    durations = []
+    for round_index in range(args.rounds):
+        start = time.perf_counter()
+        for index in range(samples):
+            history.record(BENCH_DEVICE_TYPE_ID, index % count + 1, 1000, round_index + random.random())
+        history.flush()
+        durations.append((time.perf_counter() - start) * 1000)
+    history.close()
+    results.append(result("persist_round_ms", statistics.mean(durations), "ms",
+                          {"devices": count, "samples": samples, "mode": "history"}, p95=percentile(durations, 0.95)))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    与基线结果对比
+    :return: 超出容差的退化项 [(结果, 基线值)]
+    """
+    baseline_values = {(entry["name"], json.dumps(entry["params"], sort_keys=True)): entry["value"]
+                       for entry in baseline.get("results", [])}
+    regressions = []
+    for entry in results:
+        old = baseline_values.get((entry["name"], json.dumps(entry["params"], sort_keys=True)))
+        if not old:
+            continue
+        change = (entry["value"] - old) / old
+        if (change if entry["lower_is_better"] else -change) > tolerance:
+            regressions.append((entry, old))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网关热点路径基准测试")
+    parser.add_argument("--transport", choices=("tcp", "pty"), default="tcp",
+                        help="模拟从站的连接方式（均为 RTU 帧）：本机 TCP 或虚拟串口对")
+    parser.add_argument("--devices", default="1,8,32", help="轮询测试的设备数，逗号分隔；其余测试取最大值")
+    parser.add_argument("--rounds", type=int, default=50, help="每项测试的重复次数")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help=f"要运行的测试，逗号分隔，可选 {','.join(BENCHMARKS)}")
+    parser.add_argument("--output", help="结果 JSON 文件路径，默认只打印")
+    parser.add_argument("--compare", help="基线结果 JSON，有超出容差的退化时返回非 0")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="与基线对比的相对容差")
+    args = parser.parse_args()
+    args.devices = [int(count) for count in args.devices.split(",")]
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.only.split(","):
+            if name not in BENCHMARKS:
+                parser.error(f"未知的测试: {name}")
+            print(f"运行 {name} ...")
+            results.extend(globals()[f"bench_{name}"](args, workdir))
+
+    print(f"{'指标':<28}{'参数':<52}{'数值':>14}")
+    for entry in results:
+        params = ",".join(f"{key}={value}" for key, value in entry["params"].items())
+        print(f"{entry['name']:<28}{params:<52}{entry['value']:>10} {entry['unit']}")
+
+    report = {
+        "meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "platform": platform.platform(), "transport": args.transport, "rounds": args.rounds},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for entry, old in regressions:
+            print(f"性能退化：{entry['name']} {entry['params']} {old} -> {entry['value']} {entry['unit']}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
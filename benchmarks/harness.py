@@ -0,0 +1,362 @@
+"""
+基准测试用的本地模拟环境，不需要真实阀门、串口和 MQTT 服务器：
+- ModbusSimulator：pymodbus 模拟从站，以 RTU 帧走本机 TCP 或虚拟串口对（pty）
+- VirtualSerialPair：两个互相转发的 pty，相当于一根虚拟串口线
+- MiniBroker：进程内的最小 MQTT 3.1.1 服务器，支持 CONNECT/SUBSCRIBE/PUBLISH(QoS 0/1)/PING，记录收到的消息
+- make_devices：在临时目录生成 DeviceTypes.json / DeviceInfos.json 并创建设备实例
+"""
+import asyncio
+import json
+import os
+import select
+import socket
+import struct
+import threading
+import time
+import tty
+
+from ucvl.zero3.device_type_factory import DeviceTypeFactory
+from ucvl.zero3.json_file import JSONHandler
+from ucvl.zero3.tag_store import TagStore
+
+# 基准测试使用的设备类型：阀门开度、故障在读块中，给定开度写 80 号寄存器
+BENCH_DEVICE_TYPE_ID = 1
+BENCH_DEVICE_TYPE = {
+    "ID": BENCH_DEVICE_TYPE_ID, "Name": "流量平衡调节阀", "版本": "1.0", "Tags": [
+        {"ID": 1000, "Name": "阀门开度", "Type": "float", "RW": "R", "起始值": 0,
+         "Modbus": {"Address": 0, "Scale": 0.01, "Access": "R"}},
+        {"ID": 2000, "Name": "阀门给定开度", "Type": "float", "RW": "RW", "起始值": 0,
+         "Modbus": {"Address": 80, "Scale": 0.01, "Min": 0, "Max": 100, "Access": "W"}},
+        {"ID": 3000, "Name": "就地远程", "Type": "int", "RW": "RW", "起始值": 0},
+        {"ID": 7000, "Name": "故障", "Type": "int", "RW": "R", "起始值": 0,
+         "Modbus": {"Address": 1, "Access": "R"}},
+    ]}
+SETPOINT_ADDRESS = 80
+SETPOINT_SCALE = 0.01
+
+
+class _LoopThread:
+    """在后台线程中运行一个 asyncio 事件循环"""
+
+    def __init__(self, name):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def run(self, coro, timeout=10):
+        """在事件循环中执行协程并等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self):
+        """取消事件循环中未完成的任务（如 pymodbus 的重新监听）后停止"""
+        self.run(self._cancel_tasks())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+    @staticmethod
+    async def _cancel_tasks():
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def free_port():
+    """取一个本机空闲的 TCP 端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class VirtualSerialPair:
+    """
+    虚拟串口对：两个 pty 的主端由转发线程互相拷贝，port_a 与 port_b 两端各由一方像串口一样打开。
+    pty 没有波特率时序，测得的是软件开销；真实总线的字符时间需另行叠加。
+    """
+
+    def __init__(self):
+        self._masters = []
+        self._slaves = []
+        for _ in range(2):
+            master, slave = os.openpty()
+            tty.setraw(slave)
+            self._masters.append(master)
+            self._slaves.append(slave)
+        self.port_a, self.port_b = (os.ttyname(slave) for slave in self._slaves)
+        self._running = True
+        self._thread = threading.Thread(target=self._relay, name="pty-relay")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _relay(self):
+        a, b = self._masters
+        peer = {a: b, b: a}
+        while self._running:
+            readable, _, _ = select.select([a, b], [], [], 0.1)
+            for fd in readable:
+                try:
+                    os.write(peer[fd], os.read(fd, 4096))
+                except OSError:
+                    pass
+
+    def close(self):
+        self._running = False
+        self._thread.join(timeout=1)
+        for fd in self._masters + self._slaves:
+            os.close(fd)
+
+
+class ModbusSimulator:
+    """
+    pymodbus 模拟从站，每个从站一组保持寄存器。
+    两种传输都使用 RTU 帧：transport 为 "tcp" 时在本机端口上应答，RTU 通过 RTU.from_client 使用 TCP 客户端；
+    为 "pty" 时在 VirtualSerialPair 的一端应答，另一端（client_port）交给 RTU 按真实串口打开。
+    """
+
+    def __init__(self, slave_count, transport="tcp", registers=128, baudrate=9600):
+        """
+        :param slave_count: 从站数量，地址为 1 ~ slave_count
+        :param registers: 每个从站的保持寄存器数量
+        """
+        from pymodbus.datastore import ModbusSequentialDataBlock, ModbusServerContext, ModbusSlaveContext
+        if transport not in ("tcp", "pty"):
+            raise ValueError(f"不支持的模拟传输方式: {transport}")
+        self.transport = transport
+        self.baudrate = baudrate
+        self.slaves = {address: ModbusSlaveContext(hr=ModbusSequentialDataBlock(0, [0] * registers), zero_mode=True)
+                       for address in range(1, slave_count + 1)}
+        self.context = ModbusServerContext(slaves=self.slaves, single=False)
+        self.port = None
+        self.client_port = None
+        self._pair = None
+        self._server = None
+        self._loop = None
+
+    def start(self):
+        from pymodbus import FramerType
+        from pymodbus.server import ModbusSerialServer, ModbusTcpServer
+        self._loop = _LoopThread("modbus-sim")
+        if self.transport == "tcp":
+            self.port = free_port()
+            create = lambda: ModbusTcpServer(self.context, framer=FramerType.RTU, address=("127.0.0.1", self.port))
+        else:
+            self._pair = VirtualSerialPair()
+            self.port, self.client_port = self._pair.port_a, self._pair.port_b
+            create = lambda: ModbusSerialServer(self.context, framer=FramerType.RTU, port=self.port,
+                                                baudrate=self.baudrate)
+        self._server = self._loop.run(self._create(create))
+        self._loop.run(self._wait_listening())
+        return self
+
+    @staticmethod
+    async def _create(create):
+        return create()  # pymodbus 服务器需在事件循环中创建
+
+    async def _wait_listening(self):
+        serving = asyncio.ensure_future(self._server.serve_forever())
+        while not self._server.transport:
+            if serving.done():
+                serving.result()  # 监听失败（如缺少 pyserial）时抛出原始异常
+            await asyncio.sleep(0.01)
+
+    def connect_rtu(self, timeout=1):
+        """
+        创建连接本模拟器的 RTU
+        :return: RTU
+        """
+        from ucvl.zero3.modbus_rtu import RTU
+        if self.transport == "pty":
+            return RTU(port=self.client_port, baudrate=self.baudrate, timeout=timeout, parity='N', stopbits=1, bytesize=8)
+        from pymodbus import FramerType
+        from pymodbus.client import ModbusTcpClient
+        client = ModbusTcpClient("127.0.0.1", port=self.port, framer=FramerType.RTU, timeout=timeout)
+        if not client.connect():
+            raise ConnectionError(f"无法连接模拟从站 127.0.0.1:{self.port}")
+        return RTU.from_client(client, f"sim-{self.transport}")
+
+    def set_registers(self, slave_address, address, values):
+        self.slaves[slave_address].setValues(3, address, list(values))
+
+    def get_registers(self, slave_address, address, count=1):
+        return self.slaves[slave_address].getValues(3, address, count)
+
+    def stop(self):
+        if self._server is not None:
+            self._loop.run(self._server.shutdown())
+            self._loop.stop()
+            self._server = None
+        if self._pair is not None:
+            self._pair.close()
+            self._pair = None
+
+
+def _encode_length(length):
+    """MQTT 剩余长度的变长编码"""
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def topic_matches(topic_filter, topic):
+    """判断主题是否匹配订阅过滤器（支持 + 和 #）"""
+    filter_parts = topic_filter.split('/')
+    topic_parts = topic.split('/')
+    for index, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if index >= len(topic_parts) or (part != '+' and part != topic_parts[index]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+class MiniBroker:
+    """
+    进程内的最小 MQTT 3.1.1 服务器，只用于基准测试：不鉴权、不保存保留消息和会话，
+    转发给订阅者时一律按 QoS 0。收到的每条 PUBLISH 计入 received / received_bytes，
+    on_message(主题, 负载) 在服务器线程中回调。
+    """
+
+    def __init__(self, on_message=None):
+        self.on_message = on_message
+        self.port = None
+        self.received = 0
+        self.received_bytes = 0
+        self.connections = 0
+        self._sessions = []  # [(StreamWriter, 订阅过滤器集合)]
+        self._loop = None
+        self._server = None
+
+    def start(self):
+        self._loop = _LoopThread("mqtt-broker")
+        self._server = self._loop.run(asyncio.start_server(self._handle, "127.0.0.1", 0))
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    def publish(self, topic, payload):
+        """以服务器身份向订阅者发布一条消息（可在任意线程调用）"""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        self._loop.loop.call_soon_threadsafe(self._route, topic, payload, False)
+
+    def wait_for(self, count, timeout=10):
+        """
+        等待累计收到 count 条消息
+        :return: 是否在超时前收到
+        """
+        deadline = time.monotonic() + timeout
+        while self.received < count:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def _route(self, topic, payload, count=True):
+        if count:
+            self.received += 1
+            self.received_bytes += len(payload)
+            if self.on_message is not None:
+                self.on_message(topic, payload)
+        topic_bytes = topic.encode('utf-8')
+        body = struct.pack('>H', len(topic_bytes)) + topic_bytes + payload
+        packet = b'\x30' + _encode_length(len(body)) + body
+        for writer, filters in self._sessions:
+            if any(topic_matches(topic_filter, topic) for topic_filter in filters):
+                writer.write(packet)
+
+    async def _handle(self, reader, writer):
+        session = (writer, set())
+        try:
+            while True:
+                header = (await reader.readexactly(1))[0]
+                length, multiplier = 0, 1
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7f) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length) if length else b''
+                packet_type = header >> 4
+                if packet_type == 1:  # CONNECT
+                    self.connections += 1
+                    self._sessions.append(session)
+                    writer.write(b'\x20\x02\x00\x00')
+                elif packet_type == 3:  # PUBLISH
+                    qos = (header >> 1) & 3
+                    (topic_length,) = struct.unpack_from('>H', body)
+                    position = 2 + topic_length
+                    topic = body[2:position].decode('utf-8')
+                    if qos:
+                        writer.write(b'\x40\x02' + body[position:position + 2])
+                        position += 2
+                    self._route(topic, body[position:])
+                elif packet_type in (8, 10):  # SUBSCRIBE / UNSUBSCRIBE
+                    packet_id, position, granted = body[:2], 2, b''
+                    while position < len(body):
+                        (topic_length,) = struct.unpack_from('>H', body, position)
+                        topic_filter = body[position + 2:position + 2 + topic_length].decode('utf-8')
+                        position += 2 + topic_length
+                        if packet_type == 8:
+                            session[1].add(topic_filter)
+                            granted += b'\x00'
+                            position += 1  # 请求的 QoS
+                        else:
+                            session[1].discard(topic_filter)
+                    if packet_type == 8:
+                        writer.write(b'\x90' + _encode_length(2 + len(granted)) + packet_id + granted)
+                    else:
+                        writer.write(b'\xb0\x02' + packet_id)
+                elif packet_type == 12:  # PINGREQ
+                    writer.write(b'\xd0\x00')
+                elif packet_type == 14:  # DISCONNECT
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if session in self._sessions:
+                self._sessions.remove(session)
+            writer.close()
+
+    def stop(self):
+        if self._server is not None:
+            self._loop.run(self._close())
+            self._loop.stop()
+            self._server = None
+
+    async def _close(self):
+        """关闭监听和全部连接，连接处理协程读到 EOF 后自行结束"""
+        self._server.close()
+        for writer, _ in list(self._sessions):
+            writer.close()
+        for _ in range(100):
+            if not self._sessions:
+                break
+            await asyncio.sleep(0.01)
+
+
+def make_devices(directory, device_count, wal=False):
+    """
+    在 directory 中生成设备类型与设备信息文件，并创建设备实例
+    :return: (TagStore, DeviceInfos.json 的 JSONHandler)
+    """
+    types_path = os.path.join(directory, "DeviceTypes.json")
+    infos_path = os.path.join(directory, "DeviceInfos.json")
+    with open(types_path, 'w', encoding='utf-8') as file:
+        json.dump({"DeviceTypes": [BENCH_DEVICE_TYPE]}, file, ensure_ascii=False)
+    tags = [{"ID": tag["ID"], "实时值": 0, "起始值": 0} for tag in BENCH_DEVICE_TYPE["Tags"]]
+    infos = [{"ID": device_id, "DevTypeID": BENCH_DEVICE_TYPE_ID, "SlaveAddress": device_id, "Tags": tags}
+             for device_id in range(1, device_count + 1)]
+    with open(infos_path, 'w', encoding='utf-8') as file:
+        json.dump({"DeviceInfos": infos}, file, ensure_ascii=False)
+
+    device_types = JSONHandler(types_path).device_types_by_id
+    handler = JSONHandler(infos_path, flush_interval=1, wal=wal)
+    # 设备类按类型 ID 缓存并绑定创建时的 JSONHandler，每组设备重新生成
+    DeviceTypeFactory._device_classes.pop(BENCH_DEVICE_TYPE_ID, None)
+    device_class = DeviceTypeFactory.get_device_class(BENCH_DEVICE_TYPE_ID, device_types, handler)
+    return TagStore(device_class(info["ID"]) for info in infos), handler
@@ -0,0 +1,22 @@
+import pytest
+
+from ucvl.zero3.device_type_factory import DeviceTypeFactory
+
+VALVE_TYPE = {
+    "ID": 1, "Name": "流量平衡调节阀", "版本": "1.0",
+    "Tags": [
+        {"ID": 1000, "Name": "阀门开度", "Type": "float", "RW": "R", "起始值": 0,
+         "Modbus": {"Address": 0, "Scale": 0.01, "Access": "R"}},
+        {"ID": 2000, "Name": "阀门给定开度", "Type": "float", "RW": "RW", "起始值": 0, "Min": 0, "Max": 100,
+         "Modbus": {"Address": 80, "Scale": 0.01, "Access": "W"}},
+        {"ID": 3000, "Name": "就地远程", "Type": "int", "RW": "RW", "起始值": 0},
+        {"ID": 4000, "Name": "使能", "Type": "bool", "RW": "读写", "起始值": 0},
+        {"ID": 7000, "Name": "故障", "Type": "int", "RW": "R", "起始值": 0},
+    ],
+}
+
+
+@pytest.fixture
+def valve_class():
+    """按 VALVE_TYPE 创建的设备类，不绑定 JSONHandler"""
+    return DeviceTypeFactory._create_device_class(1, [VALVE_TYPE], None)
@@ -0,0 +1,128 @@
+import threading
+
+import pytest
+
+from ucvl.zero3.device_type_factory import is_writable
+
+
+def test_instances_keep_their_own_values(valve_class):
+    first, second = valve_class(1), valve_class(2)
+    first.set_tag_value(2000, 40)
+    first.Tags[3000]["实时值"] = 1
+
+    assert first.get_tag_value(2000) == 40
+    assert first.Tags[3000]["实时值"] == 1
+    assert second.get_tag_value(2000) == 0
+    assert second.get_tag_value(3000) == 0
+    assert valve_class(3).snapshot() == {1000: 0, 2000: 0, 3000: 0, 4000: 0, 7000: 0}
+    assert valve_class.InitialValues == (0, 0, 0, 0, 0)
+
+
+def test_metadata_is_shared_by_type_and_read_only_per_instance(valve_class):
+    first, second = valve_class(1), valve_class(2)
+    assert first.TagMeta is second.TagMeta
+    assert first.Tags[2000]["Max"] == 100
+    assert first.Tags[2000].get("Deadband") is None
+    with pytest.raises(KeyError):
+        first.Tags[2000]["Name"] = "改名"
+    with pytest.raises(AttributeError):
+        first.extra = 1  # __slots__：实例只保存值列表
+    assert list(first.Tags) == [1000, 2000, 3000, 4000, 7000]
+    assert 9999 not in first.Tags and first.Tags.get(9999) is None
+    with pytest.raises(KeyError):
+        first.get_tag_value(9999)
+
+
+@pytest.mark.parametrize("rw, expected", [("R", False), ("RW", True), ("W", True), ("rw", True),
+                                          ("读写", True), ("写", True), ("只读", False)])
+def test_rw_spellings(rw, expected):
+    assert is_writable(rw) is expected
+
+
+def test_read_only_tags_are_not_remotely_writable(valve_class):
+    device = valve_class(1)
+    assert device.WritableTags == {2000, 3000, 4000}
+    assert not device.is_tag_writable(1000)
+    assert not device.is_tag_writable(7000)
+    assert device.is_tag_writable(4000)
+
+
+def test_snapshot_is_not_affected_by_later_writes(valve_class):
+    device = valve_class(1)
+    device.set_tag_value(2000, 10)
+    before = device.snapshot()
+    pairs = device.tag_values()
+    device.set_tag_values({2000: 20, 3000: 1})
+    assert before[2000] == 10 and before[3000] == 0
+    assert dict(pairs) == before
+    assert device.snapshot()[2000] == 20
+
+
+def test_set_tag_values_is_atomic_for_readers(valve_class):
+    device = valve_class(1)
+    stop = threading.Event()
+    torn = []
+
+    def reader():
+        while not stop.is_set():
+            values = device.snapshot()
+            if values[2000] != values[3000]:
+                torn.append(values)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for value in range(1, 2000):
+        device.set_tag_values([(2000, value), (3000, value)])
+    stop.set()
+    thread.join()
+    assert torn == []
+
+
+def test_set_tag_values_with_unknown_tag_changes_nothing(valve_class):
+    device = valve_class(1)
+    with pytest.raises(KeyError):
+        device.set_tag_values({2000: 5, 9999: 1})
+    assert device.get_tag_value(2000) == 0
+    assert device.set_tag_values({2000: 5, 3000: 0}) == [(2000, 0, 5)]
+
+
+def test_concurrent_read_modify_write_loses_no_updates(valve_class):
+    device = valve_class(1)
+
+    def increment():
+        for _ in range(1000):
+            device.update_tag_value(3000, lambda value: value + 1)
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert device.get_tag_value(3000) == 4000
+
+
+def test_observers_run_after_the_lock_is_released(valve_class):
+    device = valve_class(1)
+    seen = []
+
+    def on_setpoint(inst, tag_id, old, new):
+        assert not inst._lock.locked()
+        seen.append((tag_id, old, new))
+        inst.set_tag_value(7000, new)  # 回调中可以再写本设备
+
+    def broken(inst, tag_id, old, new):
+        raise RuntimeError("boom")
+
+    device.subscribe(broken)
+    device.subscribe(on_setpoint, [2000])
+    device.set_tag_value(2000, 30)
+    device.set_tag_value(2000, 30)   # 值未变化，不通知
+    device.set_tag_value(3000, 1)    # 未订阅的标签
+    device.set_tag_values({2000: 40})
+    device.update_tag_value(2000, lambda value: value + 1)
+    assert seen == [(2000, 0, 30), (2000, 30, 40), (2000, 40, 41)]
+    assert device.get_tag_value(7000) == 41
+
+    device.unsubscribe(on_setpoint)
+    device.set_tag_value(2000, 50)
+    assert len(seen) == 3
@@ -0,0 +1,63 @@
+import threading
+import time
+
+from ucvl.zero3.gpio import EDGE_BOTH, GPIOController, SimulatedGPIO
+
+
+def bounce(gpio, pin, level, count=4, interval=0.002):
+    """模拟触点抖动：在目标电平与原电平之间来回跳变后稳定在目标电平"""
+    for _ in range(count):
+        gpio.set_level(pin, level)
+        time.sleep(interval)
+        gpio.set_level(pin, 1 - level)
+        time.sleep(interval)
+    gpio.set_level(pin, level)
+
+
+def test_press_with_bounce_on_press_and_release_is_accepted_once():
+    gpio = SimulatedGPIO()
+    presses = []
+    controller = GPIOController(gpio, debounce=0.02)
+    button = controller.add_input(5, lambda pin, level: presses.append(level))
+    controller.start()
+
+    bounce(gpio, 5, 1)
+    time.sleep(0.2)
+    bounce(gpio, 5, 0)
+    time.sleep(0.1)
+
+    assert presses == [1]
+    assert button.accepted == 1
+    assert button.level == 0
+
+
+def test_both_edges_and_pulses_longer_than_debounce():
+    gpio = SimulatedGPIO()
+    levels = []
+    controller = GPIOController(gpio, debounce=0.02)
+    controller.add_input(6, lambda pin, level: levels.append(level), edge=EDGE_BOTH)
+    controller.start()
+
+    gpio.pulse(6, width=0.05)
+    time.sleep(0.05)
+    gpio.set_level(6, 1)
+    gpio.set_level(6, 0)  # 短于消抖时间的毛刺被滤掉
+    time.sleep(0.05)
+
+    assert levels == [1, 0]
+
+
+def test_bouncing_inputs_share_one_debounce_thread():
+    gpio = SimulatedGPIO()
+    controller = GPIOController(gpio, debounce=0.02)
+    presses = []
+    for pin in (5, 6):
+        controller.add_input(pin, lambda pin, level: presses.append(pin))
+    controller.start()
+    threads = threading.active_count()
+
+    for pin in (5, 6):
+        bounce(gpio, pin, 1, count=20, interval=0.0005)
+    assert threading.active_count() <= threads + 1
+    time.sleep(0.1)
+    assert sorted(presses) == [5, 6]
@@ -0,0 +1,45 @@
+import json
+import os
+
+from ucvl.zero3 import json_file
+from ucvl.zero3.json_file import JSONHandler, TagChangeLog
+
+
+def test_replay_truncates_unterminated_last_record(tmp_path):
+    path = tmp_path / "DeviceInfos.json.wal"
+    log = TagChangeLog(str(path))
+    log.append([[1, 1000, 5], [1, 1000, 6]])
+    log.close()
+    # 断电：最后一条记录写完了 JSON 但没有写出换行符
+    with open(path, 'rb+') as file:
+        file.truncate(path.stat().st_size - 1)
+
+    log = TagChangeLog(str(path))
+    assert log.replay() == [(1, 1000, 5)]
+    log.append([[1, 1000, 7], [1, 1000, 8]])
+    log.close()
+
+    assert TagChangeLog(str(path)).replay() == [(1, 1000, 5), (1, 1000, 7), (1, 1000, 8)]
+
+
+def test_replay_truncates_partial_record(tmp_path):
+    path = tmp_path / "DeviceInfos.json.wal"
+    path.write_bytes(b'[1,1000,5]\n[1,10')
+    log = TagChangeLog(str(path))
+    assert log.replay() == [(1, 1000, 5)]
+    assert path.read_bytes() == b'[1,1000,5]\n'
+
+
+def test_snapshot_rename_is_synced_before_wal_is_reset(tmp_path, monkeypatch):
+    path = tmp_path / "DeviceInfos.json"
+    path.write_text(json.dumps({"DeviceInfos": [{"ID": 1, "Tags": [{"ID": 1000, "实时值": 0}]}]}))
+    handler = JSONHandler(str(path), wal=True)
+    events = []
+    real_replace, real_fsync_directory, real_reset = os.replace, json_file.fsync_directory, TagChangeLog.reset
+    monkeypatch.setattr(json_file.os, "replace", lambda *args: (events.append("replace"), real_replace(*args)))
+    monkeypatch.setattr(json_file, "fsync_directory",
+                        lambda p: (events.append(("fsync_directory", p)), real_fsync_directory(p)))
+    monkeypatch.setattr(TagChangeLog, "reset", lambda self: (events.append("reset"), real_reset(self)))
+
+    handler.save_json()
+    assert events == ["replace", ("fsync_directory", str(path)), "reset"]
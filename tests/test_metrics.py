@@ -0,0 +1,12 @@
+import socket
+
+from ucvl.zero3.metrics import MetricsServer
+
+
+def test_start_reports_port_in_use_without_raising():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        sock.listen()
+        server = MetricsServer(port=sock.getsockname()[1])
+        assert server.start() is False
+    server.stop()
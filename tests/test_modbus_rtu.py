@@ -0,0 +1,37 @@
+import pytest
+
+from ucvl.zero3.metrics import REGISTRY
+from ucvl.zero3.modbus_rtu import RTU
+
+pymodbus = pytest.importorskip("pymodbus")
+from pymodbus.exceptions import ModbusIOException  # noqa: E402
+from pymodbus.pdu import ExceptionResponse  # noqa: E402
+
+
+class FakeClient:
+    """按顺序返回预设应答的 pymodbus 客户端"""
+
+    def __init__(self, results):
+        self.results = list(results)
+
+    def _next(self, **kwargs):
+        return self.results.pop(0)
+
+    read_holding_registers = write_register = write_registers = _next
+
+
+def count(port, op, result):
+    return REGISTRY.counter("zero3_modbus_requests_total", "", {"port": port, "op": op, "result": result}).value
+
+
+def test_returned_io_exception_is_counted_as_timeout():
+    port = "test-timeout"
+    rtu = RTU.from_client(FakeClient([ModbusIOException("no response"), ExceptionResponse(3, 2),
+                                      ModbusIOException("no response"), ExceptionResponse(16, 2)]), port)
+    assert rtu.read_holding_registers(DataAddress=0, DataCount=1, SlaveAddress=1) is None
+    assert rtu.read_holding_registers(DataAddress=0, DataCount=1, SlaveAddress=1) is None
+    assert rtu.write_holding_registers(SlaveAddress=1, Data=[1], DataAddress=0, DataCount=1) is False
+    assert rtu.write_holding_registers(SlaveAddress=1, Data=[1, 2], DataAddress=0, DataCount=2) is False
+    for op in ("read", "write"):
+        assert count(port, op, "timeout") == 1
+        assert count(port, op, "exception") == 1
@@ -0,0 +1,126 @@
+import json
+import types
+
+from ucvl.zero3.mqtt import PUBLISH_MODE_EXCEPTION, DeviceTypePublisher, MQTTClient
+from ucvl.zero3.history import TagHistory
+from ucvl.zero3.tag_store import TagStore
+
+
+def make_client(**kwargs):
+    return MQTTClient("127.0.0.1", 1883, "user", "password", instances=TagStore([]), auto_connect=False, **kwargs)
+
+
+def test_each_reconnect_attempt_draws_its_own_delay():
+    client = make_client(reconnect_min_delay=1, reconnect_max_delay=8)
+    delays = []
+    for attempt in range(6):
+        client.on_connect_fail(client.client, None)
+        delays.append(client.client._reconnect_min_delay)
+        base = min(2 ** (attempt + 1), 8)
+        assert base * 0.5 <= delays[-1] <= base
+    assert len(set(delays[3:])) > 1  # 到达上限后仍然逐次抖动
+
+    client.on_connect(client.client, None, {}, 0)
+    assert client.client._reconnect_min_delay <= 1
+
+
+def handle(client, payload):
+    return client.handle_message("AJB1/unified/1/1", json.dumps(payload))
+
+
+def test_inbound_command_is_validated_against_tag_definition(valve_class):
+    device = valve_class(1)
+    client = make_client()
+    client.instances = TagStore([device])
+    tags = [
+        {"ID": 2000, "V": 55.5},   # 写入
+        {"ID": 3000, "V": 1.0},    # 整数类型接受整数值浮点
+        {"ID": 4000, "V": True},   # 布尔
+        {"ID": 2000.5, "V": 1},    # 未知标签
+        {"ID": 1000, "V": 1},      # 只读
+        {"ID": 3000, "V": 1.5},    # 不是整数
+        {"ID": 3000, "V": "1"},    # 类型不符
+        {"ID": 4000, "V": 2},      # 布尔只接受 0/1
+        {"ID": 2000, "V": 101},    # 超出 Max
+        {"ID": 2000, "V": True},   # 数值标签不接受布尔
+    ]
+    assert handle(client, {"Devs": [{"DevID": 1, "Tags": tags}]}) == 3
+    assert device.get_tag_value(2000) == 55.5
+    assert device.get_tag_value(3000) == 1 and isinstance(device.get_tag_value(3000), int)
+    assert device.get_tag_value(4000) is True
+    stats = client.inbound_stats
+    assert (stats['unknown_tags'], stats['readonly_tags'], stats['invalid_values']) == (1, 1, 5)
+
+
+def test_malformed_tag_entries_are_counted_and_skipped(valve_class):
+    device = valve_class(1)
+    client = make_client()
+    client.instances = TagStore([device])
+    payload = {"Devs": [{"DevID": 1, "Tags": ["bad", {"ID": 2000, "V": 10}, {"ID": [1], "V": 1}]},
+                        {"DevID": 1, "Tags": "bad"},
+                        {"DevID": [1], "Tags": []},
+                        "bad"]}
+    assert handle(client, payload) == 1
+    assert device.get_tag_value(2000) == 10
+    stats = client.inbound_stats
+    assert stats['decode_errors'] == 2
+    assert stats['unknown_tags'] == 1
+    assert stats['unknown_devices'] == 2
+
+
+def test_change_marked_during_integrity_publish_is_not_lost(valve_class):
+    device = valve_class(1)
+    client = make_client()
+    client.instances = TagStore([device])
+    publisher = DeviceTypePublisher(client, 1, mode=PUBLISH_MODE_EXCEPTION, integrity_interval=3600)
+    publisher.watch()
+    # 另一个线程在全量快照取完集合之后标记的变化，仍然记录在同一个集合里
+    changed = publisher._changed
+    assert len(publisher.build_payloads()) == 1
+    device.set_tag_value(2000, 42)
+    assert changed is publisher._changed
+
+    payloads = publisher.build_payloads()
+    assert [tag['ID'] for dev in payloads[0]['Devs'] for tag in dev['Tags']] == [2000]
+
+
+class FakePaho:
+    """记录发布的消息，由测试决定何时确认（PUBACK）"""
+
+    def __init__(self):
+        self.sent = []
+
+    def is_connected(self):
+        return True
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.sent.append((topic, payload, qos))
+        return types.SimpleNamespace(rc=0, mid=len(self.sent))
+
+    def reconnect_delay_set(self, min_delay, max_delay):
+        pass
+
+
+def test_history_is_marked_forwarded_only_after_puback(tmp_path):
+    client = make_client()
+    client.client = FakePaho()
+    client.history = history = TagHistory(str(tmp_path / "history.db"))
+    for value in range(3):
+        history.record(1, 1, 1000, value)
+    history.flush()
+
+    assert client.replay_history() == 3
+    assert history.pending_count() == 3
+    assert client.replay_history() == 0  # 上一批未确认，不发下一批
+    client.on_publish(client.client, None, 1)
+    client.replay_history()
+    assert history.pending_count() == 0
+
+    # 确认前连接断开：采样保持未转发，重连后重发
+    history.record(1, 1, 1000, 9)
+    history.flush()
+    assert client.replay_history() == 1
+    client.on_disconnect(client.client, None, 1)
+    assert client.replay_history() == 1
+    assert len(client.client.sent) == 3
+    history.close()
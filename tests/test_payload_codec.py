@@ -0,0 +1,83 @@
+import pytest
+
+from ucvl.zero3.payload_codec import JSONCodec, StructCodec, codec_for_topic, get_codec
+
+PAYLOAD = {
+    "DeviceTypeID": 1, "TS": 1700000000,
+    "Devs": [
+        {"DevID": 1, "Tags": [{"ID": 1000, "V": 12.5}, {"ID": 3000, "V": 2}, {"ID": 4000, "V": True}]},
+        {"DevID": 2, "Tags": [{"ID": 1000, "V": -0.25}, {"ID": 3000, "V": -7}, {"ID": 4000, "V": False}]},
+        {"DevID": 3, "Tags": [{"ID": 1000, "V": 99.0}, {"ID": 3000, "V": 0}, {"ID": 4000, "V": True}]},
+    ],
+}
+TAG_TYPES = {1000: "float", 3000: "int", 4000: "bool"}
+
+
+@pytest.mark.parametrize("name", ["json", "msgpack"])
+def test_generic_codecs_round_trip(name):
+    if name == "msgpack":
+        pytest.importorskip("msgpack")
+    codec = get_codec(name)
+    data = codec.encode(PAYLOAD, TAG_TYPES)
+    assert isinstance(data, bytes)
+    assert codec.decode(data) == PAYLOAD
+
+
+def test_json_codec_is_compact_and_accepts_text():
+    codec = JSONCodec()
+    data = codec.encode({"DevID": 1, "Tags": []})
+    assert data == b'{"DevID":1,"Tags":[]}'
+    assert codec.decode(data.decode("utf-8")) == {"DevID": 1, "Tags": []}
+
+
+def test_struct_codec_round_trips_values_and_types():
+    codec = StructCodec()
+    decoded = codec.decode(codec.encode(PAYLOAD, TAG_TYPES))
+    assert decoded == PAYLOAD  # 所选浮点值在 float32 下精确
+    for dev in decoded["Devs"]:
+        values = {tag["ID"]: tag["V"] for tag in dev["Tags"]}
+        assert isinstance(values[1000], float)
+        assert isinstance(values[3000], int) and not isinstance(values[3000], bool)
+        assert isinstance(values[4000], bool)
+
+
+def test_struct_codec_is_smaller_than_json():
+    assert len(StructCodec().encode(PAYLOAD, TAG_TYPES)) < len(JSONCodec().encode(PAYLOAD))
+
+
+def test_struct_codec_handles_mixed_layouts_strings_and_wide_ints():
+    payload = {
+        "DeviceTypeID": 2, "TS": 1, "Chunk": 1, "Chunks": 3,
+        "Devs": [
+            {"DevID": 1, "Tags": [{"ID": 1, "V": 1.5}, {"ID": 2, "V": 3}]},
+            {"DevID": 2, "Tags": [{"ID": 1, "V": 2}, {"ID": 2, "V": True}]},  # 同标签数、不同类型码
+            {"DevID": 3, "Tags": [{"ID": 5, "V": "阀门 A"}, {"ID": 6, "V": 2 ** 40}]},
+            {"DevID": 4, "Tags": []},
+        ],
+    }
+    decoded = StructCodec().decode(StructCodec().encode(payload, {1: "float", 6: "int"}))
+    assert decoded["Chunk"] == 1 and decoded["Chunks"] == 3
+    values = [[tag["V"] for tag in dev["Tags"]] for dev in decoded["Devs"]]
+    assert values == [[1.5, 3], [2.0, True], ["阀门 A", float(2 ** 40)], []]
+
+
+def test_struct_codec_rejects_unknown_version_and_type_code():
+    codec = StructCodec()
+    data = bytearray(codec.encode(PAYLOAD, TAG_TYPES))
+    data[0] = 99
+    with pytest.raises(ValueError):
+        codec.decode(bytes(data))
+
+    data = bytearray(codec.encode({"Devs": [{"DevID": 1, "Tags": [{"ID": 1, "V": 1}]}]}))
+    data[codec._HEADER.size + codec._DEVICE.size + 2] = ord('x')
+    with pytest.raises(ValueError):
+        codec.decode(bytes(data))
+
+
+def test_codec_lookup():
+    assert get_codec("struct").name == "struct"
+    with pytest.raises(ValueError):
+        get_codec("xml")
+    assert codec_for_topic("AJB1/unified/1/1/struct").name == "struct"
+    assert codec_for_topic("AJB1/unified/1/1").name == "json"
+    assert codec_for_topic("AJB1/unified/1/1", default=get_codec("msgpack")).name == "msgpack"
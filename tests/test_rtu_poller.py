@@ -0,0 +1,132 @@
+import time
+
+from ucvl.zero3.rtu_poller import RTUPoller, SlaveHealth
+
+
+class FakeBus:
+    """按从站记录读请求；offline 中的从站无应答，每个请求按 delay 占用总线"""
+
+    def __init__(self, delay=0.0):
+        self.port = "fake-bus"
+        self.delay = delay
+        self.offline = set()
+        self.reads = []  # [(从站地址, 起始地址)]
+
+    def read_time(self, count):
+        return self.delay
+
+    def read_holding_registers(self, DataAddress, DataCount, SlaveAddress):
+        self.reads.append((SlaveAddress, DataAddress))
+        if self.delay:
+            time.sleep(self.delay)
+        if SlaveAddress in self.offline:
+            return None
+        return [SlaveAddress] * DataCount
+
+
+class FakeDevice:
+    def __init__(self):
+        self.values = {}
+
+    def get_tag_value(self, tag_id):
+        return self.values.get(tag_id)
+
+    def set_tag_values(self, updates):
+        self.values.update(updates)
+
+
+def test_slave_goes_offline_after_threshold_and_backs_off():
+    health = SlaveHealth(1, fail_threshold=3, probe_interval=2, max_probe_interval=10)
+    health.record(False, 100)
+    health.record(False, 100)
+    assert health.online and health.should_poll(100)
+
+    health.record(False, 100)
+    assert not health.online and health.offline_count == 1
+    assert not health.should_poll(101.9) and health.should_poll(102)
+
+    # 每次探测失败，探测间隔翻倍，不超过上限
+    probes = []
+    now = 102
+    for _ in range(4):
+        health.record(False, now)
+        probes.append(health.next_probe - now)
+        now = health.next_probe
+    assert probes == [4, 8, 10, 10]
+
+    health.record(True, now)
+    assert health.online and health.failures == 0
+    for _ in range(3):
+        health.record(False, now)
+    assert health.next_probe == now + 2  # 恢复后退避从头开始
+    assert health.offline_count == 2
+
+
+def test_offline_slave_gets_one_probe_and_does_not_stall_others():
+    bus = FakeBus()
+    poller = RTUPoller(bus, fail_threshold=2, probe_interval=3600)
+    dead, alive = FakeDevice(), FakeDevice()
+    # 两个读块：地址不相邻，不能合并
+    poller.add_device(dead, 1, {1: {"Address": 0}, 2: {"Address": 100}})
+    poller.add_device(alive, 2, {1: {"Address": 0}})
+    bus.offline.add(1)
+
+    poller.poll_cycle()
+    poller.poll_cycle()
+    assert poller.offline_slaves() == {1}
+    bus.reads.clear()
+    for _ in range(5):
+        poller.poll_cycle()
+    assert bus.reads == [(2, 0)] * 5  # 未到探测时间，离线从站不占用总线
+
+    poller.slaves[1].next_probe = 0
+    bus.reads.clear()
+    poller.poll_cycle()
+    assert sorted(bus.reads) == [(1, 0), (2, 0)]  # 探测只发一个请求
+
+    bus.offline.clear()
+    poller.slaves[1].next_probe = 0
+    poller.poll_cycle()
+    assert poller.offline_slaves() == set()
+    poller.poll_cycle()
+    assert dead.values == {1: 1, 2: 1}
+
+
+def test_poll_due_reads_each_block_at_its_own_interval():
+    bus = FakeBus()
+    poller = RTUPoller(bus)
+    device = FakeDevice()
+    polled = poller.add_device(device, 1, {1: {"Address": 0, "PollInterval": 0.05},
+                                           2: {"Address": 1, "PollInterval": 3600}})
+    assert polled.intervals == [0.05, 3600]
+    assert poller.shortest_interval() == 0.05
+
+    assert poller.poll_due() == 1
+    assert sorted(bus.reads) == [(1, 0), (1, 1)]
+    assert poller.poll_due() == 0  # 都未到期
+
+    time.sleep(0.06)
+    bus.reads.clear()
+    assert poller.poll_due() == 1
+    assert bus.reads == [(1, 0)]  # 只有快读块到期
+
+
+def test_poll_due_stops_at_budget_and_serves_most_overdue_first():
+    bus = FakeBus(delay=0.05)
+    poller = RTUPoller(bus, poll_interval=3600)
+    devices = [poller.add_device(FakeDevice(), address, {1: {"Address": 0}}) for address in (1, 2, 3, 4)]
+    devices[3].next_read[0] = -10  # 落后最多
+
+    # 预计超出预算时停止；第一个设备总会被读取
+    assert poller.poll_due(budget=0.12) == 2
+    assert bus.reads == [(4, 0), (1, 0)]
+
+    bus.reads.clear()
+    assert poller.poll_due(budget=0.01) == 1
+    assert bus.reads == [(2, 0)]
+
+    bus.reads.clear()
+    bus.delay = 0
+    assert poller.poll_due() == 1
+    assert bus.reads == [(3, 0)]
+    assert poller.poll_due() == 0
@@ -0,0 +1,157 @@
+from ucvl.zero3.rtu_poller import RTUPoller
+from ucvl.zero3.rtu_write_queue import RTUWriteQueue
+
+SETPOINT = 2000
+SETPOINT_ADDRESS = 80
+
+
+class FakeRTU:
+    """
+    内存中的从站寄存器。online 为 False 时读写都无应答；accept_writes 为 False 时从站在线但拒绝写入
+    """
+
+    def __init__(self):
+        self.port = "fake"
+        self.online = True
+        self.accept_writes = True
+        self.registers = {}
+        self.writes = 0
+        self.on_read = None
+
+    def write_holding_registers(self, SlaveAddress, Data, DataAddress, DataCount):
+        self.writes += 1
+        if not self.online or not self.accept_writes:
+            return False
+        for offset, value in enumerate(Data):
+            self.registers[(SlaveAddress, DataAddress + offset)] = value
+        return True
+
+    def read_holding_registers(self, DataAddress, DataCount, SlaveAddress):
+        if not self.online:
+            return None
+        registers = [self.registers.get((SlaveAddress, DataAddress + offset), 0) for offset in range(DataCount)]
+        if self.on_read is not None:
+            self.on_read()
+        return registers
+
+
+class FakeDevice:
+    """只实现轮询引擎用到的标签接口，变化时同步通知观察者"""
+
+    def __init__(self, values):
+        self.values = dict(values)
+        self.observers = []
+
+    def get_tag_value(self, tag_id):
+        return self.values[tag_id]
+
+    def set_tag_value(self, tag_id, value):
+        self.set_tag_values([(tag_id, value)])
+
+    def set_tag_values(self, updates):
+        changed = [(tag_id, self.values.get(tag_id), value) for tag_id, value in updates
+                   if self.values.get(tag_id) != value]
+        self.values.update(updates)
+        for tag_id, old_value, new_value in changed:
+            for callback in self.observers:
+                callback(self, tag_id, old_value, new_value)
+
+    def subscribe(self, callback, tag_ids=None):
+        self.observers.append(callback)
+
+
+def make_poller(rtu, device, read_setpoint=False):
+    queue = RTUWriteQueue(rtu, max_attempts=3, backoff=0, max_backoff=0)
+    poller = RTUPoller(rtu, write_queue=queue, fail_threshold=2, probe_interval=0, max_probe_interval=0)
+    spec = {SETPOINT: {"Address": SETPOINT_ADDRESS}}
+    read_map = dict(spec) if read_setpoint else {1000: {"Address": 0}}
+    poller.add_device(device, 1, read_map, spec)
+    poller.process_writes()
+    return poller, queue
+
+
+def test_dropped_write_is_delivered_after_bus_recovers():
+    rtu = FakeRTU()
+    device = FakeDevice({1000: 0, SETPOINT: 0})
+    poller, queue = make_poller(rtu, device)
+    assert rtu.registers[(1, SETPOINT_ADDRESS)] == 0
+
+    rtu.online = False
+    device.set_tag_value(SETPOINT, 50)
+    for _ in range(5):
+        poller.poll_cycle()
+    assert poller.offline_slaves() == {1}
+
+    rtu.online = True
+    poller.poll_cycle()
+    poller.process_writes()
+    assert rtu.registers[(1, SETPOINT_ADDRESS)] == 50
+    assert queue.pending_count() == 0
+
+
+def test_rejected_write_is_not_retried_while_slave_stays_online():
+    rtu = FakeRTU()
+    device = FakeDevice({1000: 0, SETPOINT: 0})
+    poller, queue = make_poller(rtu, device)
+    writes = rtu.writes
+
+    rtu.accept_writes = False
+    device.set_tag_value(SETPOINT, 50)
+    for _ in range(50):
+        poller.poll_cycle()
+    assert rtu.writes - writes == queue.max_attempts
+    assert queue.dropped == 1
+    assert queue.pending_count() == 0
+    assert poller.offline_slaves() == set()
+
+    # 标签再次变化时按新值提交
+    rtu.accept_writes = True
+    device.set_tag_value(SETPOINT, 60)
+    poller.process_writes()
+    assert rtu.registers[(1, SETPOINT_ADDRESS)] == 60
+
+
+def test_read_back_value_of_rw_tag_is_not_written_back():
+    rtu = FakeRTU()
+    rtu.registers[(1, SETPOINT_ADDRESS)] = 1000
+    device = FakeDevice({SETPOINT: 1000})
+    poller, queue = make_poller(rtu, device, read_setpoint=True)
+    writes = rtu.writes
+
+    rtu.registers[(1, SETPOINT_ADDRESS)] = 1234  # 在从站本地修改了设定值
+    poller.poll_cycle()
+    assert device.get_tag_value(SETPOINT) == 1234
+    assert queue.pending_count() == 0
+    assert rtu.writes == writes
+
+    # 读回的值同步了提交记录，再设定为原来的值也会写出
+    device.set_tag_value(SETPOINT, 1000)
+    poller.process_writes()
+    assert rtu.registers[(1, SETPOINT_ADDRESS)] == 1000
+
+
+def test_read_in_flight_does_not_overwrite_new_setpoint():
+    rtu = FakeRTU()
+    rtu.registers[(1, SETPOINT_ADDRESS)] = 1000
+    device = FakeDevice({SETPOINT: 1000})
+    poller, queue = make_poller(rtu, device, read_setpoint=True)
+
+    # 读请求在途时收到新的设定值，读回的是旧值
+    rtu.on_read = lambda: device.set_tag_value(SETPOINT, 50)
+    poller.poll_device(poller.devices[0])
+    rtu.on_read = None
+    assert device.get_tag_value(SETPOINT) == 50
+    assert queue.has_pending(1, SETPOINT_ADDRESS)
+
+    poller.process_writes()
+    assert rtu.registers[(1, SETPOINT_ADDRESS)] == 50
+
+
+def test_newer_value_replaces_pending_write():
+    rtu = FakeRTU()
+    queue = RTUWriteQueue(rtu)
+    queue.submit(1, SETPOINT_ADDRESS, 10)
+    queue.submit(1, SETPOINT_ADDRESS, 20)
+    assert queue.process() == 1
+    assert rtu.registers[(1, SETPOINT_ADDRESS)] == 20
+    assert queue.coalesced == 1
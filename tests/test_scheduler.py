@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from ucvl.zero3.scheduler import ScheduledJob, Scheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = Scheduler("test-scheduler")
+    yield scheduler
+    scheduler.shutdown()
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_jobs_run_in_due_order_on_one_thread(scheduler):
+    order, threads = [], set()
+
+    def record(name):
+        order.append(name)
+        threads.add(threading.current_thread().name)
+
+    # 同一计划时间的任务按添加顺序执行
+    scheduler.add_job(record, 10, args=("late",), name="late", delay=0.06)
+    scheduler.add_job(record, 10, args=("first",), name="first", delay=0.02)
+    scheduler.add_job(record, 10, args=("second",), name="second", delay=0.02)
+    scheduler.add_job(record, 10, args=("early",), name="early", delay=0.0)
+    scheduler.start()
+
+    assert wait_until(lambda: len(order) == 4)
+    assert order[0] == "early" and order[-1] == "late"
+    assert order.index("first") < order.index("second")
+    assert threads == {"test-scheduler"}
+
+
+def test_periodic_job_repeats_and_survives_errors(scheduler):
+    calls = []
+
+    def flaky():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+
+    scheduler.add_job(flaky, 0.02, name="flaky", delay=0)
+    scheduler.start()
+    assert wait_until(lambda: len(calls) >= 3)
+    stats = scheduler.job_stats()["flaky"]
+    assert stats["errors"] == 1 and stats["runs"] >= 3
+
+
+def test_trigger_runs_once_more_without_shifting_the_period(scheduler):
+    calls = []
+    job = scheduler.add_job(lambda: calls.append(1), 3600, name="write")
+    planned = job.next_run
+    scheduler.start()
+
+    assert scheduler.trigger_job("write")
+    assert wait_until(lambda: calls == [1])
+    assert job.next_run == planned
+    assert not scheduler.trigger_job("missing")
+
+
+def test_removed_job_does_not_run(scheduler):
+    calls = []
+    scheduler.add_job(lambda: calls.append(1), 0.01, name="gone", delay=0.05)
+    assert scheduler.remove_job("gone")
+    assert not scheduler.remove_job("gone")
+    scheduler.start()
+    time.sleep(0.1)
+    assert calls == []
+    assert scheduler.get_job("gone") is None
+
+
+def test_invalid_jobs_are_rejected(scheduler):
+    scheduler.add_job(print, 1, name="job")
+    with pytest.raises(ValueError):
+        scheduler.add_job(print, 1, name="job")
+    with pytest.raises(ValueError):
+        scheduler.add_job(print, 0, name="zero")
+
+
+def test_jitter_delays_each_run_without_drifting_the_period():
+    job = ScheduledJob("jittered", print, interval=10, jitter=2)
+    base = 100.0
+    for _ in range(50):
+        job.schedule(base)
+        assert base <= job.next_run <= base + 2
+        assert job.base_time == base
+        # 下一次计划时间从不含抖动的 base_time 累加
+        base = job.next_base_time(now=job.next_run)
+        assert base == job.base_time + 10
+
+
+def test_overrun_is_counted_and_missed_periods_are_skipped():
+    job = ScheduledJob("slow", print, interval=1)
+    job.schedule(100.0)
+    job.record_run(0.5)
+    job.record_run(3.5)
+    # 在 103.5 结束：101、102、103 三个周期已错过，下一次在 104 执行而不是连续补跑
+    assert job.next_base_time(now=103.5) == 104.0
+    stats = job.stats()
+    assert (stats["runs"], stats["overruns"], stats["skipped"]) == (2, 1, 3)
+    assert stats["max_duration"] == 3.5 and stats["avg_duration"] == 2.0
+
+
+def test_slow_job_is_reported_as_overrun(scheduler):
+    scheduler.add_job(time.sleep, 0.01, args=(0.03,), name="slow", delay=0)
+    scheduler.start()
+    assert wait_until(lambda: scheduler.job_stats()["slow"]["runs"] >= 2)
+    stats = scheduler.job_stats()["slow"]
+    assert stats["overruns"] >= 2 and stats["skipped"] >= 2
@@ -0,0 +1,25 @@
+import itertools
+
+import pytest
+
+from ucvl.zero3.tag_conversion import DATA_TYPES, BlockDecoder, TagConversion
+
+REGISTERS = [0x1234, 0xABCD, 0x0001, 0xFF00]
+
+
+@pytest.mark.parametrize("data_type,byte_order,word_order",
+                         list(itertools.product(DATA_TYPES, ("big", "little"), ("big", "little"))))
+def test_block_decoder_matches_single_tag_decode(data_type, byte_order, word_order):
+    conversions = [TagConversion(tag_id, address, data_type, byte_order=byte_order, word_order=word_order)
+                   for tag_id, address in ((1, 0), (2, 2))]
+    block = BlockDecoder(0, len(REGISTERS), [(c.tag_id, c.address, c) for c in conversions])
+    decoded = {conversion.tag_id: value for conversion, value in block.decode(REGISTERS)}
+    for conversion in conversions:
+        assert decoded[conversion.tag_id] == conversion.decode(REGISTERS, conversion.address)
+
+
+def test_uint16_little_endian_is_byte_swapped():
+    conversion = TagConversion(1, 0, "uint16", byte_order="little")
+    block = BlockDecoder(0, 1, [(1, 0, conversion)])
+    assert block.decode([0x1234]) == [(conversion, 0x3412)]
+    assert conversion.encode(0x3412) == [0x1234]
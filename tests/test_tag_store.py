@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from ucvl.zero3.device_type_factory import DeviceTypeFactory
+from ucvl.zero3.json_file import JSONHandler
+from ucvl.zero3.tag_store import TagStore
+
+PUMP_TYPE = {
+    "ID": 2, "Name": "循环泵", "版本": "1.0",
+    "Tags": [
+        {"ID": 1000, "Name": "频率", "Type": "float", "RW": "R", "起始值": 0},
+        {"ID": 5000, "Name": "启停", "Type": "bool", "RW": "RW", "起始值": 0},
+    ],
+}
+
+
+@pytest.fixture
+def pump_class():
+    return DeviceTypeFactory._create_device_class(2, [PUMP_TYPE], None)
+
+
+def test_lookups_by_device_type_and_tag(valve_class, pump_class):
+    valve_1, valve_2, pump = valve_class(1), valve_class(2), pump_class(3)
+    store = TagStore([valve_1, valve_2, pump])
+
+    assert len(store) == 3 and 2 in store and 4 not in store
+    assert store.get_device(3) is pump
+    assert store.get_device(4) is None
+    assert store.get_devices_by_type(1) == [valve_1, valve_2]
+    assert store.get_devices_by_type(9) == []
+    assert sorted(store.device_type_ids()) == [1, 2]
+
+    store.set_value(2, 2000, 30)
+    assert store.get_value(2, 2000) == 30
+    assert valve_1.get_tag_value(2000) == 0
+    assert store.get_tag(2, 2000)["Name"] == "阀门给定开度"
+    assert store.get_tag(3, 2000) is None  # 泵没有这个标签
+    with pytest.raises(KeyError):
+        store.get_value(3, 2000)
+
+
+def test_re_adding_a_device_id_replaces_the_old_instance(valve_class, pump_class):
+    store = TagStore([valve_class(1)])
+    pump = pump_class(1)
+    store.add_device(pump)
+
+    assert len(store) == 1
+    assert store.get_device(1) is pump
+    assert store.get_devices_by_type(1) == []
+    assert store.device_type_ids() == [2]
+    assert store.get_tag(1, 2000) is None
+    assert store.get_tag(1, 5000) is not None
+
+    store.remove_device(1)
+    assert 1 not in store and store.get_tag(1, 5000) is None
+    store.remove_device(1)  # 不存在时忽略
+
+
+def test_get_devices_by_type_returns_a_copy(valve_class):
+    store = TagStore([valve_class(1)])
+    store.get_devices_by_type(1).clear()
+    assert len(store.get_devices_by_type(1)) == 1
+
+
+def test_subscription_filters_apply_to_devices_added_later(valve_class, pump_class):
+    store = TagStore([valve_class(1)])
+    seen = []
+
+    def on_change(inst, tag_id, old, new):
+        seen.append((inst.ID, tag_id, new))
+
+    store.subscribe(on_change, tag_ids=[2000], device_type_id=1)
+    store.add_device(valve_class(2))
+    store.add_device(pump_class(3))
+
+    store.set_value(1, 2000, 10)
+    store.set_value(2, 2000, 20)
+    store.set_value(2, 3000, 1)   # 未订阅的标签
+    store.set_value(3, 5000, 1)   # 其他设备类型
+    assert seen == [(1, 2000, 10), (2, 2000, 20)]
+
+    store.unsubscribe(on_change)
+    store.add_device(valve_class(4))
+    store.set_value(1, 2000, 11)
+    store.set_value(4, 2000, 40)
+    assert seen == [(1, 2000, 10), (2, 2000, 20)]
+
+
+def test_json_handler_resolves_devices_and_tags_by_id(tmp_path):
+    path = tmp_path / "DeviceInfos.json"
+    path.write_text(json.dumps({
+        "DeviceTypes": [PUMP_TYPE],
+        "DeviceInfos": [{"ID": 7, "DevTypeID": 2, "Tags": [{"ID": 1000, "实时值": 0}, {"ID": 5000, "实时值": 0}]}],
+    }))
+    handler = JSONHandler(str(path))
+
+    assert handler.get_device(2)["Name"] == "循环泵"
+    assert handler.get_device_info(7)["DevTypeID"] == 2
+    with pytest.raises(ValueError):
+        handler.get_device(9)
+    with pytest.raises(ValueError):
+        handler.get_device_info(9)
+
+    assert handler.update_tags(7, {1000: 49.5, 5000: 0}) == 1
+    assert handler.get_device_info(7)["Tags"][0]["实时值"] == 49.5
+    with pytest.raises(ValueError):
+        handler.update_tags(7, {9999: 1})
+    with pytest.raises(ValueError):
+        handler.update_tags(9, {1000: 1})
@@ -0,0 +1,281 @@
+import asyncio
+import random
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ucvl.zero3.scheduler import ScheduledJob
+
+class PahoAsyncioAdapter:
+    """
+    把 paho MQTT 客户端的 socket 挂到 asyncio 事件循环上，替代 loop_start 的网络线程。
+    读写事件由事件循环的 add_reader/add_writer 驱动，保活与重连由 misc_loop 协程负责。
+    重连（TCP 连接可能阻塞到超时）在默认线程池中执行，不阻塞事件循环；此时 socket 回调来自线程池，
+    统一转回事件循环线程注册。
+    """
+
+    def __init__(self, client, loop, reconnect_min_delay=1, reconnect_max_delay=60):
+        self.client = client
+        self.loop = loop
+        self.reconnect_min_delay = reconnect_min_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self._loop_thread = threading.get_ident()
+
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+        # 客户端可能已经在同步模式下连上，直接接管现有 socket
+        sock = client.socket()
+        if sock is not None:
+            self.on_socket_open(client, None, sock)
+            if client.want_write():
+                self.on_socket_register_write(client, None, sock)
+
+    def _in_loop(self, func, *args):
+        """在事件循环线程中执行 func，其他线程调用时转交给事件循环"""
+        if threading.get_ident() == self._loop_thread:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def on_socket_open(self, client, userdata, sock):
+        self._in_loop(self.loop.add_reader, sock, client.loop_read)
+
+    def on_socket_close(self, client, userdata, sock):
+        # paho 随后就会关闭 socket，先取出文件描述符
+        self._in_loop(self.loop.remove_reader, sock.fileno())
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self._in_loop(self.loop.add_writer, sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self._in_loop(self.loop.remove_writer, sock.fileno())
+
+    async def misc_loop(self):
+        """周期调用 loop_misc 处理保活，断线后按带随机抖动的指数退避重连"""
+        delay = self.reconnect_min_delay
+        while True:
+            if self.client.loop_misc() == 0:
+                delay = self.reconnect_min_delay
+                await asyncio.sleep(1)
+                continue
+            try:
+                print("MQTT 连接断开，尝试重连...")
+                await self.loop.run_in_executor(None, self.client.reconnect)
+                delay = self.reconnect_min_delay
+            except Exception as e:
+                wait = delay * random.uniform(0.5, 1.5)
+                print(f"MQTT 重连失败: {e}, {wait:.1f} 秒后重试")
+                await asyncio.sleep(wait)
+                delay = min(delay * 2, self.reconnect_max_delay)
+
+
+class AsyncGatewayRuntime:
+    """
+    基于 asyncio 的网关运行时。
+    周期任务以协程运行在一个事件循环里，串口等阻塞 I/O 交给小型线程池执行，
+    MQTT 通过 PahoAsyncioAdapter 挂在同一个事件循环上，优雅退出统一在 shutdown 中处理。
+    任务接口与 Scheduler 保持一致（add_job / get_job / remove_job / job_stats），可以直接替换。
+    """
+
+    def __init__(self, io_workers=1):
+        """
+        :param io_workers: 执行阻塞任务的线程数，单条串口总线用 1 即可保证请求串行
+        """
+        self.io_workers = io_workers
+        self.executor = None
+        self.loop = None
+        self._jobs = {}
+        self._blocking = set()
+        self._first_delay = {}
+        self._tasks = {}
+        self._wakeups = {}  # 任务名称 -> asyncio.Event，trigger_job 用它唤醒任务
+        self._mqtt_clients = []
+        self._adapters = []
+        self._shutdown_callbacks = []
+        self._stop_event = None
+        self._lock = threading.Lock()
+
+    def add_job(self, func, interval, args=(), kwargs=None, name=None, jitter=0.0, delay=None, blocking=False):
+        """
+        添加周期任务
+        :param blocking: 为 True 时在线程池中执行（串口读写、文件落盘等阻塞操作）
+        其余参数与 Scheduler.add_job 相同
+        :return: ScheduledJob
+        """
+        if interval <= 0:
+            raise ValueError(f"任务周期必须大于 0: {interval}")
+        name = name or getattr(func, "__name__", repr(func))
+        job = ScheduledJob(name, func, interval, args, kwargs, jitter)
+        with self._lock:
+            if name in self._jobs:
+                raise ValueError(f"任务 {name} 已存在")
+            self._jobs[name] = job
+            self._first_delay[name] = interval if delay is None else delay
+            if blocking:
+                self._blocking.add(name)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._start_job, job)
+        return job
+
+    def remove_job(self, name):
+        """
+        移除任务
+        :return: 是否找到并移除了任务
+        """
+        with self._lock:
+            job = self._jobs.pop(name, None)
+            self._blocking.discard(name)
+            self._first_delay.pop(name, None)
+        if job is None:
+            return False
+        job.cancelled = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._cancel_task, name)
+        return True
+
+    def get_job(self, name):
+        """根据名称获取任务，不存在时返回 None"""
+        return self._jobs.get(name)
+
+    def trigger_job(self, name):
+        """
+        让任务尽快额外执行一次（可在任意线程调用），接口与 Scheduler.trigger_job 相同
+        :return: 是否找到任务
+        """
+        if name not in self._jobs:
+            return False
+        wakeup = self._wakeups.get(name)
+        if wakeup is not None:
+            self.loop.call_soon_threadsafe(wakeup.set)
+        return True
+
+    def job_stats(self):
+        """
+        获取所有任务的运行统计
+        :return: {任务名称: 统计信息字典}
+        """
+        with self._lock:
+            return {name: job.stats() for name, job in self._jobs.items()}
+
+    def attach_mqtt(self, client):
+        """
+        由事件循环驱动 paho 客户端的网络收发；如果客户端已调用 loop_start，会先停止其网络线程
+        :param client: paho.mqtt.client.Client
+        """
+        self._mqtt_clients.append(client)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._start_mqtt, client)
+
+    def add_shutdown_callback(self, func):
+        """注册退出时执行的清理函数（按注册的逆序执行）"""
+        self._shutdown_callbacks.append(func)
+
+    def run(self):
+        """运行事件循环，直到 stop 被调用或收到 SIGINT/SIGTERM"""
+        loop = asyncio.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self._main())
+        finally:
+            loop.close()
+
+    def stop(self):
+        """请求停止运行时（可在任意线程调用）"""
+        if self.loop is not None and self._stop_event is not None:
+            self.loop.call_soon_threadsafe(self._stop_event.set)
+
+    async def _main(self):
+        self.loop = asyncio.get_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.io_workers)
+        self._stop_event = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self._stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        for client in self._mqtt_clients:
+            self._start_mqtt(client)
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            self._start_job(job)
+
+        try:
+            await self._stop_event.wait()
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self):
+        """取消全部任务，执行清理函数，断开 MQTT 并关闭线程池"""
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        for func in reversed(self._shutdown_callbacks):
+            try:
+                func()
+            except Exception as e:
+                print(f"退出清理错误：{e}")
+
+        for client in self._mqtt_clients:
+            try:
+                client.disconnect()
+            except Exception as e:
+                print(f"MQTT 断开错误：{e}")
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        print("运行时已退出")
+
+    def _start_mqtt(self, client):
+        client.loop_stop()
+        adapter = PahoAsyncioAdapter(client, self.loop)
+        self._adapters.append(adapter)
+        self._tasks[f"mqtt_misc_{id(client)}"] = self.loop.create_task(adapter.misc_loop())
+
+    def _start_job(self, job):
+        if job.cancelled or job.name in self._tasks:
+            return
+        self._wakeups[job.name] = asyncio.Event()
+        self._tasks[job.name] = self.loop.create_task(self._run_job(job, job.name in self._blocking))
+
+    def _cancel_task(self, name):
+        task = self._tasks.pop(name, None)
+        self._wakeups.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+    async def _run_job(self, job, blocking):
+        job.schedule(time.monotonic() + self._first_delay.get(job.name, job.interval))
+        wakeup = self._wakeups[job.name]
+        while not job.cancelled:
+            try:
+                await asyncio.wait_for(wakeup.wait(), max(0.0, job.next_run - time.monotonic()))
+                triggered = True
+            except asyncio.TimeoutError:
+                triggered = False
+            wakeup.clear()
+
+            start = time.monotonic()
+            failed = False
+            try:
+                if blocking:
+                    await self.loop.run_in_executor(self.executor, lambda: job.func(*job.args, **job.kwargs))
+                else:
+                    job.func(*job.args, **job.kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failed = True
+                print(f"任务 {job.name} 执行错误：{e}")
+            job.record_run(time.monotonic() - start, failed)
+            if not triggered:
+                job.schedule(job.next_base_time(time.monotonic()))
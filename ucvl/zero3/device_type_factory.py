@@ -1,5 +1,255 @@
+import math
 import threading
 
+
+def is_writable(rw):
+    """
+    根据标签的 RW 字段判断是否可写，兼容 "RW"/"W"/"读写"/"写" 等写法
+    """
+    rw = str(rw)
+    return 'W' in rw.upper() or '写' in rw
+
+
+def value_kind(tag_type):
+    """
+    根据标签的 Type 字段归类，兼容 "float"/"real"/"浮点"、"bool"/"布尔"、"string"/"字符串" 等写法
+    :return: "bool"、"float"、"string" 或 "int"
+    """
+    kind = str(tag_type or "").lower()
+    if "bool" in kind or "布尔" in kind:
+        return "bool"
+    if any(word in kind for word in ("float", "real", "double", "浮点")):
+        return "float"
+    if "str" in kind or "字符" in kind:
+        return "string"
+    return "int"
+
+
+class TagRecord:
+    """
+    单个标签的轻量视图，兼容 instance.Tags[tag_id]["实时值"] 的写法。
+    元数据从设备类共享的 TagMeta 读取，实时值读写落到实例自己的值数组。
+    """
+    __slots__ = ('_instance', '_tag_id')
+
+    def __init__(self, instance, tag_id):
+        self._instance = instance
+        self._tag_id = tag_id
+
+    def __getitem__(self, key):
+        if key == '实时值':
+            return self._instance.get_tag_value(self._tag_id)
+        return self._instance.TagMeta[self._tag_id][key]
+
+    def __setitem__(self, key, value):
+        if key != '实时值':
+            raise KeyError(f"标签元数据 {key} 属于设备类型，不能按实例修改")
+        self._instance.set_tag_value(self._tag_id, value)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class TagView:
+    """设备实例标签的映射视图：键为标签 ID，值为 TagRecord"""
+    __slots__ = ('_instance',)
+
+    def __init__(self, instance):
+        self._instance = instance
+
+    def __getitem__(self, tag_id):
+        if tag_id not in self._instance.TagIndex:
+            raise KeyError(tag_id)
+        return TagRecord(self._instance, tag_id)
+
+    def __contains__(self, tag_id):
+        return tag_id in self._instance.TagIndex
+
+    def __iter__(self):
+        return iter(self._instance.TagIDs)
+
+    def __len__(self):
+        return len(self._instance.TagIDs)
+
+    def keys(self):
+        return self._instance.TagIDs
+
+    def values(self):
+        return [TagRecord(self._instance, tag_id) for tag_id in self._instance.TagIDs]
+
+    def items(self):
+        return [(tag_id, TagRecord(self._instance, tag_id)) for tag_id in self._instance.TagIDs]
+
+    def get(self, tag_id, default=None):
+        if tag_id in self._instance.TagIndex:
+            return TagRecord(self._instance, tag_id)
+        return default
+
+
+class DeviceBase:
+    """
+    DeviceTypeFactory 生成的设备类的基类。
+    标签元数据（Name、Type、RW、起始值）按设备类型只存一份，
+    每个实例只保存一个按标签位置索引的实时值列表。
+    实时值列表按写时复制使用：写入在实例锁内复制列表、修改后整体替换，已发布的列表不再被修改，
+    因此读取（get_tag_value、tag_values、snapshot）不加锁，得到的总是某一时刻的一致快照，
+    RTU、GPIO、MQTT 与自动保存线程可以并发读写同一设备。
+    写入的值与原值不同时，在写入线程中、释放锁之后同步通知按标签订阅的观察者。
+    """
+    __slots__ = ()
+
+    TagMeta = {}     # 标签 ID -> 标签元数据字典（按类型共享）
+    TagIDs = ()      # 标签 ID，按位置排列
+    TagIndex = {}    # 标签 ID -> 在实时值列表中的位置
+    WritableTags = frozenset()  # RW 允许远程写入的标签 ID
+    TagLimits = {}   # 标签 ID -> (值类别, 最小值, 最大值)，下行写入时校验
+    InitialValues = ()
+
+    @property
+    def Tags(self):
+        return TagView(self)
+
+    def get_tag_value(self, tag_id):
+        """
+        获取标签实时值
+        :raises KeyError: 标签不存在
+        """
+        return self._values[self.TagIndex[tag_id]]
+
+    def set_tag_value(self, tag_id, value):
+        """
+        设置标签实时值，值变化时通知观察者
+        :raises KeyError: 标签不存在
+        """
+        index = self.TagIndex[tag_id]
+        with self._lock:
+            values = self._values
+            old_value = values[index]
+            if old_value == value and type(old_value) is type(value):
+                return  # 值未变化（轮询的常见情况），不复制列表
+            values = list(values)
+            values[index] = value
+            self._values = values
+        if self._observers and old_value != value:
+            self._notify(tag_id, old_value, value)
+
+    def set_tag_values(self, tag_values):
+        """
+        原子地设置多个标签：只复制、替换一次值列表，读者要么看到全部旧值，要么看到全部新值
+        :param tag_values: [(标签 ID, 值)] 或 {标签 ID: 值}
+        :return: 值发生变化的 [(标签 ID, 旧值, 新值)]
+        :raises KeyError: 标签不存在（此时不修改任何标签）
+        """
+        if isinstance(tag_values, dict):
+            tag_values = tag_values.items()
+        updates = [(self.TagIndex[tag_id], tag_id, value) for tag_id, value in tag_values]
+        changes = []
+        with self._lock:
+            values = list(self._values)
+            for index, tag_id, value in updates:
+                old_value = values[index]
+                values[index] = value
+                if old_value != value:
+                    changes.append((tag_id, old_value, value))
+            self._values = values
+        if self._observers:
+            for tag_id, old_value, new_value in changes:
+                self._notify(tag_id, old_value, new_value)
+        return changes
+
+    def update_tag_value(self, tag_id, func):
+        """
+        原子地读-改-写一个标签（如按键增减给定开度），不会与其他线程的写入互相覆盖
+        :param func: 参数为当前值、返回新值的函数；在实例锁内执行，应尽量短小，不能再写本设备的标签
+        :return: 新值
+        :raises KeyError: 标签不存在
+        """
+        index = self.TagIndex[tag_id]
+        with self._lock:
+            values = list(self._values)
+            old_value = values[index]
+            value = values[index] = func(old_value)
+            self._values = values
+        if self._observers and old_value != value:
+            self._notify(tag_id, old_value, value)
+        return value
+
+    def subscribe(self, callback, tag_ids=None):
+        """
+        订阅标签变化，回调在设置值的线程中同步执行，应尽量短小
+        :param callback: 回调函数，参数为 (设备实例, 标签 ID, 旧值, 新值)
+        :param tag_ids: 只关注的标签 ID，None 表示全部标签
+        """
+        with self._lock:
+            for key in (None,) if tag_ids is None else tag_ids:
+                # 复制后替换，通知过程中订阅/退订不影响正在遍历的列表
+                self._observers[key] = self._observers.get(key, []) + [callback]
+
+    def unsubscribe(self, callback):
+        """取消该回调在本设备上的全部订阅"""
+        with self._lock:
+            for key, callbacks in list(self._observers.items()):
+                remaining = [c for c in callbacks if c != callback]
+                if remaining:
+                    self._observers[key] = remaining
+                else:
+                    del self._observers[key]
+
+    def _notify(self, tag_id, old_value, new_value):
+        for key in (tag_id, None):
+            for callback in self._observers.get(key, ()):
+                try:
+                    callback(self, tag_id, old_value, new_value)
+                except Exception as e:
+                    print(f"标签 {tag_id} 变化通知错误：{e}")
+
+    def is_tag_writable(self, tag_id):
+        """标签是否允许远程写入（RW 字段含 W 或“写”）"""
+        return tag_id in self.WritableTags
+
+    def check_tag_value(self, tag_id, value):
+        """
+        按标签定义的 Type 与 Min/Max 校验要写入的值
+        :return: (是否合法, 规整后的值)；整数类型接受 3.0 这样的整数值浮点并转换为 3
+        """
+        kind, minimum, maximum = self.TagLimits[tag_id]
+        if kind == "string":
+            return isinstance(value, str), value
+        if kind == "bool":
+            if value in (0, 1) and not isinstance(value, float):
+                return True, value
+            return False, value
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False, value
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return False, value
+            if kind == "int":
+                if not value.is_integer():
+                    return False, value
+                value = int(value)
+        if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+            return False, value
+        return True, value
+
+    def tag_values(self):
+        """
+        获取全部标签的实时值（一致快照，不加锁）
+        :return: [(标签 ID, 实时值)] 列表
+        """
+        return list(zip(self.TagIDs, self._values))
+
+    def snapshot(self):
+        """
+        获取全部标签实时值的一致快照（不加锁）
+        :return: {标签 ID: 实时值}
+        """
+        return dict(zip(self.TagIDs, self._values))
+
+
 class DeviceTypeFactory:
     _device_classes = {}
 
@@ -16,59 +266,120 @@ class DeviceTypeFactory:
     def _create_device_class(device_type_id, device_types, json_handler):
         """
         根据设备类型 ID 和设备类型数据创建设备类。
+        :param device_types: 以设备类型 ID 为键的字典（如 JSONHandler.device_types_by_id），或设备类型列表
         """
-        device = next((d for d in device_types if d["ID"] == device_type_id), None)
+        if isinstance(device_types, dict):
+            device = device_types.get(device_type_id)
+        else:
+            device = next((d for d in device_types if d["ID"] == device_type_id), None)
         if not device:
             raise ValueError(f"Device with ID {device_type_id} not found in DeviceTypes")
 
-        # 创建设备类的属性
-        attributes = {
-            'ID': device_type_id,
-            'Name': device["Name"],
-            'DevTypeID': device_type_id,
-            '版本': device["版本"],
-            'Tags': {},  # 用于存储标签的字典
-            'device_infos_handler': json_handler
-        }
-
-        # 处理设备标签
+        # 处理设备标签：元数据按类型共享，实时值只保留初始值模板
+        tag_meta = {}
+        initial_values = []
         for tag in device["Tags"]:
-            tag_id = tag["ID"]
-            attributes['Tags'][tag_id] = {
+            tag_meta[tag["ID"]] = {
                 'ID': tag["ID"],
                 'Name': tag["Name"],
                 'Type': tag["Type"],
                 '起始值': tag["起始值"],
-                '实时值': tag.get("实时值", tag["起始值"]),
                 'RW': tag["RW"]
             }
+            for key in ("Min", "Max"):
+                if key in tag:
+                    # 可选的取值范围，下行写入超出范围时拒绝
+                    tag_meta[tag["ID"]][key] = tag[key]
+            if "Deadband" in tag:
+                # 可选的死区，按变化上报时变化量超过死区才发布
+                tag_meta[tag["ID"]]['Deadband'] = tag["Deadband"]
+            if "Modbus" in tag:
+                # 可选的 Modbus 寄存器映射，例如 {"Address": 0, "Scale": 0.01, "Access": "R"}
+                tag_meta[tag["ID"]]['Modbus'] = tag["Modbus"]
+            initial_values.append(tag.get("实时值", tag["起始值"]))
+        tag_ids = tuple(tag_meta)
+
+        # 创建设备类的属性
+        attributes = {
+            '__slots__': ('ID', 'device_info_id', '_values', '_observers', '_lock'),
+            'Name': device["Name"],
+            'DevTypeID': device_type_id,
+            '版本': device["版本"],
+            'TagMeta': tag_meta,
+            'TagIDs': tag_ids,
+            'TagIndex': {tag_id: index for index, tag_id in enumerate(tag_ids)},
+            'InitialValues': tuple(initial_values),
+            'WritableTags': frozenset(tag_id for tag_id, meta in tag_meta.items() if is_writable(meta['RW'])),
+            'TagLimits': {tag_id: (value_kind(meta['Type']), meta.get('Min', meta.get('Modbus', {}).get('Min')),
+                                   meta.get('Max', meta.get('Modbus', {}).get('Max')))
+                          for tag_id, meta in tag_meta.items()},
+            'device_infos_handler': json_handler
+        }
 
         # 创建设备类并返回
-        device_class = type(device["Name"], (object,), attributes)
+        device_class = type(device["Name"], (DeviceBase,), attributes)
         device_class.__init__ = DeviceTypeFactory.device_instance_init
         return device_class
 
     @staticmethod
     def device_instance_init(self, device_info_id):
         """
-        初始化设备实例，启动定时保存设备状态的定时器。
+        初始化设备实例。定时保存由 schedule_auto_save 注册到调度器统一执行。
         """
+        self.ID = device_info_id
         self.device_info_id = device_info_id
-        # 启动定时器，每10秒执行一次 auto_save
-        threading.Timer(10, DeviceTypeFactory.auto_save, [self, self.device_infos_handler]).start()
+        self._values = list(self.InitialValues)  # 每个实例独立的实时值，写时复制后整体替换
+        self._observers = {}  # 标签 ID（None 表示全部标签）-> [回调]
+        self._lock = threading.Lock()  # 只串行化写入，读取不加锁
 
     @staticmethod
     def auto_save(device_instance, json_handler):
         """
         自动保存设备实例的标签数据到 JSON。
+        所有标签合并为一次批量更新，是否落盘由 JSONHandler 的间隔/阈值决定。
+        """
+        tag_values = device_instance.snapshot()
+        try:
+            # 更新标签的实时值到数据库或存储系统
+            json_handler.update_tags(device_instance.device_info_id, tag_values)
+        except ValueError as e:
+            print(f"错误: {e}")
+
+    @staticmethod
+    def auto_save_all(instances, json_handler):
+        """
+        保存全部设备实例的标签数据，然后按 JSONHandler 的落盘策略统一写盘一次。
+        """
+        for device_instance in instances:
+            DeviceTypeFactory.auto_save(device_instance, json_handler)
+        json_handler.flush_if_due()
+
+    @staticmethod
+    def schedule_auto_save(scheduler, instances, json_handler, interval=10):
         """
-        for tag_name, tag in device_instance.Tags.items():
-            tag_id = tag["ID"]
-            try:
-                # 更新标签的实时值到数据库或存储系统
-                json_handler.update_tag_real_value_by_device_info(device_instance.device_info_id, tag_name=tag_id, real_value=tag["实时值"])
-            except ValueError as e:
-                print(f"错误: {e}")
-        
-        # 重新启动定时器，延迟执行
-        threading.Timer(10, DeviceTypeFactory.auto_save, [device_instance, json_handler]).start()  # 每10秒调用一次
+        在调度器中注册自动保存任务，所有设备实例共用一个任务。
+        通过变化通知记录有标签变化的设备，每次只保存这些设备，没有变化时不做任何工作。
+        :param scheduler: Scheduler 调度器
+        :param instances: 设备实例集合（TagStore 时之后添加的设备也会被跟踪）
+        :param interval: 保存周期（秒），默认 10 秒
+        :return: ScheduledJob
+        """
+        changed = {}  # 设备 ID -> 设备实例
+
+        def on_change(instance, tag_id, old_value, new_value):
+            changed[instance.ID] = instance
+
+        if hasattr(instances, "subscribe"):
+            instances.subscribe(on_change)
+        else:
+            for instance in instances:
+                instance.subscribe(on_change)
+
+        def save_changed():
+            devices = []
+            while changed:
+                devices.append(changed.popitem()[1])
+            DeviceTypeFactory.auto_save_all(devices, json_handler)
+
+        # 落盘要 fsync，asyncio 运行时中交给线程池执行，不阻塞事件循环
+        return scheduler.add_job(save_changed, interval, name="auto_save", blocking=True)
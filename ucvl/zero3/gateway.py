@@ -0,0 +1,127 @@
+from ucvl.zero3.modbus_rtu import RTU
+from ucvl.zero3.rtu_poller import RTUPoller, register_map_from_tag_meta
+from ucvl.zero3.rtu_write_queue import RTUWriteQueue
+from ucvl.zero3.scheduler import Scheduler
+
+# 串口的默认参数，配置中未给出的字段使用这些值
+DEFAULT_SERIAL_SETTINGS = {"baudrate": 9600, "timeout": 1, "parity": 'N', "stopbits": 1, "bytesize": 8}
+# 轮询节拍的下限（秒），读块周期配置得再短也不会更频繁地调度
+MIN_POLL_TICK = 0.05
+
+
+class SerialBus:
+    """
+    一条 RS-485 总线：独立的 RTU 客户端、写队列、轮询引擎和调度线程。
+    同一总线上的读写在自己的线程里串行执行，不同总线之间并行（串口 I/O 会释放 GIL）。
+    调度任务以最短的读块周期为节拍，每拍只读取到期的读块，并按波特率估算的请求耗时把一拍的总线占用控制在节拍以内。
+    """
+
+    def __init__(self, name, port, poll_interval=0.5, write_retry_interval=1, rtu=None, fail_threshold=3,
+                 probe_interval=2.0, max_probe_interval=60.0, **serial_settings):
+        """
+        :param name: 总线名称，DeviceInfos.json 中设备的 "Port" 字段引用它
+        :param port: 串口设备，如 /dev/ttyS5
+        :param poll_interval: 未配置 PollInterval 的读块的轮询周期（秒）
+        :param write_retry_interval: 写入失败后退避重试的检查周期（秒），正常写入由标签变化立即触发
+        :param rtu: 已创建的 RTU（如 RTU.from_client），给定时不再打开 port
+        :param fail_threshold: 从站连续失败多少次判定离线
+        :param probe_interval: 离线从站首次探测的延迟（秒），之后逐次翻倍
+        :param max_probe_interval: 离线从站探测间隔的上限（秒）
+        :param serial_settings: baudrate、timeout、parity、stopbits、bytesize，缺省取 DEFAULT_SERIAL_SETTINGS
+        """
+        settings = dict(DEFAULT_SERIAL_SETTINGS, **serial_settings)
+        self.name = name
+        self.poll_interval = poll_interval
+        self.write_retry_interval = write_retry_interval
+        self.tick = poll_interval
+        self.rtu = rtu if rtu is not None else RTU(port=port, **settings)
+        self.poller = RTUPoller(self.rtu, write_queue=RTUWriteQueue(self.rtu), poll_interval=poll_interval,
+                                fail_threshold=fail_threshold, probe_interval=probe_interval,
+                                max_probe_interval=max_probe_interval)
+        self.scheduler = Scheduler(name=f"rtu-{name}")
+
+    def poll(self):
+        """读取到期的读块，由总线自己的调度线程按节拍调用"""
+        try:
+            self.poller.poll_due(budget=self.tick)
+        except Exception as e:
+            print(f"总线 {self.name} 读写错误：{e}")
+
+    def start(self):
+        """启动总线的轮询与写入任务"""
+        if self.scheduler.get_job(f"rtu_poll_{self.name}") is None:
+            self.tick = max(min(self.poll_interval, self.poller.shortest_interval() or self.poll_interval), MIN_POLL_TICK)
+            self.scheduler.add_job(self.poll, self.tick, name=f"rtu_poll_{self.name}", delay=0)
+            self.scheduler.add_job(self.poller.process_writes, self.write_retry_interval, name=f"rtu_writes_{self.name}")
+            self.poller.on_write_queued = lambda: self.scheduler.trigger_job(f"rtu_writes_{self.name}")
+        self.scheduler.start()
+
+    def stop(self):
+        self.scheduler.shutdown()
+
+
+class Gateway:
+    """
+    配置驱动的多串口网关：按配置创建每条总线，设备按 DeviceInfos.json 中的 "Port" 字段分配到总线。
+    配置格式：{"Ports": {"bus1": {"Port": "/dev/ttyS5", "Baudrate": 9600, ...}, ...}, "DefaultPort": "bus1"}
+    """
+
+    def __init__(self, config):
+        """
+        :param config: 网关配置字典
+        """
+        self.buses = {}
+        for name, port_config in config.get("Ports", {}).items():
+            self.add_bus(name, port_config)
+        self.default_port = config.get("DefaultPort") or next(iter(self.buses), None)
+
+    def add_bus(self, name, port_config):
+        """
+        按配置添加一条总线
+        :param port_config: {"Port": 串口设备, "Baudrate": ..., "Timeout": ..., "Parity": ..., "StopBits": ...,
+                             "ByteSize": ..., "PollInterval": ..., "WriteRetryInterval": ..., "FailThreshold": ...,
+                             "ProbeInterval": ..., "MaxProbeInterval": ...}
+        :return: SerialBus
+        """
+        keys = {"Baudrate": "baudrate", "Timeout": "timeout", "Parity": "parity", "StopBits": "stopbits",
+                "ByteSize": "bytesize", "PollInterval": "poll_interval", "WriteRetryInterval": "write_retry_interval",
+                "FailThreshold": "fail_threshold", "ProbeInterval": "probe_interval",
+                "MaxProbeInterval": "max_probe_interval"}
+        kwargs = {arg: port_config[key] for key, arg in keys.items() if key in port_config}
+        bus = SerialBus(name, port_config["Port"], **kwargs)
+        self.buses[name] = bus
+        return bus
+
+    def add_device(self, instance, device_info, default_read_map=None, default_write_map=None):
+        """
+        把设备加入其所在总线的轮询
+        :param instance: 设备实例
+        :param device_info: DeviceInfos.json 中的设备信息，"Port" 指定总线、"SlaveAddress" 指定从站地址（默认 1），
+                            可选的 "PollInterval" 指定该设备未单独配置周期的标签的轮询周期（秒）
+        :param default_read_map: 设备类型未配置 "Modbus" 字段时使用的读映射
+        :param default_write_map: 设备类型未配置 "Modbus" 字段时使用的写映射
+        :return: PolledDevice；设备没有寄存器映射时返回 None
+        """
+        port = device_info.get("Port", self.default_port)
+        bus = self.buses.get(port)
+        if bus is None:
+            raise ValueError(f"设备 {instance.ID} 配置的串口 {port} 不存在，可选: {list(self.buses)}")
+        read_map = register_map_from_tag_meta(instance.TagMeta, "R") or default_read_map or {}
+        write_map = register_map_from_tag_meta(instance.TagMeta, "W") or default_write_map
+        if not read_map and not write_map:
+            return None
+        return bus.poller.add_device(instance, device_info.get("SlaveAddress", 1), read_map, write_map,
+                                     device_info.get("PollInterval"))
+
+    def start(self):
+        """启动全部总线，每条总线一个线程"""
+        for bus in self.buses.values():
+            bus.start()
+
+    def stop(self):
+        for bus in self.buses.values():
+            bus.stop()
+
+    def devices(self):
+        """获取全部总线上轮询的设备"""
+        return [device for bus in self.buses.values() for device in bus.poller.devices]
@@ -0,0 +1,318 @@
+import threading
+import time
+
+EDGE_RISING = "rising"
+EDGE_FALLING = "falling"
+EDGE_BOTH = "both"
+
+PULL_OFF = "off"
+PULL_DOWN = "down"
+PULL_UP = "up"
+
+
+class WiringPiGPIO:
+    """
+    wiringPi 后端，输入边沿由 wiringPiISR 注册的内核中断触发，回调在 wiringPi 的中断线程中执行
+    """
+
+    def __init__(self):
+        try:
+            import wiringpi
+        except ImportError:
+            raise ImportError("使用 GPIO 需要先安装 wiringpi，或使用 SimulatedGPIO 模拟后端")
+        self._wp = wiringpi
+        self._callbacks = []  # 保持回调的引用，避免被回收
+
+    def setup(self):
+        self._wp.wiringPiSetup()
+
+    def setup_input(self, pin, pull=PULL_DOWN):
+        wp = self._wp
+        wp.pinMode(pin, wp.INPUT)
+        wp.pullUpDnControl(pin, {PULL_OFF: wp.PUD_OFF, PULL_DOWN: wp.PUD_DOWN, PULL_UP: wp.PUD_UP}[pull])
+
+    def setup_output(self, pin):
+        self._wp.pinMode(pin, self._wp.OUTPUT)
+
+    def read(self, pin):
+        return self._wp.digitalRead(pin)
+
+    def write(self, pin, value):
+        self._wp.digitalWrite(pin, value)
+
+    def add_edge_callback(self, pin, edge, callback):
+        """
+        注册边沿中断
+        :param callback: 无参数的回调函数
+        """
+        wp = self._wp
+        mode = {EDGE_RISING: wp.INT_EDGE_RISING, EDGE_FALLING: wp.INT_EDGE_FALLING, EDGE_BOTH: wp.INT_EDGE_BOTH}[edge]
+        self._callbacks.append(callback)
+        wp.wiringPiISR(pin, mode, callback)
+
+
+class SimulatedGPIO:
+    """
+    模拟 GPIO 后端，不依赖硬件。set_level 改变输入电平时同步触发已注册的边沿回调，
+    输出写入记录在 writes 中，便于在开发机上调试。
+    """
+
+    def __init__(self):
+        self.levels = {}
+        self.writes = []  # [(引脚, 值)]
+        self._callbacks = {}  # 引脚 -> [(边沿, 回调)]
+        self._lock = threading.Lock()
+
+    def setup(self):
+        pass
+
+    def setup_input(self, pin, pull=PULL_DOWN):
+        self.levels.setdefault(pin, 1 if pull == PULL_UP else 0)
+
+    def setup_output(self, pin):
+        self.levels.setdefault(pin, 0)
+
+    def read(self, pin):
+        return self.levels.get(pin, 0)
+
+    def write(self, pin, value):
+        with self._lock:
+            self.levels[pin] = value
+            self.writes.append((pin, value))
+
+    def add_edge_callback(self, pin, edge, callback):
+        self._callbacks.setdefault(pin, []).append((edge, callback))
+
+    def set_level(self, pin, level):
+        """模拟外部信号改变输入电平"""
+        old = self.levels.get(pin, 0)
+        self.levels[pin] = level
+        if old == level:
+            return
+        current = EDGE_RISING if level else EDGE_FALLING
+        for edge, callback in self._callbacks.get(pin, []):
+            if edge in (current, EDGE_BOTH):
+                callback()
+
+    def pulse(self, pin, width=0.05):
+        """
+        模拟一个脉冲（上升沿，保持 width 秒后下降沿）
+        :param width: 高电平保持时间（秒），需长于输入的消抖时间才会被确认
+        """
+        self.set_level(pin, 1)
+        time.sleep(width)
+        self.set_level(pin, 0)
+
+
+class DebounceWorker:
+    """
+    消抖确认线程：所有输入共用一个线程，按各输入的确认时间依次确认电平，
+    抖动的触点只是反复推迟确认时间，不会为每个边沿创建线程。线程在第一次安排确认时启动
+    """
+
+    def __init__(self):
+        self._deadlines = {}  # DebouncedInput -> 确认时间（monotonic）
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, gpio_input, delay):
+        """安排（或推迟）一个输入在 delay 秒后确认电平"""
+        with self._cond:
+            self._deadlines[gpio_input] = time.monotonic() + delay
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="gpio-debounce")
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._deadlines:
+                    self._cond.wait()
+                gpio_input, deadline = min(self._deadlines.items(), key=lambda item: item[1])
+                wait = deadline - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue  # 等待期间可能有新的边沿推迟了确认时间，重新选择
+                del self._deadlines[gpio_input]
+            gpio_input.settle()
+
+
+class DebouncedInput:
+    """
+    一个带软件消抖的中断输入。边沿状态保存在对象自身，多个输入之间互不影响。
+    消抖采用电平确认：双边沿都注册中断，任一边沿都把确认时间推迟到 debounce 秒后，
+    电平保持 debounce 秒不变后才确认为新的稳定电平，稳定电平的变化与 edge 相符时才调用回调。
+    按下和松开时的触点抖动都只会确认一次；长于 debounce 的脉冲不会漏掉。
+    """
+
+    def __init__(self, backend, pin, callback, edge=EDGE_RISING, pull=PULL_DOWN, debounce=0.02, worker=None):
+        """
+        :param callback: 边沿回调，参数为 (引脚, 当前电平)，在消抖确认线程中调用
+        :param debounce: 消抖时间（秒）
+        :param worker: 共用的 DebounceWorker，默认为该输入单独创建一个
+        """
+        self.backend = backend
+        self.pin = pin
+        self.callback = callback
+        self.edge = edge
+        self.pull = pull
+        self.debounce = debounce
+        self.worker = worker if worker is not None else DebounceWorker()
+        self.last_edge = None   # 上次接受边沿的时间
+        self.level = None       # 已确认的稳定电平
+        self.accepted = 0
+        self.bounced = 0
+        self._settling = False  # 是否已安排确认，期间的边沿都是抖动
+
+    def start(self):
+        self.backend.setup_input(self.pin, self.pull)
+        self.level = self.backend.read(self.pin)
+        self.backend.add_edge_callback(self.pin, EDGE_BOTH, self._on_edge)
+
+    def _on_edge(self):
+        """任一边沿都把确认时间推迟到 debounce 秒后"""
+        if self._settling:
+            self.bounced += 1
+        self._settling = True
+        self.worker.schedule(self, self.debounce)
+
+    def settle(self):
+        """电平已保持 debounce 秒：与稳定电平不同则确认变化，由 DebounceWorker 调用"""
+        self._settling = False
+        level = self.backend.read(self.pin)
+        if level == self.level:
+            self.bounced += 1
+            return
+        self.level = level
+        if self.edge not in (EDGE_RISING if level else EDGE_FALLING, EDGE_BOTH):
+            return
+        self.last_edge = time.monotonic()
+        self.accepted += 1
+        try:
+            self.callback(self.pin, level)
+        except Exception as e:
+            print(f"GPIO {self.pin} 回调错误：{e}")
+
+
+class GPIOOutput:
+    """
+    输出引脚，只在值变化时写入
+    """
+
+    def __init__(self, backend, pin, source=None, initial=None):
+        """
+        :param source: 无参数函数，返回引脚应输出的值；用 refresh 按它更新输出
+        :param initial: 启动时写入的初始值，None 表示等第一次 set/refresh
+        """
+        self.backend = backend
+        self.pin = pin
+        self.source = source
+        self.initial = initial
+        self.value = None
+        self.writes = 0
+
+    def start(self):
+        self.backend.setup_output(self.pin)
+        if self.initial is not None:
+            self.set(self.initial)
+
+    def set(self, value):
+        """
+        设置输出值
+        :return: 是否实际写了引脚
+        """
+        value = 1 if value else 0
+        if value == self.value:
+            return False
+        self.backend.write(self.pin, value)
+        self.value = value
+        self.writes += 1
+        return True
+
+    def refresh(self):
+        """按 source 计算输出值，变化时写入"""
+        if self.source is None:
+            return False
+        try:
+            value = self.source()
+        except Exception as e:
+            print(f"GPIO {self.pin} 输出取值错误：{e}")
+            return False
+        return self.set(value)
+
+
+class GPIOController:
+    """
+    GPIO 子系统：输入由边沿中断驱动并消抖，输出只在值变化时写入。
+    后端默认为 wiringPi，开发调试时传入 SimulatedGPIO。
+    """
+
+    def __init__(self, backend=None, debounce=0.02):
+        """
+        :param backend: GPIO 后端，默认 WiringPiGPIO
+        :param debounce: 输入默认的消抖时间（秒）
+        """
+        self.backend = backend if backend is not None else WiringPiGPIO()
+        self.debounce = debounce
+        self.debouncer = DebounceWorker()  # 全部输入共用一个消抖确认线程
+        self.inputs = {}
+        self.outputs = {}
+        self._started = False
+
+    def add_input(self, pin, callback, edge=EDGE_RISING, pull=PULL_DOWN, debounce=None):
+        """
+        添加中断输入
+        :param callback: 边沿回调，参数为 (引脚, 当前电平)
+        :return: DebouncedInput
+        """
+        gpio_input = DebouncedInput(self.backend, pin, callback, edge, pull,
+                                    self.debounce if debounce is None else debounce, self.debouncer)
+        self.inputs[pin] = gpio_input
+        if self._started:
+            gpio_input.start()
+        return gpio_input
+
+    def add_output(self, pin, source=None, initial=None):
+        """
+        添加输出
+        :param source: 无参数函数，返回引脚应输出的值
+        :return: GPIOOutput
+        """
+        output = GPIOOutput(self.backend, pin, source, initial)
+        self.outputs[pin] = output
+        if self._started:
+            output.start()
+        return output
+
+    def bind_output(self, pin, instance, tag_id, transform=bool):
+        """
+        添加由设备标签驱动的输出：订阅标签变化，值变化时立即刷新引脚
+        :param instance: 设备实例
+        :param tag_id: 源标签 ID
+        :param transform: 把标签值转换为输出值的函数
+        :return: GPIOOutput
+        """
+        output = self.add_output(pin, source=lambda: transform(instance.get_tag_value(tag_id)))
+        instance.subscribe(lambda inst, changed_tag, old_value, new_value: output.refresh(), (tag_id,))
+        return output
+
+    def start(self):
+        """初始化后端，配置引脚并注册中断"""
+        if self._started:
+            return
+        self.backend.setup()
+        for output in self.outputs.values():
+            output.start()
+        for gpio_input in self.inputs.values():
+            gpio_input.start()
+        self._started = True
+        self.refresh_outputs()
+
+    def refresh_outputs(self):
+        """
+        按各输出的 source 更新引脚，值未变化的不写
+        :return: 实际写入的引脚数
+        """
+        return sum(1 for output in list(self.outputs.values()) if output.refresh())
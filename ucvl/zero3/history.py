@@ -0,0 +1,156 @@
+import sqlite3
+import threading
+import time
+from ucvl.zero3.metrics import REGISTRY
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    device_type_id INTEGER NOT NULL,
+    device_id INTEGER NOT NULL,
+    tag_id INTEGER NOT NULL,
+    value,
+    forwarded INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS samples_tag_ts ON samples (device_id, tag_id, ts);
+CREATE INDEX IF NOT EXISTS samples_pending ON samples (id) WHERE forwarded = 0;
+"""
+
+
+class TagHistory:
+    """
+    基于 SQLite 的本地标签历史缓冲区。
+    标签变化先记在内存里，由 flush 批量写入（一次事务）；与 MQTT 断开期间的采样标记为未转发，
+    重连后由 MQTTClient 按批次限速补发。按保留时长和最大行数淘汰旧数据。
+    """
+
+    def __init__(self, path, retention=7 * 24 * 3600, max_rows=2000000):
+        """
+        :param path: SQLite 数据库文件路径
+        :param retention: 保留时长（秒），更早的采样在 prune 时删除
+        :param max_rows: 最多保留的采样数，超出时先淘汰最旧的已转发采样，仍超出再淘汰最旧的未转发采样
+        """
+        self.path = path
+        self.retention = retention
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._buffer = []  # 尚未写入数据库的 (时间戳, 设备类型 ID, 设备 ID, 标签 ID, 值, 是否已转发)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+        # 统计
+        self.recorded = 0
+        self.evicted = 0
+        labels = {"file": path}
+        REGISTRY.counter("zero3_history_recorded_total", "记录的历史采样数", labels, func=lambda: self.recorded)
+        REGISTRY.counter("zero3_history_evicted_total", "因保留策略淘汰的历史采样数", labels, func=lambda: self.evicted)
+        REGISTRY.gauge("zero3_history_pending", "等待补发的历史采样数", labels, func=self.pending_count)
+
+    def record(self, device_type_id, device_id, tag_id, value, forwarded=False, ts=None):
+        """
+        记录一个采样（只写内存缓冲，由 flush 批量落盘）
+        :param forwarded: 采样是否已经实时发布过，未发布的在重连后补发
+        """
+        sample = (time.time() if ts is None else ts, device_type_id, device_id, tag_id, value, int(forwarded))
+        with self._lock:
+            self._buffer.append(sample)
+
+    def flush(self):
+        """
+        把内存缓冲中的采样一次事务写入数据库
+        :return: 写入的采样数
+        """
+        with self._lock:
+            samples, self._buffer = self._buffer, []
+            if not samples:
+                return 0
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO samples (ts, device_type_id, device_id, tag_id, value, forwarded) VALUES (?, ?, ?, ?, ?, ?)",
+                    samples)
+            self.recorded += len(samples)
+            return len(samples)
+
+    def prune(self, now=None):
+        """
+        按保留时长与最大行数淘汰旧采样
+        :return: 删除的采样数
+        """
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            deleted = self._conn.execute("DELETE FROM samples WHERE ts < ?", (now - self.retention,)).rowcount
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM samples").fetchone()
+            excess = count - self.max_rows
+            if excess > 0:
+                for forwarded in (1, 0):
+                    removed = self._conn.execute(
+                        "DELETE FROM samples WHERE id IN (SELECT id FROM samples WHERE forwarded = ? ORDER BY id LIMIT ?)",
+                        (forwarded, excess)).rowcount
+                    deleted += removed
+                    excess -= removed
+                    if excess <= 0:
+                        break
+            self.evicted += deleted
+            return deleted
+
+    def pending_count(self):
+        """等待补发的采样数（含内存缓冲中未转发的采样）"""
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM samples WHERE forwarded = 0").fetchone()
+            return count + sum(1 for sample in self._buffer if not sample[5])
+
+    def pending(self, limit=500):
+        """
+        按时间顺序取出一批未转发的采样
+        :return: [(行 ID, 时间戳, 设备类型 ID, 设备 ID, 标签 ID, 值)]
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, ts, device_type_id, device_id, tag_id, value FROM samples WHERE forwarded = 0 ORDER BY id LIMIT ?",
+                (limit,)).fetchall()
+
+    def mark_forwarded(self, row_ids):
+        """把已补发的采样标记为已转发"""
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE samples SET forwarded = 1 WHERE id = ?", [(row_id,) for row_id in row_ids])
+
+    def query(self, device_id, tag_id, since=None, until=None, limit=None):
+        """
+        查询某个标签的历史
+        :param since: 起始时间戳（含），None 表示不限
+        :param until: 结束时间戳（含），None 表示不限
+        :param limit: 最多返回的条数（取最新的），None 表示不限
+        :return: 按时间升序的 [(时间戳, 值)]
+        """
+        self.flush()
+        sql = "SELECT ts, value FROM samples WHERE device_id = ? AND tag_id = ?"
+        params = [device_id, tag_id]
+        if since is not None:
+            sql += " AND ts >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND ts <= ?"
+            params.append(until)
+        sql += " ORDER BY ts DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        rows.reverse()
+        return rows
+
+    def recent(self, device_id, tag_id, seconds=600):
+        """
+        查询最近一段时间的历史，例如最近 10 分钟的阀门开度
+        :return: 按时间升序的 [(时间戳, 值)]
+        """
+        return self.query(device_id, tag_id, since=time.time() - seconds)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
@@ -1,10 +1,158 @@
 import json
 import os
+import threading
+import time
+from ucvl.zero3.metrics import REGISTRY
+
+
+def fsync_directory(path):
+    """
+    同步文件所在目录，使新建、重命名的目录项落盘。os.replace 之后不同步目录的话，
+    断电后可能看到的仍是旧文件。不支持打开目录的平台（Windows）上跳过
+    """
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class TagChangeLog:
+    """
+    标签变化的追加日志（预写日志）。
+    每条记录一行紧凑 JSON：[设备信息 ID, 标签 ID, 实时值]，记录的是变化后的值而不是增量，
+    因此重复回放是幂等的。断电时最后一行可能只写了一半，回放时丢弃并截断。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def replay(self):
+        """
+        读取日志中的全部完整记录，末尾不完整的记录会被截掉
+        :return: [(设备信息 ID, 标签 ID, 实时值)]
+        """
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as file:
+            content = file.read()
+        records = []
+        good_size = 0
+        for line in content.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                # 最后一行缺少换行符：即使能解析也是写到一半的记录，不截断的话下一次追加会接在它后面
+                print(f"日志 {self.path} 在 {good_size} 字节处不完整，丢弃之后的内容")
+                break
+            try:
+                device_info_id, tag_id, real_value = json.loads(line.decode('utf-8'))
+            except (ValueError, UnicodeDecodeError):
+                print(f"日志 {self.path} 在 {good_size} 字节处不完整，丢弃之后的内容")
+                break
+            records.append((device_info_id, tag_id, real_value))
+            good_size += len(line)
+        if good_size != len(content):
+            with open(self.path, 'r+b') as file:
+                file.truncate(good_size)
+                os.fsync(file.fileno())
+        self.size = good_size
+        return records
+
+    def append(self, records):
+        """
+        追加一批记录并 fsync，一批只同步一次
+        :return: 写入的字节数
+        """
+        if not records:
+            return 0
+        content = ''.join(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+                          for record in records).encode('utf-8')
+        created = False
+        if self._file is None:
+            created = not os.path.exists(self.path)
+            self._file = open(self.path, 'ab')
+        self._file.write(content)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        if created:
+            fsync_directory(self.path)
+        self.size += len(content)
+        return len(content)
+
+    def reset(self):
+        """清空日志（快照已包含全部记录之后调用）"""
+        self.close()
+        with open(self.path, 'wb') as file:
+            os.fsync(file.fileno())
+        self.size = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
 
 class JSONHandler:
-    def __init__(self, file_path):
+    def __init__(self, file_path, flush_interval=10, flush_threshold=None, indent=4, wal=False, compact_bytes=256 * 1024):
+        """
+        :param file_path: JSON 文件路径
+        :param flush_interval: 脏数据最长驻留时间（秒），到期后由 flush_if_due 落盘
+        :param flush_threshold: 脏标签数量阈值，达到后立即落盘；None 表示不按数量触发
+        :param indent: 写文件时的缩进，None 表示紧凑格式（写入字节更少）
+        :param wal: 为 True 时标签变化以追加方式写入 {file_path}.wal 日志，JSON 文件只作为快照，
+                    启动时由快照 + 日志回放恢复状态
+        :param compact_bytes: 日志超过该大小时压缩：重写快照并清空日志
+        """
         self.file_path = file_path
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.indent = indent
+        self.compact_bytes = compact_bytes
+        self._lock = threading.RLock()
+        self.wal = TagChangeLog(f"{file_path}.wal") if wal else None
+        self._pending = []  # 尚未写入日志的 (设备信息 ID, 标签 ID, 实时值)
+
+        # 写合并状态：只记录有变化的标签，落盘时一次性写入
+        self.dirty_count = 0
+        self.last_flush_time = time.time()
+
+        # 落盘统计
+        self.flush_count = 0
+        self.last_flush_duration = 0.0
+        self.last_flush_bytes = 0
+        self.total_bytes_written = 0
+
+        file_label = {"file": os.path.basename(file_path)}
+        self._save_seconds = REGISTRY.histogram("zero3_json_save_seconds", "JSON 落盘耗时（秒）", file_label)
+        self._save_bytes = REGISTRY.counter("zero3_json_save_bytes_total", "JSON 落盘写入字节数", file_label)
+        REGISTRY.gauge("zero3_json_dirty_tags", "尚未落盘的脏标签数", file_label, func=lambda: self.dirty_count)
+
         self.data = self.load_json()
+        self.build_indexes()
+        if self.wal is not None:
+            REGISTRY.gauge("zero3_json_wal_bytes", "标签变化日志大小（字节）", file_label, func=lambda: self.wal.size)
+            self.replay_wal()
+
+    def replay_wal(self):
+        """
+        把日志中的记录回放到快照数据上，日志超过压缩阈值时立即压缩
+        :return: 回放的记录数
+        """
+        with self._lock:
+            records = self.wal.replay()
+            for device_info_id, tag_id, real_value in records:
+                tag = self._tag_index.get((device_info_id, tag_id))
+                if tag is not None:
+                    tag["实时值"] = real_value
+            if records:
+                print(f"从日志恢复 {len(records)} 条标签记录")
+            if self.wal.size >= self.compact_bytes:
+                self.save_json()
+            return len(records)
 
     def load_json(self):
         """加载 JSON 文件内容"""
@@ -13,10 +161,119 @@ class JSONHandler:
         with open(self.file_path, 'r', encoding='utf-8') as file:
             return json.load(file)
 
+    def build_indexes(self):
+        """
+        为 DeviceTypes / DeviceInfos 建立按 ID 的索引，查找不再线性扫描。
+        直接修改 self.data 的结构（增删设备或标签）后需要重新调用。
+        """
+        with self._lock:
+            self.device_types_by_id = {device["ID"]: device for device in self.data.get("DeviceTypes", [])}
+            self.device_infos_by_id = {}
+            self._tag_index = {}
+            for device_info in self.data.get("DeviceInfos", []):
+                self.device_infos_by_id[device_info["ID"]] = device_info
+                for tag in device_info.get("Tags", []):
+                    self._tag_index[(device_info["ID"], tag["ID"])] = tag
+
     def save_json(self):
-        """保存当前数据到 JSON 文件"""
-        with open(self.file_path, 'w', encoding='utf-8') as file:
-            json.dump(self.data, file, ensure_ascii=False, indent=4)
+        """
+        保存当前数据到 JSON 文件。
+        先写临时文件并 fsync，再用 os.replace 原子替换，断电时不会留下写了一半的文件。
+        启用日志时这就是压缩：快照已包含全部变化，替换完成后清空日志。
+        """
+        with self._lock:
+            start = time.perf_counter()
+            content = json.dumps(self.data, ensure_ascii=False, indent=self.indent).encode('utf-8')
+            tmp_path = f"{self.file_path}.tmp"
+            with open(tmp_path, 'wb') as file:
+                file.write(content)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.file_path)
+            # 重命名落盘之后才能清空日志，否则断电后可能是旧快照加上已清空的日志
+            fsync_directory(self.file_path)
+            if self.wal is not None:
+                # 快照替换成功后再清空日志，中间断电时回放的是快照中已有的值
+                self._pending = []
+                self.wal.reset()
+
+            self.dirty_count = 0
+            self.last_flush_time = time.time()
+            self.flush_count += 1
+            self.last_flush_duration = time.perf_counter() - start
+            self.last_flush_bytes = len(content)
+            self.total_bytes_written += len(content)
+            self._save_seconds.observe(self.last_flush_duration)
+            self._save_bytes.inc(len(content))
+
+    def _write_dirty(self):
+        """
+        写出脏数据：启用日志时把变化追加到日志（一批一次 fsync），日志过大时压缩；否则整体重写文件
+        """
+        if self.wal is None:
+            self.save_json()
+            return
+        start = time.perf_counter()
+        records, self._pending = self._pending, []
+        written = self.wal.append(records)
+        self.dirty_count = 0
+        self.last_flush_time = time.time()
+        self.flush_count += 1
+        self.last_flush_duration = time.perf_counter() - start
+        self.last_flush_bytes = written
+        self.total_bytes_written += written
+        self._save_seconds.observe(self.last_flush_duration)
+        self._save_bytes.inc(written)
+        if self.wal.size >= self.compact_bytes:
+            self.save_json()
+
+    def flush(self, force=False):
+        """
+        将内存中的脏数据写入磁盘
+        :param force: 为 True 时即使没有脏数据也重写整个文件（启用日志时即压缩）
+        :return: 是否执行了写入
+        """
+        with self._lock:
+            if force:
+                self.save_json()
+                return True
+            if self.dirty_count == 0:
+                return False
+            self._write_dirty()
+            return True
+
+    def flush_if_due(self):
+        """
+        有脏数据且距离上次落盘已超过 flush_interval 时写入磁盘
+        :return: 是否执行了写入
+        """
+        with self._lock:
+            if self.dirty_count == 0:
+                return False
+            if time.time() - self.last_flush_time < self.flush_interval:
+                return False
+            self._write_dirty()
+            return True
+
+    def get_flush_stats(self):
+        """
+        获取落盘统计信息
+        :return: 包含落盘次数、最近一次耗时（秒）与写入字节数的字典
+        """
+        with self._lock:
+            return {
+                'dirty_count': self.dirty_count,
+                'flush_count': self.flush_count,
+                'last_flush_duration': self.last_flush_duration,
+                'last_flush_bytes': self.last_flush_bytes,
+                'total_bytes_written': self.total_bytes_written,
+            }
+
+    def _mark_dirty(self, count):
+        """记录脏标签数量，达到阈值时立即落盘"""
+        self.dirty_count += count
+        if self.flush_threshold is not None and self.dirty_count >= self.flush_threshold:
+            self._write_dirty()
 
     def update_tag_real_value(self, device_type_id, tag_name, real_value):
         """
@@ -25,12 +282,18 @@ class JSONHandler:
         :param tag_name: 需要更新的标签名
         :param real_value: 要更新的实时值
         """
-        for device in self.data.get("DeviceTypes", []):
-            if device["ID"] == device_type_id:
+        with self._lock:
+            device = self.device_types_by_id.get(device_type_id)
+            if device is not None:
                 for tag in device.get("Tags", []):
                     if tag["Name"] == tag_name:
-                        tag["实时值"] = real_value
-                        self.save_json()
+                        if tag.get("实时值") != real_value:
+                            tag["实时值"] = real_value
+                            if self.wal is not None:
+                                # 日志只记录 DeviceInfos 的标签，设备类型的改动直接写快照
+                                self.save_json()
+                            else:
+                                self._mark_dirty(1)
                         return
         raise ValueError(f"未找到设备类型 ID 为 {device_type_id} 且标签名为 {tag_name} 的条目")
 
@@ -40,11 +303,50 @@ class JSONHandler:
         :param device_type_id: 设备类型 ID
         :return: 设备类型信息字典
         """
-        for device in self.data.get("DeviceTypes", []):
-            if device["ID"] == device_type_id:
-                return device
+        device = self.device_types_by_id.get(device_type_id)
+        if device is not None:
+            return device
         raise ValueError(f"未找到 ID 为 {device_type_id} 的设备类型")
 
+    def get_device_info(self, device_info_id):
+        """
+        根据设备信息 ID 获取 DeviceInfos 中的设备信息
+        :param device_info_id: 设备信息的 ID
+        :return: 设备信息字典
+        """
+        device_info = self.device_infos_by_id.get(device_info_id)
+        if device_info is not None:
+            return device_info
+        raise ValueError(f"未找到设备信息 ID 为 {device_info_id} 的条目")
+
+    def update_tags(self, device_info_id, tag_values):
+        """
+        批量更新 DeviceInfos 中某个设备的标签实时值，只在内存中标记脏数据，不立即写盘
+        :param device_info_id: 设备信息的 ID
+        :param tag_values: {标签 ID: 实时值} 字典
+        :return: 实际发生变化的标签数量
+        """
+        with self._lock:
+            if device_info_id not in self.device_infos_by_id:
+                raise ValueError(f"未找到设备信息 ID 为 {device_info_id} 的条目")
+
+            changed = 0
+            missing = []
+            for tag_id, real_value in tag_values.items():
+                tag = self._tag_index.get((device_info_id, tag_id))
+                if tag is None:
+                    missing.append(tag_id)
+                elif tag.get("实时值") != real_value:
+                    tag["实时值"] = real_value
+                    changed += 1
+                    if self.wal is not None:
+                        self._pending.append((device_info_id, tag_id, real_value))
+            if changed:
+                self._mark_dirty(changed)
+            if missing:
+                raise ValueError(f"未找到设备信息 ID 为 {device_info_id} 且标签名为 {missing} 的条目")
+            return changed
+
     def update_tag_real_value_by_device_info(self, device_info_id, tag_name, real_value):
         """
         根据设备信息 ID 更新 DeviceInfos 中的标签实时值
@@ -52,24 +354,4 @@ class JSONHandler:
         :param tag_name: 需要更新的标签名
         :param real_value: 要更新的实时值
         """
-        #print(f"准备更新设备信息 ID: {device_info_id}, 标签: {tag_name}, 实时值: {real_value}")
-        found_device_info = False
-        for device_info in self.data.get("DeviceInfos", []):
-            if device_info["ID"] == device_info_id:
-                found_device_info = True
-                #print(f"找到设备信息: {device_info}")  # 打印找到的设备信息
-                found_tag = False
-                for tag in device_info.get("Tags", []):
-                    if tag["ID"] == tag_name:
-                        found_tag = True
-                        #print(f"找到标签: {tag}")  # 打印找到的标签
-                        tag["实时值"] = real_value
-                        self.save_json()
-                        return
-                if not found_tag:
-                    print(f"未找到标签名: {tag_name}，当前设备信息中的标签为: {device_info.get('Tags', [])}")
-        if not found_device_info:
-            print(f"未找到设备信息 ID: {device_info_id}")
-        raise ValueError(f"未找到设备信息 ID 为 {device_info_id} 且标签名为 {tag_name} 的条目")
-
-
+        self.update_tags(device_info_id, {tag_name: real_value})
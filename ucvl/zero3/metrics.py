@@ -0,0 +1,260 @@
+import bisect
+import threading
+import time
+
+# 默认的耗时直方图分桶（秒），覆盖 9600 波特率下单次 Modbus 事务到整轮轮询的范围
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+class Counter:
+    """只增不减的计数器；设置 func 后每次读取时调用它取值（用于导出已有的统计字段）"""
+    kind = "counter"
+
+    def __init__(self, func=None):
+        self._value = 0
+        self._func = func
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def set_function(self, func):
+        self._func = func
+
+    @property
+    def value(self):
+        if self._func is not None:
+            try:
+                return self._func()
+            except Exception:
+                return float("nan")
+        return self._value
+
+    def samples(self, name, labels):
+        yield f"{name}{_format_labels(labels)} {self.value}"
+
+
+class Gauge:
+    """可增可减的瞬时值；设置 func 后每次读取时调用它取值"""
+    kind = "gauge"
+
+    def __init__(self, func=None):
+        self._value = 0
+        self._func = func
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        self._value += amount
+
+    def dec(self, amount=1):
+        self._value -= amount
+
+    def set_function(self, func):
+        self._func = func
+
+    @property
+    def value(self):
+        if self._func is not None:
+            try:
+                return self._func()
+            except Exception:
+                return float("nan")
+        return self._value
+
+    def samples(self, name, labels):
+        yield f"{name}{_format_labels(labels)} {self.value}"
+
+
+class Histogram:
+    """固定分桶的直方图"""
+    kind = "histogram"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def time(self):
+        """用作上下文管理器，记录代码块耗时"""
+        return _Timer(self)
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def sum(self):
+        return self._sum
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            yield f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}"
+        yield f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}"
+        yield f"{name}_sum{_format_labels(labels)} {total}"
+        yield f"{name}_count{_format_labels(labels)} {count}"
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """
+    指标注册表。同名同标签的指标只创建一次，重复获取返回同一对象。
+    """
+
+    def __init__(self):
+        self._metrics = {}  # 名称 -> (类型, 说明, {标签元组: 指标})
+        self._lock = threading.Lock()
+
+    def _get(self, name, help_text, labels, metric_class, factory=None):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            kind, _, children = self._metrics.setdefault(name, (metric_class.kind, help_text, {}))
+            if kind != metric_class.kind:
+                raise ValueError(f"指标 {name} 已注册为 {kind}")
+            metric = children.get(key)
+            if metric is None:
+                metric = children[key] = (factory or metric_class)()
+            return metric
+
+    def counter(self, name, help_text="", labels=None, func=None):
+        counter = self._get(name, help_text, labels, Counter)
+        if func is not None:
+            counter.set_function(func)
+        return counter
+
+    def gauge(self, name, help_text="", labels=None, func=None):
+        gauge = self._get(name, help_text, labels, Gauge)
+        if func is not None:
+            gauge.set_function(func)
+        return gauge
+
+    def histogram(self, name, help_text="", labels=None, buckets=DEFAULT_BUCKETS):
+        return self._get(name, help_text, labels, Histogram, lambda: Histogram(buckets))
+
+    def render_prometheus(self):
+        """
+        按 Prometheus 文本格式输出全部指标
+        """
+        with self._lock:
+            metrics = [(name, kind, help_text, list(children.items()))
+                       for name, (kind, help_text, children) in sorted(self._metrics.items())]
+        lines = []
+        for name, kind, help_text, children in metrics:
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in children:
+                lines.extend(metric.samples(name, labels))
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        获取指标的简要快照（计数器/仪表为值，直方图为次数与总和），用于 MQTT 上报
+        :return: {"名称{标签}": 值}
+        """
+        with self._lock:
+            metrics = [(name, list(children.items())) for name, (_, _, children) in self._metrics.items()]
+        result = {}
+        for name, children in metrics:
+            for labels, metric in children:
+                key = f"{name}{_format_labels(labels)}"
+                if isinstance(metric, Histogram):
+                    result[f"{key}_count"] = metric.count
+                    result[f"{key}_sum"] = metric.sum
+                else:
+                    result[key] = metric.value
+        return result
+
+
+# 进程内默认注册表，各模块的指标都注册在这里
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    """
+    本地 Prometheus 文本格式导出器，默认只监听 127.0.0.1
+    """
+
+    def __init__(self, registry=REGISTRY, host="127.0.0.1", port=9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+
+    def start(self):
+        """
+        在后台线程中启动 HTTP 服务，访问 /metrics 获取指标。
+        导出是可选的本地功能，端口被占用等错误只打印，不影响网关运行
+        :return: 是否启动成功
+        """
+        # http.server 连带导入 email 等模块，只在开启导出时才导入
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # 不打印每次抓取的访问日志
+
+        try:
+            self._server = HTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            print(f"指标导出启动失败（{self.host}:{self.port}）：{e}")
+            return False
+        thread = threading.Thread(target=self._server.serve_forever, name="metrics-http")
+        thread.daemon = True
+        thread.start()
+        print(f"指标导出地址: http://{self.host}:{self._server.server_port}/metrics")
+        return True
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
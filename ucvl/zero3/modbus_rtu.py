@@ -1,7 +1,44 @@
-from pymodbus.client import ModbusSerialClient as ModbusClient
+import time
+from ucvl.zero3.metrics import REGISTRY
+
+# Modbus 协议单次读保持寄存器（功能码 3）的最大数量
+MAX_READ_REGISTERS = 125
+# Modbus 协议单次写多个寄存器（功能码 16）的最大数量
+MAX_WRITE_REGISTERS = 123
+
+def classify_error(error):
+    """
+    把 pymodbus 异常归类为 timeout（无应答/CRC 校验失败导致的帧丢弃）或 error
+    """
+    name = type(error).__name__
+    return "timeout" if "IO" in name or "Timeout" in name else "error"
+
+
+def classify_result(result):
+    """
+    归类 isError() 为真的应答。pymodbus 把无应答、CRC 校验失败作为 ModbusIOException 对象返回而不是抛出，
+    这类结果按 classify_error 归类；只有从站返回的 Modbus 异常应答记为 exception
+    """
+    return classify_error(result) if isinstance(result, Exception) else "exception"
+
+
+def frame_timing(baudrate, bytesize=8, parity='N', stopbits=1):
+    """
+    按串口参数计算 Modbus RTU 的字符时间与帧间静默时间
+    :return: (字符时间, 帧间隔)，单位秒；波特率高于 19200 时帧间隔按协议固定为 1.75 ms
+    """
+    bits = 1 + bytesize + (0 if parity == 'N' else 1) + stopbits
+    char_time = bits / baudrate
+    return char_time, (0.00175 if baudrate > 19200 else 3.5 * char_time)
+
+
 class RTU:
     def __init__(self, port, baudrate, timeout, parity, stopbits, bytesize):
+        self._init_metrics(port)
+        self.char_time, self.frame_gap = frame_timing(baudrate, bytesize, parity, stopbits)
         try:
+            # 延迟导入 pymodbus，只在真正打开串口时才需要
+            from pymodbus.client import ModbusSerialClient as ModbusClient
             self.client = ModbusClient(
                 port=port,
                 baudrate=baudrate,
@@ -20,16 +57,51 @@ class RTU:
             print(f"初始化失败: {e}")
             self.client = None
 
+    @classmethod
+    def from_client(cls, client, port, baudrate=None):
+        """
+        用已连接的 pymodbus 客户端创建，不打开串口，例如基准测试中连接模拟从站的 TCP（RTU 帧）客户端
+        :param client: pymodbus 客户端
+        :param port: 用作指标标签的名称
+        :param baudrate: 用于估算请求耗时的波特率，None 表示不计线路时间
+        """
+        rtu = cls.__new__(cls)
+        rtu._init_metrics(port)
+        rtu.char_time, rtu.frame_gap = frame_timing(baudrate) if baudrate else (0.0, 0.0)
+        rtu.client = client
+        return rtu
+
+    def read_time(self, count):
+        """
+        估算读 count 个保持寄存器的线路耗时（秒）：请求 8 字节、应答 5 + 2×count 字节，加两次帧间隔，不含从站处理时间
+        """
+        return (13 + 2 * count) * self.char_time + 2 * self.frame_gap
+
+    def _init_metrics(self, port):
+        self.port = port
+        self._latency = {op: REGISTRY.histogram("zero3_modbus_request_seconds", "Modbus 请求往返耗时（秒）",
+                                                {"port": port, "op": op}) for op in ("read", "write")}
+
+    def _count(self, op, result):
+        REGISTRY.counter("zero3_modbus_requests_total", "Modbus 请求次数（按结果分类）",
+                         {"port": self.port, "op": op, "result": result}).inc()
+
     def read_holding_registers(self, DataAddress, DataCount, SlaveAddress):
         if self.client:
+            start = time.perf_counter()
             try:
                 self.client.unit_id = SlaveAddress  
                 result = self.client.read_holding_registers(address=DataAddress, count=DataCount, slave=SlaveAddress)
+                self._latency["read"].observe(time.perf_counter() - start)
                 if result.isError():
+                    self._count("read", classify_result(result))
                     print("读取错误")
                     return None
+                self._count("read", "ok")
                 return result.registers
             except Exception as e:
+                self._latency["read"].observe(time.perf_counter() - start)
+                self._count("read", classify_error(e))
                 print(f"读取失败: {e}")
                 return None
         else:
@@ -37,15 +109,27 @@ class RTU:
             return None
 
     def write_holding_registers(self, SlaveAddress, Data, DataAddress, DataCount):
+        """
+        写保持寄存器：单个寄存器用功能码 6，连续多个寄存器用功能码 16 一次写入
+        """
         if self.client:
+            start = time.perf_counter()
             try:
-                for i, value in enumerate(Data[:DataCount]):
-                    result = self.client.write_register(address=DataAddress + i, value=value, slave=SlaveAddress)
-                    if result.isError():
-                        print("写入错误")
-                        return False
+                values = list(Data[:DataCount])
+                if len(values) == 1:
+                    result = self.client.write_register(address=DataAddress, value=values[0], slave=SlaveAddress)
+                else:
+                    result = self.client.write_registers(address=DataAddress, values=values, slave=SlaveAddress)
+                self._latency["write"].observe(time.perf_counter() - start)
+                if result.isError():
+                    self._count("write", classify_result(result))
+                    print("写入错误")
+                    return False
+                self._count("write", "ok")
                 return True
             except Exception as e:
+                self._latency["write"].observe(time.perf_counter() - start)
+                self._count("write", classify_error(e))
                 print(f"写入失败: {e}")
                 return False
         else:
@@ -1,88 +1,482 @@
+import collections
+import queue
+import random
 import threading
-import paho.mqtt.client as mqtt
-import json
+import struct
 import time
+from collections.abc import Hashable
+from ucvl.zero3.tag_store import TagStore
+from ucvl.zero3.payload_codec import JSONCodec, StructCodec, get_codec, codec_for_topic
+from ucvl.zero3.metrics import REGISTRY
+
+# 发布模式：每周期发布全部标签 / 只发布变化超过死区的标签
+PUBLISH_MODE_FULL = "full"
+PUBLISH_MODE_EXCEPTION = "exception"
+
+_MISSING = object()
+# 补发的历史消息等待服务器确认（PUBACK）的最长时间（秒），超时后整批重发
+HISTORY_ACK_TIMEOUT = 30
+
+def load_paho():
+    """
+    延迟导入 paho-mqtt，只有创建 MQTT 客户端时才需要
+    :return: paho.mqtt.client 模块
+    """
+    try:
+        import paho.mqtt.client as mqtt
+    except ImportError:
+        raise ImportError("使用 MQTT 需要先安装 paho-mqtt")
+    return mqtt
+
+def exceeds_deadband(value, last_value, deadband):
+    """
+    判断标签值相对上次发布的值是否超过死区，非数值类型只要不相等即视为变化
+    """
+    try:
+        return abs(value - last_value) > deadband
+    except TypeError:
+        return value != last_value
+
+
+class OutboundQueue:
+    """
+    断线期间待发送的上行消息，长度有界。
+    队列满时按 QoS 丢弃：优先丢弃最旧的 QoS 0 消息；新消息是 QoS 0 且队列中没有 QoS 0 消息时丢弃新消息；
+    新消息是 QoS 1/2 且队列中全是 QoS 1/2 时丢弃最旧的一条。
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._messages = collections.deque()  # [(主题, 消息, QoS, retain)]
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def put(self, topic, payload, qos=0, retain=False):
+        """
+        :return: 消息是否入队
+        """
+        with self._lock:
+            if len(self._messages) >= self.maxsize:
+                oldest_qos0 = next((m for m in self._messages if m[2] == 0), None)
+                self.dropped += 1
+                if oldest_qos0 is not None:
+                    self._messages.remove(oldest_qos0)
+                elif qos == 0:
+                    return False
+                else:
+                    self._messages.popleft()
+            self._messages.append((topic, payload, qos, retain))
+            return True
+
+    def pop(self):
+        """取出最早的消息，队列为空时返回 None"""
+        with self._lock:
+            return self._messages.popleft() if self._messages else None
+
+    def push_front(self, message):
+        """把没发出去的消息放回队首"""
+        with self._lock:
+            self._messages.appendleft(message)
+
+    def __len__(self):
+        return len(self._messages)
+
+
+class DeviceTypePublisher:
+    """
+    某一设备类型的定时发布器，每个设备类型只有一个。
+    每个周期把该类型所有设备格式化、序列化一次，按 chunk_size 拆分为多条消息发布到类型主题。
+    按变化上报（exception）模式下只发布变化超过死区的标签，并按 integrity_interval 定期补发全量快照。
+    """
+
+    def __init__(self, mqtt_client, device_type_id, interval=5, chunk_size=None, topic=None,
+                 mode=PUBLISH_MODE_FULL, integrity_interval=300):
+        """
+        :param mqtt_client: MQTTClient
+        :param device_type_id: 设备类型 ID
+        :param interval: 发布周期（秒）
+        :param chunk_size: 每条消息最多包含的设备数，None 表示不拆分
+        :param topic: 发布主题，默认为 AJB1/zero3/{设备类型 ID}，非 JSON 编码时追加 /{编码名} 后缀
+        :param mode: 发布模式，"full" 或 "exception"
+        :param integrity_interval: exception 模式下全量快照的发布周期（秒）
+        """
+        if mode not in (PUBLISH_MODE_FULL, PUBLISH_MODE_EXCEPTION):
+            raise ValueError(f"不支持的发布模式: {mode}")
+        self.mqtt_client = mqtt_client
+        self.device_type_id = device_type_id
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.topic = topic or f"AJB1/zero3/{device_type_id}"
+        if not topic and mqtt_client.codec.name != JSONCodec.name:
+            self.topic = f"{self.topic}/{mqtt_client.codec.name}"
+        self.mode = mode
+        self.integrity_interval = integrity_interval
+        self._last_published = {}  # (设备 ID, 标签 ID) -> 上次发布的值
+        self._last_integrity = 0.0
+        self._changed = set()      # 上次发布后有标签变化的设备 ID
+        self._watching = False
+
+        # 发布统计
+        self.messages = 0
+        self.bytes_sent = 0
+        labels = {"device_type": device_type_id}
+        self._publish_seconds = REGISTRY.histogram("zero3_mqtt_publish_cycle_seconds", "一轮发布（格式化+编码+发送）耗时（秒）", labels)
+        REGISTRY.counter("zero3_mqtt_published_messages_total", "已发布的消息数", labels, func=lambda: self.messages)
+        REGISTRY.counter("zero3_mqtt_published_bytes_total", "已发布的消息字节数", labels, func=lambda: self.bytes_sent)
+
+    def on_tag_change(self, instance, tag_id, old_value, new_value):
+        """标签变化通知，记录变化的设备，exception 模式下只检查这些设备"""
+        self._changed.add(instance.ID)
+
+    def watch(self):
+        """订阅该类型设备的标签变化"""
+        if not self._watching:
+            self.mqtt_client.instances.subscribe(self.on_tag_change, device_type_id=self.device_type_id)
+            self._watching = True
+
+    def unwatch(self):
+        """取消订阅标签变化"""
+        if self._watching:
+            self.mqtt_client.instances.unsubscribe(self.on_tag_change)
+            self._watching = False
+
+    def _changed_devices(self):
+        """取出上次发布后有变化的设备；未订阅变化通知时返回该类型的全部设备"""
+        store = self.mqtt_client.instances
+        if not self._watching:
+            return store.get_devices_by_type(self.device_type_id)
+        # 逐个取出而不是整体替换集合：通知线程可能仍在向旧集合添加，替换后遍历会丢失变化或出错
+        changed = []
+        while self._changed:
+            changed.append(self._changed.pop())
+        return [instance for instance in (store.get_device(device_id) for device_id in changed) if instance is not None]
+
+    def build_payloads(self):
+        """
+        生成本周期要发布的消息
+        :return: [消息字典]
+        """
+        now = time.time()
+        if self.mode == PUBLISH_MODE_EXCEPTION and now - self._last_integrity < self.integrity_interval:
+            devices_info = [info for info in (self.format_changed_device_info(instance) for instance in self._changed_devices())
+                            if info['Tags']]
+        else:
+            # 全量快照包含了此前的全部变化：先逐个取出（不替换集合，原因见 _changed_devices），再取快照
+            while self._changed:
+                self._changed.pop()
+            instances = self.mqtt_client.instances.get_devices_by_type(self.device_type_id)
+            devices_info = [self.mqtt_client.format_device_info(instance) for instance in instances]
+            self._last_integrity = now
+            if self.mode == PUBLISH_MODE_EXCEPTION:
+                for info in devices_info:
+                    for tag in info['Tags']:
+                        self._last_published[(info['DevID'], tag['ID'])] = tag['V']
+        if not devices_info:  # 确保有设备信息才发布
+            return []
+
+        ts = int(now)
+        chunk_size = self.chunk_size or len(devices_info)
+        chunks = [devices_info[i:i + chunk_size] for i in range(0, len(devices_info), chunk_size)]
+        payloads = []
+        for index, chunk in enumerate(chunks):
+            payload = {
+                'DeviceTypeID': self.device_type_id,
+                'TS': ts,
+                'Devs': chunk
+            }
+            if len(chunks) > 1:
+                # 拆分发布时标明分片序号，便于接收端判断一轮数据是否完整
+                payload['Chunk'] = index
+                payload['Chunks'] = len(chunks)
+            payloads.append(payload)
+        return payloads
+
+    def format_changed_device_info(self, instance):
+        """
+        只格式化变化超过死区的标签，并记录为已发布
+        """
+        tags = []
+        for tag_id, real_value in instance.tag_values():
+            if real_value is None:
+                continue
+            key = (instance.ID, tag_id)
+            last_value = self._last_published.get(key, _MISSING)
+            if last_value is _MISSING or exceeds_deadband(real_value, last_value, instance.TagMeta[tag_id].get('Deadband', 0)):
+                tags.append({'ID': tag_id, 'V': real_value})
+                self._last_published[key] = real_value
+        return {
+            'DevID': instance.ID,
+            'Tags': tags
+        }
+
+    def tag_types(self):
+        """获取该设备类型的 {标签 ID: Type}，供二进制编码选择定长格式"""
+        instances = self.mqtt_client.instances.get_devices_by_type(self.device_type_id)
+        if not instances:
+            return {}
+        return {tag_id: meta['Type'] for tag_id, meta in instances[0].TagMeta.items()}
+
+    def publish(self):
+        """发布一轮设备信息；未连接时跳过，变化留到重连后发布（历史由 TagHistory 补发）"""
+        if not self.mqtt_client.client.is_connected():
+            return
+        start = time.perf_counter()
+        codec = self.mqtt_client.codec
+        payloads = self.build_payloads()
+        tag_types = self.tag_types() if payloads else None
+        for payload in payloads:
+            payload = codec.encode(payload, tag_types)
+            self.mqtt_client.publish(self.topic, payload)
+            self.messages += 1
+            self.bytes_sent += len(payload)
+        self._publish_seconds.observe(time.perf_counter() - start)
+
 
 class MQTTClient:
-    def __init__(self, broker_ip, port, username, password, instances=None):
-        self.client = mqtt.Client()
+    def __init__(self, broker_ip, port, username, password, instances=None, scheduler=None, codec="json",
+                 inbound_queue_size=1000, outbound_queue_size=1000, reconnect_min_delay=1, reconnect_max_delay=120,
+                 auto_connect=True):
+        """
+        :param codec: 上行消息编码，"json"（默认）、"msgpack" 或 "struct"；
+                      非 JSON 编码的上下行主题都带 /{编码名} 后缀，下行消息按主题后缀选择解码器
+        :param inbound_queue_size: 下行消息队列长度，队列满时丢弃新消息
+        :param outbound_queue_size: 断线期间缓存的上行消息数，满时优先丢弃 QoS 0 消息
+        :param reconnect_min_delay: 重连退避的最小延迟（秒）
+        :param reconnect_max_delay: 重连退避的最大延迟（秒）
+        :param auto_connect: 是否在创建时立即开始连接；为 False 时由调用方在启动阶段调用 connect
+        """
+        self._paho = load_paho()
+        self.broker_ip = broker_ip
+        self.port = port
+        self.reconnect_min_delay = reconnect_min_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self._reconnect_attempts = 0  # 连续重连失败次数，连接成功后清零
+        self.client = self._paho.Client()
         self.client.username_pw_set(username, password)
         self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_connect_fail = self.on_connect_fail
+        self.client.on_publish = self.on_publish
         self.client.on_message = self.on_message
-        self.instances = instances  # 保存设备实例
+        self.subscriptions = set()  # 已订阅的主题，每次（重新）连接成功后重新订阅
+        self._subscriptions_lock = threading.Lock()
+        self.outbound = OutboundQueue(outbound_queue_size)
+        self.connects = 0
+        self.disconnects = 0
+        # 保存设备实例，统一使用 TagStore 按设备 ID 建索引
+        self.instances = instances if isinstance(instances, TagStore) else TagStore(instances)
         self.publish_thread_stop = False
-        
-        # 连接到 MQTT 服务器并重试直到连接成功
-        self.connect_mqtt(broker_ip, port)
+        self.scheduler = scheduler  # 提供调度器时，定时发布作为调度任务运行，不再单独开线程
+        self.publishers = {}  # 设备类型 ID -> DeviceTypePublisher
+        self.codec = get_codec(codec)
+        self.history = None   # TagHistory，由 attach_history 设置
+        # 补发的历史消息在服务器确认后才标记为已转发：消息 ID -> ([采样行 ID], 发送时间)
+        self._history_inflight = {}
+        self._history_acked = []  # 已确认、待标记的采样行 ID
+        self._unmatched_acks = collections.deque(maxlen=100)  # publish 返回前就到达的确认
+        self._history_lock = threading.Lock()
 
-    def connect_mqtt(self, broker_ip, port):
-        """连接到 MQTT 服务器，如果连接失败，则每 1 分钟重试一次，直到成功"""
-        while True:
-            try:
-                print("尝试连接到 MQTT 服务器...")
-                self.client.connect(broker_ip, port, 60)
-                self.client.loop_start()
-                print("连接成功！")
-                break  # 连接成功跳出循环
-            except Exception as e:
-                print(f"连接失败: {e}, 等待 1 分钟后重试...")
-                time.sleep(60)  # 等待 60 秒后重试
+        # 下行消息在网络线程中只入队，由工作线程解码、校验并写入标签
+        self.inbound_queue = queue.Queue(maxsize=inbound_queue_size)
+        self.inbound_stats = {
+            'messages': 0,          # 已处理的消息数
+            'dropped': 0,           # 队列满被丢弃的消息数
+            'decode_errors': 0,     # 无法解码或格式错误的消息数
+            'tag_writes': 0,        # 成功写入的标签数
+            'unknown_devices': 0,   # 未找到的设备数
+            'unknown_tags': 0,      # 未找到的标签数
+            'readonly_tags': 0,     # 因 RW 权限被拒绝的标签数
+            'invalid_values': 0,    # 值不符合标签 Type 或 Min/Max 的标签数
+        }
+        REGISTRY.gauge("zero3_mqtt_inbound_queue_depth", "下行消息队列中待处理的消息数", func=self.inbound_queue.qsize)
+        REGISTRY.gauge("zero3_mqtt_connected", "MQTT 是否已连接（1/0）", func=lambda: int(self.client.is_connected()))
+        REGISTRY.counter("zero3_mqtt_connects_total", "MQTT 连接成功次数", func=lambda: self.connects)
+        REGISTRY.counter("zero3_mqtt_disconnects_total", "MQTT 连接断开次数", func=lambda: self.disconnects)
+        REGISTRY.gauge("zero3_mqtt_outbound_queue_depth", "断线期间缓存的上行消息数", func=lambda: len(self.outbound))
+        REGISTRY.counter("zero3_mqtt_outbound_dropped_total", "上行缓存满被丢弃的消息数", func=lambda: self.outbound.dropped)
+        for key in self.inbound_stats:
+            REGISTRY.counter(f"zero3_mqtt_inbound_{key}_total", "下行消息处理统计", func=lambda key=key: self.inbound_stats[key])
+        self._inbound_thread = None  # 下行消息工作线程，在 connect_mqtt 中启动
+
+        if auto_connect:
+            self.connect()
+
+    def connect(self):
+        """后台连接构造时给定的服务器，不阻塞本地控制的启动"""
+        self.connect_mqtt(self.broker_ip, self.port, self.reconnect_min_delay, self.reconnect_max_delay)
+
+    def connect_mqtt(self, broker_ip, port, reconnect_min_delay=1, reconnect_max_delay=120):
+        """
+        在网络线程中异步连接 MQTT 服务器，立即返回。
+        连接失败或断开后由 paho 自动重连，每次重连的延迟见 _set_reconnect_delay。
+        """
+        print("尝试连接到 MQTT 服务器...")
+        if self._inbound_thread is None:
+            # 下行消息只在连接之后才会到达，工作线程随连接启动，创建客户端时不启动线程
+            self._inbound_thread = threading.Thread(target=self._inbound_worker, name="mqtt-inbound")
+            self._inbound_thread.daemon = True
+            self._inbound_thread.start()
+        self.reconnect_min_delay = reconnect_min_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self._reconnect_attempts = 0
+        self._set_reconnect_delay()
+        self.client.connect_async(broker_ip, port, 60)
+        self.client.loop_start()
+
+    def _set_reconnect_delay(self):
+        """
+        设置下一次重连前的等待时间：按连续失败次数指数退避（不超过上限），每次单独乘以 0.5~1 的随机系数，
+        避免服务器恢复时所有网关同时重连。paho 的上下限都设为这个值，由这里而不是 paho 控制退避
+        """
+        delay = min(self.reconnect_min_delay * 2 ** self._reconnect_attempts, self.reconnect_max_delay)
+        delay *= random.uniform(0.5, 1)
+        self.client.reconnect_delay_set(min_delay=delay, max_delay=delay)
+
+    def on_connect_fail(self, client, userdata):
+        """连接失败（服务器不可达等），按退避重新抽取下一次重连的延迟"""
+        self._reconnect_attempts += 1
+        self._set_reconnect_delay()
 
     def on_connect(self, client, userdata, flags, rc):
+        """每次（重新）连接成功后重新订阅，并补发断线期间缓存的消息"""
+        if rc != 0:
+            print(f"MQTT 连接被拒绝, 状态码 {rc}")
+            self._reconnect_attempts += 1
+            self._set_reconnect_delay()
+            return
+        self.connects += 1
+        self._reconnect_attempts = 0
+        self._set_reconnect_delay()
         print(f"MQTT 连接成功, 状态码 {rc}")
+        with self._subscriptions_lock:
+            topics = sorted(self.subscriptions)
+        for topic in topics:
+            client.subscribe(topic)
+        self._drain_outbound()
 
-    def on_message(self, client, userdata, msg):
-        try:
-            print(f"接收到消息: {msg.topic} -> {msg.payload.decode()}")
-            payload = json.loads(msg.payload.decode())
-            # 打印整个 payload 数据
-            #print("当前 payload 数据: ")
-            #print(json.dumps(payload, indent=4, ensure_ascii=False))  # 格式化输出
-            if "Devs" not in payload:
-                print("消息中缺少 'Devs' 字段，无法更新设备信息。")
-                return
-
-            # 遍历所有设备
-            for dev in payload["Devs"]:
-                dev_id = dev.get("DevID")
-                if dev_id is None:
-                    print("设备 ID 不存在，跳过该设备")
-                    continue
+    def on_disconnect(self, client, userdata, rc):
+        self.disconnects += 1
+        with self._history_lock:
+            # 在途的补发消息不再等待确认，这些采样保持未转发，下次补发
+            self._history_inflight.clear()
+        if rc != 0:
+            print(f"MQTT 连接断开, 状态码 {rc}，将自动重连")
+            self._set_reconnect_delay()
 
-                instance = self.get_device_instance_by_id(dev_id)
-                if instance:
-                    #print(f"找到设备实例: {instance}")
+    def on_publish(self, client, userdata, mid):
+        """服务器确认了 QoS 1 消息：补发的历史采样此时才算转发成功"""
+        with self._history_lock:
+            entry = self._history_inflight.pop(mid, None)
+            if entry is None:
+                self._unmatched_acks.append(mid)
+            else:
+                self._history_acked.extend(entry[0])
 
-                    # 更新设备的标签（Tags）
-                    if "Tags" in dev:
-                        for tag in dev["Tags"]:
-                            tag_id = tag.get("ID")
-                            real_value = tag.get("V")  # 这里使用 V 表示标签的实时值
+    def publish(self, topic, payload, qos=0, retain=False, queue_if_offline=True):
+        """
+        发布上行消息；未连接时放入有界的上行缓存，重连后按顺序补发
+        :param queue_if_offline: 为 False 时未连接直接返回 False（调用方自行重发）
+        :return: 消息是否已交给 paho 发送
+        """
+        if self.client.is_connected():
+            self._drain_outbound()
+            if not len(self.outbound):
+                info = self.client.publish(topic, payload, qos, retain)
+                if info.rc == self._paho.MQTT_ERR_SUCCESS:
+                    return True
+        if queue_if_offline:
+            self.outbound.put(topic, payload, qos, retain)
+        return False
 
-                            if tag_id is not None and real_value is not None:
-                                # 直接通过 tag_id 更新 Tags 字典中的 '实时值'
-                                if tag_id in instance.Tags:
-                                    print(f"更新标签 ID {tag_id} 的实时值为 {real_value}")
-                                    instance.Tags[tag_id]['实时值'] = real_value  # 直接更新标签的实时值
-                                else:
-                                    print(f"未找到标签 ID {tag_id}，跳过该标签更新。")
+    def _drain_outbound(self):
+        """连接正常时按顺序发出缓存的上行消息"""
+        while len(self.outbound) and self.client.is_connected():
+            message = self.outbound.pop()
+            if message is None:
+                break
+            if self.client.publish(*message).rc != self._paho.MQTT_ERR_SUCCESS:
+                self.outbound.push_front(message)
+                break
 
-                else:
-                    print(f"未找到设备实例 {dev_id}，跳过更新。")
+    def on_message(self, client, userdata, msg):
+        """
+        网络线程回调：只把消息放入有界队列，立即返回，避免耽误保活
+        """
+        try:
+            self.inbound_queue.put_nowait((msg.topic, msg.payload))
+        except queue.Full:
+            self.inbound_stats['dropped'] += 1
+
+    def _inbound_worker(self):
+        """下行消息工作线程"""
+        while True:
+            topic, payload = self.inbound_queue.get()
+            try:
+                self.handle_message(topic, payload)
+            except Exception as e:
+                print(f"处理接收到的消息时发生错误: {e}")
+
+    def handle_message(self, topic, data):
+        """
+        解码一次下行消息，按标签定义校验后写入设备实例。
+        支持一条消息包含多台设备；逐标签不打印日志，结果计入 inbound_stats。
+        :return: 成功写入的标签数
+        """
+        stats = self.inbound_stats
+        stats['messages'] += 1
+        try:
+            payload = codec_for_topic(topic).decode(data)
+        except (ValueError, struct.error) as e:
+            stats['decode_errors'] += 1
+            print(f"接收到的消息无法解码: {topic}: {e}")
+            return 0
+        devs = payload.get("Devs") if isinstance(payload, dict) else None
+        if not isinstance(devs, list):
+            stats['decode_errors'] += 1
+            print(f"消息中缺少 'Devs' 字段，无法更新设备信息: {topic}")
+            return 0
 
-        except json.JSONDecodeError:
-            print(f"接收到的消息不是有效的 JSON 格式: {msg.payload.decode()}")
-        except Exception as e:
-            print(f"处理接收到的消息时发生错误: {e}")
+        written = 0
+        for dev in devs:
+            dev_id = dev.get("DevID") if isinstance(dev, dict) else None
+            instance = self.instances.get_device(dev_id) if isinstance(dev_id, Hashable) else None
+            if instance is None:
+                stats['unknown_devices'] += 1
+                continue
+            tags = dev.get("Tags") or []
+            if not isinstance(tags, list):
+                stats['decode_errors'] += 1
+                continue
+            updates = []
+            for tag in tags:
+                if not isinstance(tag, dict):
+                    stats['decode_errors'] += 1
+                    continue
+                tag_id = tag.get("ID")
+                real_value = tag.get("V")  # 这里使用 V 表示标签的实时值
+                if not isinstance(tag_id, Hashable) or tag_id not in instance.TagIndex:
+                    stats['unknown_tags'] += 1
+                    continue
+                if not instance.is_tag_writable(tag_id):
+                    stats['readonly_tags'] += 1
+                    continue
+                valid, real_value = instance.check_tag_value(tag_id, real_value)
+                if not valid:
+                    stats['invalid_values'] += 1
+                    continue
+                updates.append((tag_id, real_value))
+            if updates:
+                # 同一设备的多个标签一次写入
+                instance.set_tag_values(updates)
+                written += len(updates)
+        stats['tag_writes'] += written
+        return written
 
     def get_device_instance_by_id(self, dev_id):
         """
         根据设备 ID 获取对应的设备实例
         """
-        for instance in self.instances:
-            if instance.ID == dev_id:  # 直接通过 instance.ID 访问 ID
-                return instance
-        return None
+        return self.instances.get_device(dev_id)
 
     def format_device_info(self, instance):
         """
@@ -90,64 +484,154 @@ class MQTTClient:
         """
         tags = []
 
-        for tag_id, tag_data in instance.Tags.items():  # 遍历 Tags 字典
-            if isinstance(tag_data, dict):  # 确保 tag_data 是字典
-                real_value = tag_data.get("实时值")  # 获取实时值
-
-                if real_value is not None:
-                    tags.append({
-                        'ID': tag_id,  # 使用 tag_id 作为标签的 ID
-                        'V': real_value  # 使用实时值
-                    })
-                else:
-                    print(f"警告: 标签 {tag_id} 没有实时值，跳过该标签。")
+        for tag_id, real_value in instance.tag_values():  # 遍历实例的实时值
+            if real_value is not None:
+                tags.append({
+                    'ID': tag_id,  # 使用 tag_id 作为标签的 ID
+                    'V': real_value  # 使用实时值
+                })
             else:
-                print(f"警告: 标签 {tag_id} 的数据格式不正确，跳过该标签。")
+                print(f"警告: 标签 {tag_id} 没有实时值，跳过该标签。")
 
         return {
             'DevID': instance.ID,  # 直接使用 instance.ID
             'Tags': tags
         }
 
-    def publish_all_devices_info(self, device_type_id,device_id):
+    def publish_all_devices_info(self, device_type_id):
         """
         发布指定类型设备的状态信息
         """
-        devices_info = []
-
-        for instance in self.instances:
-            if instance.DevTypeID == device_type_id:
-                devices_info.append(self.format_device_info(instance))
+        publisher = self.publishers.get(device_type_id) or DeviceTypePublisher(self, device_type_id)
+        publisher.publish()
 
-        if devices_info:  # 确保有设备信息才发布
-            topic = f"AJB1/zero3/{device_type_id}/{device_id}"
-            payload = {
-                'DeviceTypeID': device_type_id,
-                'TS': int(time.time()),
-                'Devs': devices_info
-            }
-
-            self.client.publish(topic, json.dumps(payload))
-           # print(f"发布到 {topic}: {json.dumps(payload)}")
-
-    def start_publish_loop(self, device_type_id,device_id, interval=5):
+    def start_publish_loop(self, device_type_id, interval=5, chunk_size=None, mode=PUBLISH_MODE_FULL, integrity_interval=300):
         """
-        启动定时发布设备信息的循环。
+        启动定时发布设备信息的循环。每个设备类型只启动一个发布器，重复调用直接返回已有的发布器。
         :param interval: 定时发布的间隔时间，默认为 5 秒
+        :param chunk_size: 每条消息最多包含的设备数，None 表示不拆分
+        :param mode: "full" 每次发布全部标签；"exception" 只发布变化超过死区（DeviceTypes.json 中标签的 Deadband）的标签
+        :param integrity_interval: exception 模式下全量快照的发布周期（秒）
+        :return: DeviceTypePublisher
         """
-        def loop(device_type_id,device_id):
+        publisher = self.publishers.get(device_type_id)
+        if publisher is not None:
+            return publisher
+        publisher = DeviceTypePublisher(self, device_type_id, interval, chunk_size,
+                                        mode=mode, integrity_interval=integrity_interval)
+        self.publishers[device_type_id] = publisher
+        if mode == PUBLISH_MODE_EXCEPTION:
+            # 按变化上报时只检查有变化的设备，没有变化的周期不做格式化
+            publisher.watch()
+
+        if self.scheduler is not None:
+            self.scheduler.add_job(publisher.publish, interval, name=f"mqtt_publish_{device_type_id}", jitter=0.5)
+            return publisher
+
+        def loop():
             while not self.publish_thread_stop:
-                self.publish_all_devices_info(device_type_id,device_id)
+                publisher.publish()
                 time.sleep(interval)
 
         # 启动定时发布的线程
-        publish_thread = threading.Thread(target=loop,args=(device_type_id, device_id))
+        publish_thread = threading.Thread(target=loop)
         publish_thread.daemon = True
         publish_thread.start()
+        return publisher
 
     def stop_publish_loop(self):
         """停止定时发布循环"""
         self.publish_thread_stop = True
+        if self.scheduler is not None:
+            for device_type_id in self.publishers:
+                self.scheduler.remove_job(f"mqtt_publish_{device_type_id}")
+        for publisher in self.publishers.values():
+            publisher.unwatch()
+        self.publishers = {}
+
+    def publish_metrics(self, topic="AJB1/zero3/sys/metrics", registry=REGISTRY):
+        """把指标快照以 JSON 发布到系统主题（类似 $SYS）"""
+        payload = {'TS': int(time.time()), 'Metrics': registry.snapshot()}
+        self.publish(topic, get_codec(JSONCodec.name).encode(payload))
+
+    def start_metrics_publish(self, interval=60, topic="AJB1/zero3/sys/metrics", registry=REGISTRY):
+        """
+        定时发布指标快照，需要调度器
+        """
+        if self.scheduler is None:
+            raise ValueError("定时发布指标需要在创建 MQTTClient 时提供调度器")
+        if self.scheduler.get_job("mqtt_publish_metrics") is None:
+            self.scheduler.add_job(self.publish_metrics, interval, args=(topic, registry), name="mqtt_publish_metrics")
+
+    def attach_history(self, history, batch_size=500, replay_interval=1, flush_interval=1, prune_interval=3600):
+        """
+        把全部标签变化记录到本地历史，断线期间的采样在重连后按批限速补发到
+        AJB1/zero3/{设备类型 ID}/history 主题，需要调度器
+        :param history: TagHistory
+        :param batch_size: 每次补发的最大采样数
+        :param replay_interval: 补发周期（秒），与 batch_size 一起限制补发速率
+        :param flush_interval: 历史缓冲写入数据库的周期（秒）
+        :param prune_interval: 按保留策略清理旧数据的周期（秒）
+        """
+        if self.scheduler is None:
+            raise ValueError("记录历史需要在创建 MQTTClient 时提供调度器")
+        self.history = history
+        self.instances.subscribe(self._record_history)
+        # SQLite 写入与清理在 asyncio 运行时中交给线程池执行，不阻塞驱动 MQTT 的事件循环
+        self.scheduler.add_job(history.flush, flush_interval, name="history_flush", blocking=True)
+        self.scheduler.add_job(history.prune, prune_interval, name="history_prune", blocking=True)
+        self.scheduler.add_job(self.replay_history, replay_interval, args=(batch_size,), name="history_replay")
+
+    def _record_history(self, instance, tag_id, old_value, new_value):
+        # 连接正常时实时发布已经覆盖了这次变化，只有断线期间的采样需要补发
+        self.history.record(instance.DevTypeID, instance.ID, tag_id, new_value, forwarded=self.client.is_connected())
+
+    def replay_history(self, batch_size=500):
+        """
+        补发一批断线期间的历史采样，消息格式 {"DeviceTypeID": 类型, "History": [[时间戳, 设备 ID, 标签 ID, 值], ...]}。
+        以 QoS 1 发送，收到服务器确认后才标记为已转发；上一批未全部确认时不发下一批
+        :return: 补发的采样数
+        """
+        if self.history is None:
+            return 0
+        now = time.monotonic()
+        with self._history_lock:
+            acked, self._history_acked = self._history_acked, []
+            for mid, (row_ids, sent) in list(self._history_inflight.items()):
+                if now - sent > HISTORY_ACK_TIMEOUT:
+                    del self._history_inflight[mid]  # 超时未确认，保持未转发，随下一批重发
+            waiting = bool(self._history_inflight)
+        if acked:
+            self.history.mark_forwarded(acked)
+        if waiting or not self.client.is_connected():
+            return 0
+        self._drain_outbound()
+        if len(self.outbound):
+            return 0  # 先补发断线期间缓存的实时消息
+        rows = self.history.pending(batch_size)
+        if not rows:
+            return 0
+        by_type = {}
+        for row_id, ts, device_type_id, device_id, tag_id, value in rows:
+            by_type.setdefault(device_type_id, []).append((row_id, [round(ts, 3), device_id, tag_id, value]))
+        # 定长二进制编码只适用于实时快照，历史用 JSON 发送
+        codec = get_codec(JSONCodec.name) if self.codec.name == StructCodec.name else self.codec
+        suffix = "" if codec.name == JSONCodec.name else f"/{codec.name}"
+        sent = 0
+        for device_type_id, samples in by_type.items():
+            payload = codec.encode({'DeviceTypeID': device_type_id, 'History': [sample for _, sample in samples]})
+            info = self.client.publish(f"AJB1/zero3/{device_type_id}/history{suffix}", payload, qos=1)
+            if info.rc != self._paho.MQTT_ERR_SUCCESS:
+                break  # 未发出的在下个周期重发，接收端按 (设备, 标签, 时间戳) 去重
+            row_ids = [row_id for row_id, _ in samples]
+            with self._history_lock:
+                if info.mid in self._unmatched_acks:
+                    self._unmatched_acks.remove(info.mid)
+                    self._history_acked.extend(row_ids)
+                else:
+                    self._history_inflight[info.mid] = (row_ids, now)
+            sent += len(row_ids)
+        return sent
 
     def subscribe_device_type(self, device_type_id,device_id):
         """
@@ -155,5 +639,11 @@ class MQTTClient:
         :param device_type_id: 设备类型 ID
         """
         topic = f"AJB1/unified/{device_type_id}/{device_id}"  # 订阅指定设备类型的所有设备主题
-        self.client.subscribe(topic)
+        topics = [topic] if self.codec.name == JSONCodec.name else [topic, f"{topic}/{self.codec.name}"]
+        for topic in topics:
+            # 记录下来，每次重连成功后在 on_connect 中重新订阅；未连接时等连接后再订阅
+            with self._subscriptions_lock:
+                self.subscriptions.add(topic)
+            if self.client.is_connected():
+                self.client.subscribe(topic)
         #print(f"已订阅主题: {topic}")
@@ -0,0 +1,182 @@
+import json
+import struct
+
+class JSONCodec:
+    """默认的 JSON 编码（紧凑分隔符）"""
+    name = "json"
+
+    def encode(self, payload, tag_types=None):
+        return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data):
+        return json.loads(data.decode('utf-8') if isinstance(data, (bytes, bytearray)) else data)
+
+
+class MsgPackCodec:
+    """MessagePack 编码，需要安装 msgpack"""
+    name = "msgpack"
+
+    def __init__(self):
+        self._msgpack = None
+
+    def _module(self):
+        if self._msgpack is None:
+            try:
+                import msgpack
+            except ImportError:
+                raise ImportError("使用 msgpack 编码需要先安装 msgpack：pip install msgpack")
+            self._msgpack = msgpack
+        return self._msgpack
+
+    def encode(self, payload, tag_types=None):
+        return self._module().packb(payload, use_bin_type=True)
+
+    def decode(self, data):
+        return self._module().unpackb(data, raw=False, strict_map_key=False)
+
+
+class StructCodec:
+    """
+    按标签类型定长打包的二进制编码（小端）。
+    报文头：版本 B、设备类型 ID H、时间戳 I、分片序号 B、分片数 B、设备数 H
+    每个设备：设备 ID I、标签数 H；每个标签：标签 ID H、类型码 B、值（按类型码定长，字符串为 长度 H + UTF-8）
+    类型码由 DeviceTypes.json 中标签的 Type 推导，解码时不需要类型表。
+    """
+    name = "struct"
+    VERSION = 1
+
+    _HEADER = struct.Struct('<BHIBBH')
+    _DEVICE = struct.Struct('<IH')
+    _TAG = struct.Struct('<HB')
+    _VALUES = {
+        ord('?'): struct.Struct('<?'),
+        ord('i'): struct.Struct('<i'),
+        ord('f'): struct.Struct('<f'),
+        ord('d'): struct.Struct('<d'),
+    }
+    _STRING = ord('s')
+    _LENGTH = struct.Struct('<H')
+
+    @staticmethod
+    def type_code(tag_type, value):
+        """
+        根据标签 Type 和实际值选择类型码
+        """
+        kind = str(tag_type or "").lower()
+        if isinstance(value, str):
+            return StructCodec._STRING
+        if isinstance(value, bool) or "bool" in kind:
+            return ord('?')
+        if isinstance(value, float) or any(word in kind for word in ("float", "real", "double", "浮点")):
+            return ord('d') if "double" in kind else ord('f')
+        return ord('i')
+
+    def __init__(self):
+        self._structs = {}  # 格式串 -> struct.Struct，同类型设备的布局相同，只需解析一次
+
+    def _struct(self, fmt):
+        compiled = self._structs.get(fmt)
+        if compiled is None:
+            compiled = self._structs[fmt] = struct.Struct(fmt)
+        return compiled
+
+    def encode(self, payload, tag_types=None):
+        tag_types = tag_types or {}
+        code_cache = {}  # (标签 ID, 值类型) -> 类型码
+        devs = payload.get('Devs', [])
+        parts = [self._HEADER.pack(self.VERSION, payload.get('DeviceTypeID', 0), payload.get('TS', 0),
+                                   payload.get('Chunk', 0), payload.get('Chunks', 1), len(devs))]
+        for dev in devs:
+            tags = dev.get('Tags', [])
+            fmt = ['<IH']
+            values = [dev['DevID'], len(tags)]
+            for tag in tags:
+                tag_id = tag['ID']
+                value = tag['V']
+                key = (tag_id, type(value))
+                code = code_cache.get(key)
+                if code is None:
+                    code = code_cache[key] = self.type_code(tag_types.get(tag_id), value)
+                if code == self._STRING:
+                    raw = value.encode('utf-8')
+                    fmt.append(f'HBH{len(raw)}s')
+                    values.extend((tag_id, code, len(raw), raw))
+                    continue
+                if code == 105 and not -2 ** 31 <= value < 2 ** 31:  # 'i' 放不下的整数改用 double
+                    code = ord('d')
+                fmt.append('HB' + chr(code))
+                values.extend((tag_id, code, value))
+            parts.append(self._struct(''.join(fmt)).pack(*values))
+        return b''.join(parts)
+
+    def decode(self, data):
+        data = memoryview(data)
+        version, device_type_id, ts, chunk, chunks, dev_count = self._HEADER.unpack_from(data, 0)
+        if version != self.VERSION:
+            raise ValueError(f"不支持的二进制报文版本: {version}")
+        offset = self._HEADER.size
+        devs = []
+        layout = None  # 上一台设备的 (标签数, 类型码, struct.Struct)，同类型设备通常布局相同
+        for _ in range(dev_count):
+            dev_id, tag_count = self._DEVICE.unpack_from(data, offset)
+            offset += self._DEVICE.size
+
+            if layout is not None and layout[0] == tag_count and offset + layout[2].size <= len(data):
+                # 快速路径：按上一台设备的布局一次解包，类型码一致才采用
+                values = layout[2].unpack_from(data, offset)
+                if values[1::3] == layout[1]:
+                    tags = [{'ID': tag_id, 'V': value} for tag_id, value in zip(values[0::3], values[2::3])]
+                    devs.append({'DevID': dev_id, 'Tags': tags})
+                    offset += layout[2].size
+                    continue
+
+            tags = []
+            fmt = ['<']
+            codes = []
+            for _ in range(tag_count):
+                tag_id, code = self._TAG.unpack_from(data, offset)
+                offset += 3
+                codes.append(code)
+                if code == self._STRING:
+                    (length,) = self._LENGTH.unpack_from(data, offset)
+                    offset += 2
+                    value = bytes(data[offset:offset + length]).decode('utf-8')
+                    offset += length
+                    fmt = None
+                else:
+                    value_struct = self._VALUES.get(code)
+                    if value_struct is None:
+                        raise ValueError(f"未知的类型码: {code}")
+                    value = value_struct.unpack_from(data, offset)[0]
+                    offset += value_struct.size
+                    if fmt is not None:
+                        fmt.append('HB' + chr(code))
+                tags.append({'ID': tag_id, 'V': value})
+            devs.append({'DevID': dev_id, 'Tags': tags})
+            layout = (tag_count, tuple(codes), self._struct(''.join(fmt))) if fmt is not None else None
+        payload = {'DeviceTypeID': device_type_id, 'TS': ts, 'Devs': devs}
+        if chunks > 1:
+            payload['Chunk'] = chunk
+            payload['Chunks'] = chunks
+        return payload
+
+
+CODECS = {codec.name: codec for codec in (JSONCodec(), MsgPackCodec(), StructCodec())}
+
+def get_codec(name):
+    """
+    根据名称获取编码器
+    :raises ValueError: 名称未注册
+    """
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ValueError(f"不支持的编码: {name}，可选: {list(CODECS)}")
+    return codec
+
+
+def codec_for_topic(topic, default=None):
+    """
+    按主题后缀协商编码：主题最后一段是已注册的编码名时使用该编码，否则使用默认编码（JSON）
+    """
+    suffix = topic.rsplit('/', 1)[-1]
+    return CODECS.get(suffix) or default or CODECS[JSONCodec.name]
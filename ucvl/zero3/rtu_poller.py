@@ -0,0 +1,374 @@
+import threading
+import time
+from ucvl.zero3.modbus_rtu import MAX_READ_REGISTERS
+from ucvl.zero3.metrics import REGISTRY
+from ucvl.zero3.tag_conversion import BlockDecoder, TagConversion
+
+def register_map_from_tag_meta(tag_meta, access="R"):
+    """
+    从设备类型标签元数据中的 "Modbus" 字段生成寄存器映射
+    DeviceTypes.json 中的写法：{"ID": 1000, ..., "Modbus": {"Address": 0, "Scale": 0.01, "Access": "R"}}，
+    可用的转换字段见 TagConversion
+    :param tag_meta: 设备类的 TagMeta
+    :param access: 需要的访问方式，"R" 取可读标签，"W" 取可写标签
+    :return: {标签 ID: Modbus 字段}
+    """
+    register_map = {}
+    for tag_id, meta in tag_meta.items():
+        modbus = meta.get("Modbus")
+        if modbus and access in modbus.get("Access", "R"):
+            register_map[tag_id] = modbus
+    return register_map
+
+
+def build_read_blocks(register_map, max_count=MAX_READ_REGISTERS, max_gap=0):
+    """
+    把寄存器映射合并成尽量少的连续读块
+    :param register_map: {标签 ID: {"Address": 寄存器地址, "Scale": 比例, ...}}
+    :param max_count: 单个读块最多包含的寄存器数量
+    :param max_gap: 允许合并进同一读块的地址空洞（寄存器数），多读几个寄存器通常比多一次请求便宜
+    :return: [BlockDecoder]
+    """
+    conversions = sorted((TagConversion.from_spec(tag_id, spec) for tag_id, spec in register_map.items()),
+                         key=lambda c: c.address)
+    blocks = []
+    for conversion in conversions:
+        address = conversion.address
+        end_address = address + conversion.register_count
+        if blocks:
+            start, count, tags = blocks[-1]
+            end = start + count
+            if address - end <= max_gap and end_address - start <= max_count:
+                # 相邻、有小空洞或与已有寄存器重叠（多个标签映射到同一寄存器）
+                tags.append((conversion.tag_id, address - start, conversion))
+                blocks[-1] = (start, max(count, end_address - start), tags)
+                continue
+        blocks.append((address, conversion.register_count, [(conversion.tag_id, 0, conversion)]))
+    return [BlockDecoder(start, count, tags) for start, count, tags in blocks]
+
+
+class PolledDevice:
+    """轮询引擎中的一个设备：从站地址、读块及各自的轮询周期、写映射及统计"""
+
+    def __init__(self, instance, slave_address, read_blocks, write_specs=(), intervals=None):
+        """
+        :param intervals: 各读块的轮询周期（秒），与 read_blocks 一一对应
+        """
+        self.instance = instance
+        self.slave_address = slave_address
+        self.read_blocks = read_blocks        # [BlockDecoder]
+        self.intervals = list(intervals) if intervals is not None else [0.0] * len(read_blocks)
+        self.next_read = [0.0] * len(read_blocks)  # 各读块下次到期时间（monotonic）
+        self.write_specs = list(write_specs)  # [TagConversion]
+        self.writable = {spec.tag_id: spec for spec in self.write_specs}
+        self.last_queued = {}                 # 标签 ID -> 最近一次提交写入的值
+        self.read_errors = 0
+
+    def due_blocks(self, now):
+        """获取已到期的读块序号"""
+        return [index for index, due in enumerate(self.next_read) if due <= now]
+
+
+class SlaveHealth:
+    """
+    一个从站的通信状态。连续失败 fail_threshold 次判定离线：离线后不再按周期读取，
+    只按指数退避（probe_interval 起逐次翻倍，不超过 max_probe_interval）发一个探测请求，成功即恢复在线。
+    这样一个掉线的阀门每个探测周期只占用一次超时，不拖慢总线上其他设备的刷新。
+    """
+
+    def __init__(self, slave_address, fail_threshold=3, probe_interval=2.0, max_probe_interval=60.0):
+        self.slave_address = slave_address
+        self.fail_threshold = fail_threshold
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self.online = True
+        self.failures = 0          # 连续失败次数
+        self.next_probe = 0.0
+        self._probe_delay = probe_interval
+        self.offline_count = 0     # 判定离线的次数
+
+    def should_poll(self, now):
+        """在线，或离线但已到探测时间"""
+        return self.online or now >= self.next_probe
+
+    def record(self, ok, now):
+        """记录一次请求的结果"""
+        if ok:
+            if not self.online:
+                print(f"从站 {self.slave_address} 恢复在线")
+            self.online = True
+            self.failures = 0
+            self._probe_delay = self.probe_interval
+            return
+        self.failures += 1
+        if self.online and self.failures >= self.fail_threshold:
+            self.online = False
+            self.offline_count += 1
+            print(f"从站 {self.slave_address} 连续 {self.failures} 次无应答，判定离线，{self._probe_delay:g} 秒后探测")
+        if not self.online:
+            self.next_probe = now + self._probe_delay
+            self._probe_delay = min(self._probe_delay * 2, self.max_probe_interval)
+
+
+class RTUPoller:
+    """
+    基于 RTU 的多从站轮询引擎。
+    每个设备的寄存器映射被合并为最少的 Modbus 读请求（不超过 125 个寄存器），
+    多个从站在同一条总线上轮流轮询，读回的值按映射写回各设备实例的标签。
+    """
+
+    def __init__(self, rtu, max_gap=0, write_queue=None, poll_interval=0.5, fail_threshold=3, probe_interval=2.0,
+                 max_probe_interval=60.0):
+        """
+        :param rtu: RTU 客户端
+        :param max_gap: 合并读块时允许的地址空洞
+        :param write_queue: RTUWriteQueue，写入穿插在各设备的读请求之间执行
+        :param poll_interval: 标签与设备都未配置 PollInterval 时读块的轮询周期（秒）
+        :param fail_threshold: 从站连续失败多少次判定离线
+        :param probe_interval: 离线从站首次探测的延迟（秒），之后逐次翻倍
+        :param max_probe_interval: 离线从站探测间隔的上限（秒）
+        """
+        self.rtu = rtu
+        self.max_gap = max_gap
+        self.write_queue = write_queue
+        self.poll_interval = poll_interval
+        self.fail_threshold = fail_threshold
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self.devices = []
+        self.slaves = {}  # 从站地址 -> SlaveHealth
+        self._parked = {}  # 从站地址 -> {有写入被丢弃的设备}，从站恢复在线时按当前值重新提交
+        self._reading = threading.local()  # 正在把读回的值写入标签时置位，这些变化不提交写入
+        self._next_index = 0
+        # 可写标签变化并提交写入后调用的无参数函数，用于让总线任务提前执行（如 scheduler.trigger_job）
+        self.on_write_queued = None
+
+        # 轮询统计
+        self.cycles = 0
+        self.requests = 0
+        self.errors = 0
+
+        labels = {"port": getattr(rtu, "port", "")}
+        self._cycle_seconds = REGISTRY.histogram("zero3_rtu_poll_cycle_seconds", "一轮轮询（含写入）耗时（秒）", labels)
+        REGISTRY.counter("zero3_rtu_poll_cycles_total", "轮询轮数", labels, func=lambda: self.cycles)
+        REGISTRY.counter("zero3_rtu_read_requests_total", "轮询读请求数", labels, func=lambda: self.requests)
+        REGISTRY.counter("zero3_rtu_read_errors_total", "轮询读失败数", labels, func=lambda: self.errors)
+        REGISTRY.gauge("zero3_rtu_devices", "轮询的设备数", labels, func=lambda: len(self.devices))
+        REGISTRY.gauge("zero3_rtu_slaves_offline", "判定离线的从站数", labels, func=lambda: len(self.offline_slaves()))
+        if write_queue is not None:
+            write_queue.on_drop = self._on_write_dropped
+            REGISTRY.gauge("zero3_rtu_write_queue_depth", "待写入的寄存器数", labels, func=write_queue.pending_count)
+            REGISTRY.counter("zero3_rtu_write_dropped_total", "重试耗尽被丢弃的写入数", labels, func=lambda: write_queue.dropped)
+
+    def add_device(self, instance, slave_address, register_map, write_map=None, poll_interval=None):
+        """
+        添加要轮询的设备
+        :param instance: 设备实例
+        :param slave_address: Modbus 从站地址
+        :param register_map: 读映射 {标签 ID: {"Address": 寄存器地址, "Scale": 比例, "PollInterval": 秒}}，
+                             PollInterval 不同的标签分在不同的读块，例如阀门开度快读、故障诊断慢读
+        :param write_map: 写映射，格式同读映射；标签值变化时立即提交到写队列
+        :param poll_interval: 该设备未配置 PollInterval 的标签的轮询周期（秒），None 表示使用引擎的默认周期
+        :return: PolledDevice
+        """
+        default_interval = self.poll_interval if poll_interval is None else poll_interval
+        groups = {}
+        for tag_id, spec in register_map.items():
+            groups.setdefault(spec.get("PollInterval", default_interval), {})[tag_id] = spec
+        read_blocks, intervals = [], []
+        for interval, group in sorted(groups.items()):
+            for block in build_read_blocks(group, max_gap=self.max_gap):
+                read_blocks.append(block)
+                intervals.append(interval)
+        write_specs = [TagConversion.from_spec(tag_id, spec) for tag_id, spec in (write_map or {}).items()]
+        device = PolledDevice(instance, slave_address, read_blocks, write_specs, intervals)
+        self.devices.append(device)
+        if slave_address not in self.slaves:
+            self.slaves[slave_address] = SlaveHealth(slave_address, self.fail_threshold, self.probe_interval,
+                                                     self.max_probe_interval)
+        if self.write_queue is not None and write_specs:
+            # 启动时写出一次当前值，之后由变化通知驱动
+            self.queue_writes(device)
+            instance.subscribe(lambda inst, tag_id, old_value, new_value: self._on_tag_change(device, tag_id),
+                               [spec.tag_id for spec in write_specs])
+        return device
+
+    def _on_tag_change(self, device, tag_id):
+        if getattr(self._reading, "active", False):
+            return  # 轮询读回的值，不是新的设定
+        if self.queue_writes(device, (tag_id,)) and self.on_write_queued is not None:
+            self.on_write_queued()
+
+    def queue_writes(self, device, tag_ids=None):
+        """
+        检查设备的可写标签，值与上次提交的不同时提交到写队列
+        :param tag_ids: 只检查这些标签，None 表示全部可写标签
+        :return: 提交的写入数量
+        """
+        if self.write_queue is None:
+            return 0
+        queued = 0
+        for conversion in device.write_specs:
+            tag_id = conversion.tag_id
+            if tag_ids is not None and tag_id not in tag_ids:
+                continue
+            value = device.instance.get_tag_value(tag_id)
+            if device.last_queued.get(tag_id) != value:
+                self.write_queue.submit_registers(device.slave_address, conversion.address, conversion.encode(value))
+                device.last_queued[tag_id] = value
+                queued += 1
+        return queued
+
+    def _on_write_dropped(self, slave_address, address):
+        """
+        写队列重试耗尽丢弃了一个寄存器：清除对应标签的提交记录。
+        标签再次变化时按新值提交；从站离线后恢复在线时按当前值重新提交。
+        从站在线却一直拒绝写入时不会立即重新提交，避免每次轮询都浪费一次总线事务
+        """
+        for device in self.devices:
+            if device.slave_address != slave_address:
+                continue
+            for conversion in device.write_specs:
+                if conversion.address <= address < conversion.address + conversion.register_count:
+                    device.last_queued.pop(conversion.tag_id, None)
+                    self._parked.setdefault(slave_address, set()).add(device)
+
+    def _on_slave_recovered(self, slave_address):
+        """从站恢复在线：重新提交离线前被丢弃的写入"""
+        for device in self._parked.pop(slave_address, ()):
+            self.queue_writes(device)
+
+    def process_writes(self):
+        """
+        写出写队列中已到期的写入，供变化通知触发的总线任务和每次读请求之前调用
+        :return: 执行的总线事务数
+        """
+        if self.write_queue is None:
+            return 0
+        return self.write_queue.process(exclude=self.offline_slaves())
+
+    def offline_slaves(self):
+        """获取判定离线的从站地址"""
+        return {address for address, health in self.slaves.items() if not health.online}
+
+    def shortest_interval(self):
+        """获取全部读块中最短的轮询周期，没有读块时返回 None"""
+        return min((interval for device in self.devices for interval in device.intervals), default=None)
+
+    def poll_device(self, device, block_indexes=None):
+        """
+        读取一个设备的读块并写回标签。离线从站未到探测时间时不读取；到探测时间时只发一个请求
+        :param block_indexes: 要读取的读块序号，None 表示全部读块
+        :return: 是否全部读取成功
+        """
+        now = time.monotonic()
+        health = self.slaves[device.slave_address]
+        if not health.should_poll(now):
+            return False
+        if block_indexes is None:
+            block_indexes = range(len(device.read_blocks))
+        if not health.online:
+            block_indexes = [0] if device.read_blocks else []
+        ok = True
+        instance = device.instance
+        for index in block_indexes:
+            block = device.read_blocks[index]
+            due, interval = device.next_read[index], device.intervals[index]
+            # 在原计划上累加周期，避免漂移；落后超过一个周期时从现在重新计时
+            device.next_read[index] = due + interval if due + interval > now else now + interval
+            self.requests += 1
+            registers = self.rtu.read_holding_registers(DataAddress=block.start, DataCount=block.count,
+                                                        SlaveAddress=device.slave_address)
+            was_online = health.online
+            health.record(bool(registers), time.monotonic())
+            if health.online and not was_online:
+                self._on_slave_recovered(device.slave_address)
+            if not registers:
+                self.errors += 1
+                device.read_errors += 1
+                ok = False
+                if not health.online:
+                    break  # 从站已离线，本次不再读它的其他读块
+                continue
+            updates = []
+            for conversions, values in block.decode_groups(registers):
+                for conversion, value in zip(conversions, values):
+                    if conversion.deadband:
+                        # 变化不超过死区时不更新标签，避免采样噪声触发变化通知
+                        try:
+                            if abs(value - instance.get_tag_value(conversion.tag_id)) <= conversion.deadband:
+                                continue
+                        except TypeError:
+                            pass
+                    spec = device.writable.get(conversion.tag_id)
+                    if spec is not None and self.write_queue is not None:
+                        if self.write_queue.has_pending(device.slave_address, spec.address):
+                            continue  # 新的设定值还没写到从站，读回的旧值不覆盖它
+                        device.last_queued[conversion.tag_id] = value
+                    updates.append((conversion.tag_id, value))
+            # 一个读块的值一次写入，读者不会看到半个读块的新值；读回的值不再提交写入
+            self._reading.active = True
+            try:
+                instance.set_tag_values(updates)
+            finally:
+                self._reading.active = False
+        return ok
+
+    def poll_due(self, budget=None):
+        """
+        只读取已到期的读块：按到期时间先后排列，落后最多的先读；离线从站只在探测时间到时发一个请求。
+        :param budget: 本次最多占用总线的时间（秒）。按波特率估算下一个设备的请求耗时，
+                       预计超出时其余读块留到下次（它们仍然到期，下次排在前面）；None 表示不限
+        :return: 本次读取的设备数
+        """
+        start = time.perf_counter()
+        now = time.monotonic()
+        due = []
+        for device in self.devices:
+            health = self.slaves[device.slave_address]
+            if not health.should_poll(now):
+                continue
+            indexes = device.due_blocks(now)
+            if not health.online:
+                indexes = [0] if device.read_blocks else []
+            if indexes:
+                due.append((min(device.next_read[index] for index in indexes), device, indexes))
+        due.sort(key=lambda item: item[0])
+
+        polled = 0
+        read_time = getattr(self.rtu, "read_time", None)
+        for _, device, indexes in due:
+            if budget is not None and polled:
+                estimate = sum(read_time(device.read_blocks[index].count) for index in indexes) if read_time else 0.0
+                if time.perf_counter() - start + estimate > budget:
+                    break
+            # 写入优先于读取：每次读之前先把到期的写入发出去
+            self.process_writes()
+            self.poll_device(device, indexes)
+            polled += 1
+        if due:
+            self.cycles += 1
+            self._cycle_seconds.observe(time.perf_counter() - start)
+        return polled
+
+    def poll_cycle(self):
+        """
+        轮询一轮：每个设备读取全部读块一次（不看轮询周期），起点轮转，避免总是同一个设备排在最后；
+        离线从站按探测时间处理
+        :return: 本轮读取成功的设备数量
+        """
+        start = time.perf_counter()
+        succeeded = 0
+        for _ in range(len(self.devices)):
+            device = self.devices[self._next_index % len(self.devices)]
+            self._next_index = (self._next_index + 1) % len(self.devices)
+            # 写入优先于读取：每次读之前先把到期的写入发出去
+            self.process_writes()
+            if self.poll_device(device):
+                succeeded += 1
+        # 每轮起点后移一个设备
+        if self.devices:
+            self._next_index = (self._next_index + 1) % len(self.devices)
+        self.cycles += 1
+        self._cycle_seconds.observe(time.perf_counter() - start)
+        return succeeded
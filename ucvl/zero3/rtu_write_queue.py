@@ -0,0 +1,152 @@
+import threading
+import time
+from ucvl.zero3.modbus_rtu import MAX_WRITE_REGISTERS
+
+class PendingWrite:
+    """队列中待写入的一个寄存器"""
+
+    def __init__(self, slave_address, address, value, priority):
+        self.slave_address = slave_address
+        self.address = address
+        self.value = value
+        self.priority = priority
+        self.attempts = 0
+        self.next_attempt = 0.0
+
+
+class RTUWriteQueue:
+    """
+    RTU 写队列。
+    对同一寄存器的重复设定只保留最新值；同一从站的连续地址合并为一次功能码 16 写入；
+    失败的写入按指数退避重试，由轮询引擎在读请求之间调用 process，不阻塞总线。
+    """
+
+    def __init__(self, rtu, max_attempts=3, backoff=0.5, max_backoff=8.0):
+        """
+        :param rtu: RTU 客户端
+        :param max_attempts: 单个写入的最大尝试次数，超过后丢弃
+        :param backoff: 首次重试的延迟（秒），之后每次翻倍
+        :param max_backoff: 重试延迟上限（秒）
+        """
+        self.rtu = rtu
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._pending = {}  # (从站地址, 寄存器地址) -> PendingWrite
+        self._lock = threading.Lock()
+        # 写入重试耗尽被丢弃后调用 on_drop(从站地址, 寄存器地址)，用于让提交方在合适的时机按当前值重新提交
+        self.on_drop = None
+
+        # 写入统计
+        self.submitted = 0
+        self.coalesced = 0
+        self.transactions = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def submit(self, slave_address, address, value, priority=1):
+        """
+        提交一个寄存器写入，同一寄存器未写出的旧值会被覆盖
+        :param priority: 优先级，数值越大越先写
+        """
+        key = (slave_address, address)
+        with self._lock:
+            self.submitted += 1
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.coalesced += 1
+                pending.value = value
+                pending.priority = max(pending.priority, priority)
+                pending.attempts = 0
+                pending.next_attempt = 0.0
+            else:
+                self._pending[key] = PendingWrite(slave_address, address, value, priority)
+
+    def submit_registers(self, slave_address, address, values, priority=1):
+        """提交从 address 开始的连续多个寄存器"""
+        for offset, value in enumerate(values):
+            self.submit(slave_address, address + offset, value, priority)
+
+    def pending_count(self):
+        """获取待写入的寄存器数量"""
+        return len(self._pending)
+
+    def has_pending(self, slave_address, address):
+        """寄存器是否有尚未写出的值"""
+        return (slave_address, address) in self._pending
+
+    def _take_due(self, now, slave_address=None, exclude=()):
+        """取出已到重试时间的写入"""
+        with self._lock:
+            due = [w for w in self._pending.values()
+                   if w.next_attempt <= now and (slave_address is None or w.slave_address == slave_address)
+                   and w.slave_address not in exclude]
+            for w in due:
+                del self._pending[(w.slave_address, w.address)]
+        return due
+
+    @staticmethod
+    def _build_blocks(writes):
+        """按从站把连续地址合并为写块，高优先级的写块排在前面"""
+        writes = sorted(writes, key=lambda w: (w.slave_address, w.address))
+        blocks = []
+        for w in writes:
+            if blocks:
+                block = blocks[-1]
+                last = block[-1]
+                if (last.slave_address == w.slave_address and last.address + 1 == w.address
+                        and len(block) < MAX_WRITE_REGISTERS):
+                    block.append(w)
+                    continue
+            blocks.append([w])
+        blocks.sort(key=lambda block: -max(w.priority for w in block))
+        return blocks
+
+    def process(self, max_transactions=None, slave_address=None, exclude=()):
+        """
+        写出已到期的写入
+        :param max_transactions: 本次最多执行的总线事务数，None 表示不限
+        :param slave_address: 只处理指定从站的写入，None 表示全部
+        :param exclude: 暂不处理的从站地址（如离线从站），其写入留在队列中，不计失败次数
+        :return: 执行的总线事务数
+        """
+        now = time.monotonic()
+        blocks = self._build_blocks(self._take_due(now, slave_address, exclude))
+        transactions = 0
+        for index, block in enumerate(blocks):
+            if max_transactions is not None and transactions >= max_transactions:
+                # 超出本次配额的写块放回队列，下次处理
+                self._requeue([w for b in blocks[index:] for w in b], retry=False)
+                break
+            first = block[0]
+            success = self.rtu.write_holding_registers(SlaveAddress=first.slave_address, Data=[w.value for w in block],
+                                                       DataAddress=first.address, DataCount=len(block))
+            transactions += 1
+            if not success:
+                self.failures += 1
+                self._requeue(block, retry=True)
+        self.transactions += transactions
+        return transactions
+
+    def _requeue(self, writes, retry):
+        """把未写出的写入放回队列；期间已提交了更新值的寄存器以新值为准"""
+        now = time.monotonic()
+        dropped = []
+        with self._lock:
+            for w in writes:
+                key = (w.slave_address, w.address)
+                if key in self._pending:
+                    continue
+                if retry:
+                    w.attempts += 1
+                    if w.attempts >= self.max_attempts:
+                        self.dropped += 1
+                        print(f"写入失败，已放弃：从站 {w.slave_address} 寄存器 {w.address}")
+                        dropped.append(w)
+                        continue
+                    print(f"写入失败，尝试 {w.attempts}/{self.max_attempts}")
+                    w.next_attempt = now + min(self.backoff * (2 ** (w.attempts - 1)), self.max_backoff)
+                self._pending[key] = w
+        if self.on_drop is not None:
+            for w in dropped:
+                self.on_drop(w.slave_address, w.address)
@@ -0,0 +1,240 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from ucvl.zero3.metrics import REGISTRY
+
+class ScheduledJob:
+    """
+    调度器中的一个周期任务，同时记录运行统计。
+    """
+
+    def __init__(self, name, func, interval, args=(), kwargs=None, jitter=0.0):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.jitter = jitter
+        self.cancelled = False
+
+        self.base_time = 0.0  # 不含抖动的计划时间，周期在此基础上累加，避免漂移
+        self.next_run = 0.0   # 实际执行时间 = base_time + 随机抖动
+
+        # 运行统计
+        self.runs = 0
+        self.errors = 0
+        self.overruns = 0        # 单次执行耗时超过周期的次数
+        self.skipped = 0         # 因落后而跳过的周期数
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+
+        labels = {"job": name}
+        REGISTRY.counter("zero3_job_runs_total", "周期任务执行次数", labels, func=lambda: self.runs)
+        REGISTRY.counter("zero3_job_overruns_total", "周期任务耗时超过周期的次数", labels, func=lambda: self.overruns)
+        REGISTRY.counter("zero3_job_skipped_total", "周期任务因落后跳过的周期数", labels, func=lambda: self.skipped)
+        REGISTRY.counter("zero3_job_errors_total", "周期任务执行出错次数", labels, func=lambda: self.errors)
+        REGISTRY.gauge("zero3_job_last_duration_seconds", "周期任务最近一次耗时（秒）", labels, func=lambda: self.last_duration)
+
+    def schedule(self, base_time):
+        """按计划时间设置下一次执行时间（叠加抖动）"""
+        self.base_time = base_time
+        self.next_run = base_time + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def record_run(self, duration, failed=False):
+        """记录一次执行的耗时与结果"""
+        self.runs += 1
+        if failed:
+            self.errors += 1
+        self.last_duration = duration
+        self.total_duration += duration
+        if duration > self.max_duration:
+            self.max_duration = duration
+        if duration > self.interval:
+            self.overruns += 1
+
+    def next_base_time(self, now):
+        """
+        计算下一次计划时间；执行落后于计划时跳过错过的周期，而不是连续补跑
+        """
+        base_time = self.base_time + self.interval
+        if base_time <= now:
+            missed = int((now - base_time) // self.interval) + 1
+            self.skipped += missed
+            base_time += missed * self.interval
+        return base_time
+
+    def stats(self):
+        """
+        获取任务运行统计
+        :return: 统计信息字典
+        """
+        return {
+            'interval': self.interval,
+            'runs': self.runs,
+            'errors': self.errors,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'last_duration': self.last_duration,
+            'max_duration': self.max_duration,
+            'avg_duration': self.total_duration / self.runs if self.runs else 0.0,
+        }
+
+
+class Scheduler:
+    """
+    单线程周期任务调度器，用最小堆按下一次执行时间排序。
+    所有周期任务（自动保存、MQTT 发布、RTU 轮询）共用一个线程，不再为每个周期创建 Timer 线程。
+    任务应尽量短小，单个任务执行期间其他任务会顺延。
+    """
+
+    def __init__(self, name="scheduler"):
+        self.name = name
+        self._heap = []
+        self._jobs = {}
+        self._seq = itertools.count()  # 计划时间相同时保持先进先出
+        self._cond = threading.Condition()
+        self._triggered = []  # 被 trigger_job 要求立即执行的任务
+        self._thread = None
+        self._running = False
+
+    def add_job(self, func, interval, args=(), kwargs=None, name=None, jitter=0.0, delay=None, blocking=False):
+        """
+        添加周期任务
+        :param func: 要执行的函数
+        :param interval: 执行周期（秒）
+        :param name: 任务名称，需唯一，默认使用函数名
+        :param jitter: 每次执行叠加的随机延迟上限（秒），用于错开同周期任务
+        :param delay: 首次执行前的延迟（秒），默认为一个周期
+        :param blocking: 任务是否有阻塞 I/O。与 AsyncGatewayRuntime 的接口一致，这里的任务本就在调度线程中执行，忽略该参数
+        :return: ScheduledJob
+        """
+        if interval <= 0:
+            raise ValueError(f"任务周期必须大于 0: {interval}")
+        name = name or getattr(func, "__name__", repr(func))
+        job = ScheduledJob(name, func, interval, args, kwargs, jitter)
+        with self._cond:
+            if name in self._jobs:
+                raise ValueError(f"任务 {name} 已存在")
+            self._jobs[name] = job
+            job.schedule(time.monotonic() + (interval if delay is None else delay))
+            heapq.heappush(self._heap, (job.next_run, next(self._seq), job))
+            self._cond.notify()
+        return job
+
+    def remove_job(self, name):
+        """
+        移除任务
+        :return: 是否找到并移除了任务
+        """
+        with self._cond:
+            job = self._jobs.pop(name, None)
+            if job is None:
+                return False
+            job.cancelled = True  # 堆中的条目在弹出时丢弃
+            return True
+
+    def get_job(self, name):
+        """根据名称获取任务，不存在时返回 None"""
+        return self._jobs.get(name)
+
+    def trigger_job(self, name):
+        """
+        让任务尽快额外执行一次，不影响原有周期，用于变化事件驱动的任务（如写入给定开度）
+        :return: 是否找到任务
+        """
+        with self._cond:
+            job = self._jobs.get(name)
+            if job is None:
+                return False
+            if job not in self._triggered:
+                self._triggered.append(job)
+            self._cond.notify()
+            return True
+
+    def job_stats(self):
+        """
+        获取所有任务的运行统计
+        :return: {任务名称: 统计信息字典}
+        """
+        with self._cond:
+            return {name: job.stats() for name, job in self._jobs.items()}
+
+    def start(self):
+        """启动调度线程（已启动时不重复启动）"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name=self.name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self, wait=True):
+        """
+        停止调度线程，保留已添加的任务，可再次 start
+        :param wait: 是否等待正在执行的任务结束
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+            thread = self._thread
+            self._thread = None
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def shutdown(self, wait=True):
+        """停止调度线程并清除全部任务"""
+        self.stop(wait)
+        with self._cond:
+            for job in self._jobs.values():
+                job.cancelled = True
+            self._jobs.clear()
+            self._heap.clear()
+            self._triggered.clear()
+
+    def _run(self):
+        while True:
+            triggered = False
+            with self._cond:
+                while self._running:
+                    if self._triggered:
+                        triggered = True
+                        break
+                    if self._heap and self._heap[0][2].cancelled:
+                        heapq.heappop(self._heap)
+                        continue
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                if not self._running:
+                    return
+                if triggered:
+                    job = self._triggered.pop(0)
+                else:
+                    _, _, job = heapq.heappop(self._heap)
+
+            if job.cancelled:
+                continue
+            self._execute(job)
+            if triggered:
+                continue  # 额外执行不改变周期，堆中的计划保持不变
+
+            with self._cond:
+                if job.cancelled:
+                    continue
+                job.schedule(job.next_base_time(time.monotonic()))
+                heapq.heappush(self._heap, (job.next_run, next(self._seq), job))
+
+    def _execute(self, job):
+        start = time.monotonic()
+        failed = False
+        try:
+            job.func(*job.args, **job.kwargs)
+        except Exception as e:
+            failed = True
+            print(f"任务 {job.name} 执行错误：{e}")
+        job.record_run(time.monotonic() - start, failed)
@@ -0,0 +1,206 @@
+import operator
+import struct
+
+# 数据类型 -> (struct 格式码, 占用寄存器数)
+DATA_TYPES = {
+    "int16": ('h', 1),
+    "uint16": ('H', 1),
+    "int32": ('i', 2),
+    "uint32": ('I', 2),
+    "float32": ('f', 2),
+}
+
+# 整数类型的取值范围，写入时按范围截断
+_INT_RANGES = {
+    'h': (-2 ** 15, 2 ** 15 - 1),
+    'H': (0, 2 ** 16 - 1),
+    'i': (-2 ** 31, 2 ** 31 - 1),
+    'I': (0, 2 ** 32 - 1),
+}
+
+
+class TagConversion:
+    """
+    一个标签的寄存器与工程值转换规则，来自 DeviceTypes.json 中标签的 "Modbus" 字段：
+    {"Address": 0, "DataType": "int32", "Scale": 0.01, "Offset": 0, "ByteOrder": "big", "WordOrder": "little",
+     "Min": 0, "Max": 100, "Deadband": 0.1, "Access": "R"}
+    除 Address 外都可省略，默认 uint16、Scale 1、Offset 0、大端字节序与字序、不限幅、无死区。
+    工程值 = 原始值 × Scale + Offset，Min/Max 对读写两个方向的工程值都生效。
+    """
+
+    def __init__(self, tag_id, address, data_type="uint16", scale=1, offset=0, byte_order="big", word_order="big",
+                 minimum=None, maximum=None, deadband=0):
+        if data_type not in DATA_TYPES:
+            raise ValueError(f"标签 {tag_id} 不支持的数据类型: {data_type}，可选: {list(DATA_TYPES)}")
+        if byte_order not in ("big", "little") or word_order not in ("big", "little"):
+            raise ValueError(f"标签 {tag_id} 的字节序/字序只能是 big 或 little")
+        self.tag_id = tag_id
+        self.address = address
+        self.data_type = data_type
+        self.scale = scale
+        self.offset = offset
+        self.byte_order = byte_order
+        self.word_order = word_order
+        self.minimum = minimum
+        self.maximum = maximum
+        self.deadband = deadband
+
+        self.code, self.register_count = DATA_TYPES[data_type]
+        # 按寄存器原样（大端）排列的缓冲记为 AB CD。按字节序/字序解释 32 位值时：
+        # ABCD、DCBA 直接在原始缓冲上分别按大端/小端解包；BADC、CDAB 在每个寄存器字节互换的缓冲上解包。
+        # 16 位值没有字序，按字节序解释即可。
+        if self.register_count == 1:
+            word_order = byte_order
+        self.swapped = byte_order != word_order
+        self.endian = '>' if word_order == "big" else '<'
+        self._struct = struct.Struct(self.endian + self.code)
+        self._register_struct = struct.Struct(('<' if self.swapped else '>') + 'H' * self.register_count)
+
+    @classmethod
+    def from_spec(cls, tag_id, spec):
+        """
+        根据 "Modbus" 字段创建
+        :param spec: {"Address": ..., "DataType": ..., "Scale": ..., ...}
+        """
+        return cls(tag_id, spec["Address"], spec.get("DataType", "uint16"), spec.get("Scale", 1), spec.get("Offset", 0),
+                   spec.get("ByteOrder", "big"), spec.get("WordOrder", "big"),
+                   spec.get("Min"), spec.get("Max"), spec.get("Deadband", 0))
+
+    def clamp(self, value):
+        """按 Min/Max 限幅工程值"""
+        if self.minimum is not None and value < self.minimum:
+            return self.minimum
+        if self.maximum is not None and value > self.maximum:
+            return self.maximum
+        return value
+
+    def to_engineering(self, raw):
+        """原始值转换为工程值"""
+        if self.scale != 1 or self.offset:
+            raw = raw * self.scale + self.offset
+        return self.clamp(raw)
+
+    def decode(self, registers, index=0):
+        """
+        从寄存器列表中解码单个标签的工程值
+        :param index: 标签第一个寄存器在列表中的位置
+        """
+        raw = self._register_struct.pack(*registers[index:index + self.register_count])
+        return self.to_engineering(self._struct.unpack(raw)[0])
+
+    def encode(self, value):
+        """
+        工程值转换为要写入的寄存器列表
+        :return: [寄存器值]
+        """
+        raw = (self.clamp(value) - self.offset) / self.scale
+        if self.code != 'f':
+            low, high = _INT_RANGES[self.code]
+            raw = min(max(int(round(raw)), low), high)
+        return list(self._register_struct.unpack(self._struct.pack(raw)))
+
+
+class BlockDecoder:
+    """
+    一个读块的批量解码器。
+    块内同一种字节排列的标签编译成一个 struct 格式（未用到的寄存器用填充字节跳过），
+    每次读回后整块打包一次、unpack_from 一次得到全部原始值；只含大端 uint16 的分组直接用 itemgetter 取寄存器。
+    比例、偏移按分组预先展开成列表，在一次列表推导中换算。
+    """
+
+    def __init__(self, start, count, tags):
+        """
+        :param start: 读块起始地址
+        :param count: 寄存器数量
+        :param tags: [(标签 ID, 块内偏移, TagConversion)]
+        """
+        self.start = start
+        self.count = count
+        self.tags = tags
+        self._raw_big = struct.Struct(f'>{count}H')
+        self._raw_swapped = struct.Struct(f'<{count}H')
+        self.groups = self._compile(tags)
+
+    @staticmethod
+    def _compile(tags):
+        """
+        按 (是否字节互换, 端序) 分组；同组中地址重叠的标签放到新的分组里
+        :return: [(取值方式, 取值对象, [TagConversion], 换算参数, 是否限幅)]
+                 取值方式为 "registers"（itemgetter 直接取寄存器）、"big" 或 "swapped"（struct 解包对应缓冲）；
+                 换算参数为 None（不换算）、统一比例（数值）或 ([比例], [偏移])
+        """
+        pending = {}
+        for tag_id, offset, conversion in sorted(tags, key=lambda tag: tag[1]):
+            formats = pending.setdefault((conversion.swapped, conversion.endian), [])
+            # 找一个末尾不与该标签重叠的分组
+            target = next((f for f in formats if f[0] <= offset), None)
+            if target is None:
+                target = [0, [], [], []]
+                formats.append(target)
+            end, parts, offsets, conversions = target
+            if offset > end:
+                parts.append(f'{(offset - end) * 2}x')
+            parts.append(conversion.code)
+            offsets.append(offset)
+            conversions.append(conversion)
+            target[0] = offset + conversion.register_count
+
+        groups = []
+        for (swapped, endian), formats in pending.items():
+            for _, parts, offsets, conversions in formats:
+                if not swapped and endian == '>' and all(c.code == 'H' for c in conversions):
+                    source, reader = "registers", operator.itemgetter(*offsets)
+                else:
+                    source, reader = ("swapped" if swapped else "big"), struct.Struct(endian + ''.join(parts))
+                scales = [c.scale for c in conversions]
+                offsets = [c.offset for c in conversions]
+                if any(offsets):
+                    scaling = (scales, offsets)
+                elif len(set(scales)) == 1:
+                    scaling = None if scales[0] == 1 else scales[0]  # 最常见：同一块内比例相同
+                else:
+                    scaling = (scales, None)
+                clamped = any(c.minimum is not None or c.maximum is not None for c in conversions)
+                groups.append((source, reader, conversions, scaling, clamped))
+        return groups
+
+    def decode_groups(self, registers):
+        """
+        按分组解码一整个读块，避免为每个标签构造元组
+        :param registers: 读回的寄存器列表
+        :return: 生成 ([TagConversion], [工程值])
+        """
+        big = swapped = None
+        for source, reader, conversions, scaling, clamped in self.groups:
+            if source == "registers":
+                values = reader(registers)
+                if len(conversions) == 1:
+                    values = (values,)
+            elif source == "big":
+                if big is None:
+                    big = self._raw_big.pack(*registers[:self.count])
+                values = reader.unpack_from(big)
+            else:
+                if swapped is None:
+                    swapped = self._raw_swapped.pack(*registers[:self.count])
+                values = reader.unpack_from(swapped)
+            if scaling is not None:
+                if not isinstance(scaling, tuple):
+                    values = [value * scaling for value in values]
+                elif scaling[1] is None:
+                    values = [value * scale for value, scale in zip(values, scaling[0])]
+                else:
+                    values = [value * scale + offset for value, scale, offset in zip(values, *scaling)]
+            if clamped:
+                values = [conversion.clamp(value) for conversion, value in zip(conversions, values)]
+            yield conversions, values
+
+    def decode(self, registers):
+        """
+        解码一整个读块
+        :return: [(TagConversion, 工程值)]
+        """
+        result = []
+        for conversions, values in self.decode_groups(registers):
+            result.extend(zip(conversions, values))
+        return result
@@ -0,0 +1,129 @@
+import threading
+
+class TagStore:
+    """
+    设备实例与标签的共享内存索引。
+    以设备 ID 和 (设备 ID, 标签 ID) 为键预先建立索引，MQTT 消息处理、RTU 轮询与持久化
+    都通过它查找设备和标签，查找耗时不再随设备数 × 标签数线性增长。
+    """
+
+    def __init__(self, instances=None):
+        self._lock = threading.Lock()
+        self._devices = {}          # 设备 ID -> 设备实例
+        self._devices_by_type = {}  # 设备类型 ID -> [设备实例]
+        self._tags = {}             # (设备 ID, 标签 ID) -> 设备实例
+        self._subscriptions = []    # [(回调, 标签 ID, 设备类型 ID)]，对之后添加的设备同样生效
+        for instance in instances or []:
+            self.add_device(instance)
+
+    def add_device(self, instance):
+        """
+        注册设备实例并建立索引，同一 ID 重复注册时替换旧实例
+        :param instance: DeviceTypeFactory 生成的设备实例
+        """
+        with self._lock:
+            old = self._devices.get(instance.ID)
+            if old is not None:
+                self._remove_locked(old)
+            self._devices[instance.ID] = instance
+            self._devices_by_type.setdefault(instance.DevTypeID, []).append(instance)
+            for tag_id in instance.TagIDs:
+                self._tags[(instance.ID, tag_id)] = instance
+            for callback, tag_ids, device_type_id in self._subscriptions:
+                self._subscribe_instance(instance, callback, tag_ids, device_type_id)
+
+    def remove_device(self, device_id):
+        """
+        移除设备实例及其标签索引
+        :param device_id: 设备 ID
+        """
+        with self._lock:
+            instance = self._devices.get(device_id)
+            if instance is not None:
+                self._remove_locked(instance)
+
+    def _remove_locked(self, instance):
+        del self._devices[instance.ID]
+        self._devices_by_type[instance.DevTypeID].remove(instance)
+        for tag_id in instance.TagIDs:
+            self._tags.pop((instance.ID, tag_id), None)
+
+    @staticmethod
+    def _subscribe_instance(instance, callback, tag_ids, device_type_id):
+        if device_type_id is not None and instance.DevTypeID != device_type_id:
+            return
+        if tag_ids is not None:
+            tag_ids = [tag_id for tag_id in tag_ids if tag_id in instance.TagIndex]
+            if not tag_ids:
+                return
+        instance.subscribe(callback, tag_ids)
+
+    def subscribe(self, callback, tag_ids=None, device_type_id=None):
+        """
+        订阅全部设备（包括之后添加的设备）的标签变化
+        :param callback: 回调函数，参数为 (设备实例, 标签 ID, 旧值, 新值)
+        :param tag_ids: 只关注的标签 ID，None 表示全部标签
+        :param device_type_id: 只关注的设备类型，None 表示全部类型
+        """
+        with self._lock:
+            self._subscriptions.append((callback, tag_ids, device_type_id))
+            for instance in self._devices.values():
+                self._subscribe_instance(instance, callback, tag_ids, device_type_id)
+
+    def unsubscribe(self, callback):
+        """取消通过 subscribe 注册的回调"""
+        with self._lock:
+            self._subscriptions = [s for s in self._subscriptions if s[0] != callback]
+            for instance in self._devices.values():
+                instance.unsubscribe(callback)
+
+    def get_device(self, device_id):
+        """
+        根据设备 ID 获取设备实例
+        :return: 设备实例，不存在时返回 None
+        """
+        return self._devices.get(device_id)
+
+    def get_devices_by_type(self, device_type_id):
+        """
+        获取指定设备类型的全部设备实例
+        :return: 设备实例列表（副本）
+        """
+        return list(self._devices_by_type.get(device_type_id, ()))
+
+    def device_type_ids(self):
+        """获取当前已注册的设备类型 ID 列表"""
+        return [type_id for type_id, devices in self._devices_by_type.items() if devices]
+
+    def get_tag(self, device_id, tag_id):
+        """
+        根据 (设备 ID, 标签 ID) 获取标签视图
+        :return: TagRecord，不存在时返回 None
+        """
+        instance = self._tags.get((device_id, tag_id))
+        if instance is None:
+            return None
+        return instance.Tags[tag_id]
+
+    def get_value(self, device_id, tag_id):
+        """
+        获取标签实时值
+        :raises KeyError: 设备或标签不存在
+        """
+        return self._tags[(device_id, tag_id)].get_tag_value(tag_id)
+
+    def set_value(self, device_id, tag_id, value):
+        """
+        设置标签实时值
+        :raises KeyError: 设备或标签不存在
+        """
+        self._tags[(device_id, tag_id)].set_tag_value(tag_id, value)
+
+    def __iter__(self):
+        return iter(list(self._devices.values()))
+
+    def __len__(self):
+        return len(self._devices)
+
+    def __contains__(self, device_id):
+        return device_id in self._devices